@@ -0,0 +1,135 @@
+# mtrpc/asyncio_client.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""MegiTeam-RPC (MTRPC) framework -- the client part: asyncio RPC-proxy.
+
+It requires the `trollius' library (asyncio for Python 2.x).
+
+A simple example:
+
+    import trollius as asyncio
+    from trollius import From
+
+    from mtrpc.asyncio_client import AsyncMTRPCProxy
+
+    @asyncio.coroutine
+    def main(loop):
+        rpc = yield From(AsyncMTRPCProxy.connect(
+                req_exchange='request_amqp_exchange',
+                req_rk_pattern='request_amqp_routing_key',
+                host="localhost:5672",
+                userid="guest",
+                password="guest",
+                loop=loop,
+        ))
+        with rpc:
+            add_results = yield From(asyncio.gather(
+                    *[rpc.my_module.add(i, i) for i in range(100)],
+                    loop=loop))
+            try:
+                yield From(rpc.my_module.my_submodule.div(10, 0))
+            except ZeroDivisionError as exc:
+                print 'ZeroDivisionError --', exc
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(loop))
+
+AsyncMTRPCProxy takes the same arguments as MTRPCProxy (see:
+MTRPCProxy.__init__() documentation) plus optional `loop'; RPC-method
+calls return asyncio futures instead of the actual results.
+
+All concurrent calls share one AMQP connection and channel: requests
+are published from the event loop thread, responses are received by
+the proxy's only response consumer thread (see: mtrpc.client module
+documentation) and passed to the event loop in a thread-safe way.
+
+"""
+
+
+
+import functools
+
+import trollius as asyncio
+from trollius import From, Return
+
+from .client import MTRPCProxy, _RPCModuleMethodProxy
+
+
+
+#
+# Auxiliary types and functions
+#
+
+class _AsyncRPCModuleMethodProxy(_RPCModuleMethodProxy):
+
+    """Auxiliary automagic-callable-co-proxy class (returning asyncio futures)"""
+
+    def __call__(self, *args, **kwargs):
+        return self._rpc_proxy._call_aio(self._full_name, args, kwargs,
+                                         timeout=self._timeout)
+
+
+def _transfer_result(aio_future, rpc_future):
+    # (to be called in the event loop thread)
+    if aio_future.cancelled():
+        return
+    exc = rpc_future.exception(0)
+    if exc is None:
+        aio_future.set_result(rpc_future.result(0))
+    else:
+        aio_future.set_exception(exc)
+
+
+
+#
+# The asyncio RPC-proxy class
+#
+
+class AsyncMTRPCProxy(MTRPCProxy):
+
+    """The asyncio MTRPC proxy class.
+
+    Get RPC-modules as they were AsyncMTRPCProxy instance attributes;
+    call RPC-methods as their member functions -- to get asyncio futures.
+
+    """
+
+    _method_proxy_class = _AsyncRPCModuleMethodProxy
+
+    def __init__(self, *args, **kwargs):
+        """RPC-proxy initialization (see: MTRPCProxy.__init__())
+
+        Additional keyword argument:
+
+        * loop -- asyncio event loop (default: None => the current one).
+
+        Note that connecting to the broker blocks -- use the connect()
+        coroutine to create the proxy from within a running event loop.
+
+        """
+
+        self._loop = kwargs.pop('loop', None) or asyncio.get_event_loop()
+        super(AsyncMTRPCProxy, self).__init__(*args, **kwargs)
+
+    @classmethod
+    @asyncio.coroutine
+    def connect(cls, *args, **kwargs):
+        "Create the proxy (in an executor thread); coroutine"
+        loop = kwargs.get('loop') or asyncio.get_event_loop()
+        kwargs['loop'] = loop
+        rpc_proxy = yield From(loop.run_in_executor(
+                None, functools.partial(cls, *args, **kwargs)))
+        raise Return(rpc_proxy)
+
+    def _call_aio(self, full_name, call_args, call_kwargs, exchange=None, custom_exceptions=None,
+                  timeout=None):
+
+        "Remotely call a procedure (RPC-method); return an asyncio future"
+
+        aio_future = asyncio.Future(loop=self._loop)
+        rpc_future = self._call_async(full_name, call_args, call_kwargs,
+                                      exchange, custom_exceptions, timeout)
+        rpc_future.add_done_callback(functools.partial(
+                self._loop.call_soon_threadsafe, _transfer_result, aio_future))
+        return aio_future
@@ -37,6 +37,84 @@ To run the above example, first start an AMQP broker and MTRPC server
 -- see the example in mtrpc.server module documentation [module docstring
 in mtrpc/server/__init__.py].
 
+Asynchronous (non-blocking) calls are also possible -- they return
+RPCFuture instances instead of the actual results:
+
+    from mtrpc.client import MTRPCProxy, wait_all, as_completed
+
+    with MTRPCProxy(...) as rpc:
+
+        futures = [rpc.my_module.add.async_(i, i) for i in range(100)]
+        for future in as_completed(futures):
+            print future.result()   # (re-raises RPC-errors, if any)
+
+Responses to asynchronous calls are consumed by a background thread,
+started on the first asynchronous call (since then synchronous calls of
+the same proxy also make use of it).
+
+Many calls can also be sent together, as one message (a batch) -- see
+MTRPCProxy._batch() documentation -- also automatically: calls made
+(by any threads) within a short time window are combined into batches
+if the `auto_batch_window' MTRPCProxy constructor argument is given.
+
+Calls can be limited in time -- by the `timeout' MTRPCProxy constructor
+argument (the default for all calls of the proxy) or per call:
+
+    try:
+        result = rpc.my_module.slow_method.timeout_(2.5)(1, 2)
+    except RPCClientTimeoutError:   # (from mtrpc.common.errors)
+        result = None
+
+If a response is not received in time, RPCClientTimeoutError is raised
+(by a synchronous call, or by result() of the RPCFuture instance); the
+response, if it arrives later, is discarded.
+
+RPC-methods returning iterators (e.g. generators) send their results in
+chunks (messages of up to RPCManager.stream_chunk_size items) -- calls of
+them return RPCResultStream instances: iterators yielding items as soon
+as their chunks arrive:
+
+    for row in rpc.my_module.export_rows('2010-01'):
+        print row
+
+Results whose serialized form is large are spilled by the server (if
+it is configured so) -- into temporary files, not sent in responses;
+synchronous calls fetch them in chunks automatically, asynchronous ones
+return RPCSpilledResult instances (see their documentation).
+
+Asynchronous calls can be cancelled -- then the server drops the request
+(if it has not been started yet) or lets the running RPC-method know:
+
+    future = rpc.my_module.slow_method.async_(1, 2)
+    ...
+    rpc._cancel(future)
+
+(Synchronous calls whose timeouts expire are cancelled automatically if
+the `cancel_on_timeout' MTRPCProxy constructor argument is true.)
+
+Note: a cancellation is published like a new request -- with the routing
+key of the call -- so it is delivered to the server executing the call
+only if that server is the only consumer of the call's request queue.
+If several server instances share the queue, it may reach another
+instance, where it has no effect (the call is not cancelled then; the
+future is completed with RPCClientCancelledError anyway).
+
+Methods whose results are not needed (e.g. logging or auditing ones)
+can be called as notifications -- the request is just published (with
+no reply-to queue), the server sends nothing back (its errors, if any,
+are recorded only on the server side):
+
+    rpc.my_module.log_event.notify_('user logged in')
+
+Calls of long-running RPC-methods declared (on the server side) as jobs
+return job ids at once; the job result can be awaited with _wait_job():
+
+    job_id = rpc.my_module.build_report(2010)
+    report = rpc._wait_job(job_id, timeout=600)
+
+Multi-threaded applications can share ready-to-use proxies -- see the
+MTRPCProxyPool class documentation.
+
 For more information about MTRPCProxy constructor arguments
 -- see MTRPCProxy.__init__() documentation.
 
@@ -45,18 +123,24 @@ For more information about MTRPCProxy constructor arguments
 
 
 import __builtin__
+import collections
+import heapq
 import itertools
 import logging
+import os
+import Queue
+import socket
+import sys
 import threading
+import time
 import traceback
 
-from collections import namedtuple
-
-from amqplib import client_0_8 as amqp
+from collections import namedtuple, OrderedDict
 
 from .common import utils
 from .common import errors
 from .common import encoding
+from .common import transport
 from .common.const import *
 
 
@@ -65,33 +149,484 @@ from .common.const import *
 # Auxiliary types
 #
 
-Response = namedtuple('Response', 'result error id')
+Response = namedtuple('Response', 'result error id chunk more spilled')
+# (chunk, more: streamed results only; spilled: large results only)
+Response.__new__.__defaults__ = (None, None, None)
+
+
+class RPCFuture(object):
+
+    """The (pending) result of an asynchronous RPC-method call.
+
+    Instances are created by MTRPCProxy._call_async() -- not to be
+    instantiated directly.
+
+    """
+
+    def __init__(self, call_id, full_name, custom_exceptions, log, timeout=None):
+        self.call_id = call_id
+        self.full_name = full_name
+        self.timeout = timeout
+        self.deadline = None if timeout is None else time.time() + timeout
+        self._custom_exceptions = custom_exceptions
+        self._log = log
+        self._condition = threading.Condition()
+        self._done = False
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def __repr__(self):
+        return '<{0} {1} ({2}) {3}>'.format(
+                self.__class__.__name__, self.full_name, self.call_id,
+                'done' if self._done else 'pending')
+
+    def done(self):
+        "Is the call completed (successfully or not)?"
+        return self._done
+
+    def result(self, timeout=None):
+        "Wait for the call completion; return the result or raise the error"
+        if not self._wait(timeout):
+            raise errors.RPCClientTimeoutError('Result of {0} not received '
+                                               'within {1}s'.format(self.full_name,
+                                                                    timeout))
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        "Wait for the call completion; return the error (or None)"
+        if not self._wait(timeout):
+            raise errors.RPCClientTimeoutError('Result of {0} not received '
+                                               'within {1}s'.format(self.full_name,
+                                                                    timeout))
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, callback):
+        """Call callback(future) on the call completion
+
+        (If the call is already completed -- call it immediately).
+
+        """
+
+        with self._condition:
+            if not self._done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _wait(self, timeout):
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self._condition:
+            while not self._done:
+                if timeout is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            return self._done
+
+    def _set_result(self, result):
+        self._complete(result, None)
+
+    def _set_exc_info(self, exc_info):
+        self._complete(None, exc_info)
+
+    def _complete(self, result, exc_info):
+        with self._condition:
+            if self._done:
+                return
+            self._result = result
+            self._exc_info = exc_info
+            self._done = True
+            callbacks, self._callbacks = self._callbacks, []
+            self._condition.notify_all()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                self._log.exception('Error in done-callback %r of %r:',
+                                    callback, self)
+
+
+class RPCResultStream(object):
+
+    """Iterator over items of a streamed (chunked) RPC-method result.
+
+    It is the result of a call of an RPC-method whose result is streamed
+    by the server (e.g. a generator-returning one); items are available
+    as soon as their chunks arrive. Errors (e.g. raised by the RPC-method
+    in the middle of its result) are raised by next(); if the call
+    timeout is set, it applies to each chunk.
+
+    """
+
+    def __init__(self, full_name, call_id, custom_exceptions, timeout=None):
+        self.full_name = full_name
+        self.call_id = call_id
+        self.timeout = timeout
+        self._custom_exceptions = custom_exceptions
+        self._chunks = Queue.Queue()  # (items, exc_info, more) tuples
+        self._next_chunk = 0  # (expected number of the next chunk)
+        self._items = iter(())
+        self._exc_info = None
+        self._finished = False
+
+    def __repr__(self):
+        return '<{0} {1} ({2})>'.format(self.__class__.__name__,
+                                        self.full_name, self.call_id)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            for item in self._items:
+                return item
+            if self._exc_info is not None:
+                exc_info, self._exc_info = self._exc_info, None
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if self._finished:
+                raise StopIteration
+            try:
+                items, self._exc_info, more = self._chunks.get(timeout=self.timeout)
+            except Queue.Empty:
+                self._finished = True
+                raise errors.RPCClientTimeoutError('Chunk of {0} result not received '
+                                                   'within {1}s'.format(self.full_name,
+                                                                        self.timeout))
+            self._items = iter(items or ())
+            self._finished = not more
+
+    def _put_chunk(self, items, exc_info, more):
+        self._next_chunk += 1
+        self._chunks.put((items, exc_info, more))
+
+
+class RPCSpilledResult(object):
+
+    """A large RPC-method result, spilled by the server (to be fetched).
+
+    The server sends it instead of a result whose serialized form is too
+    large (see: the mtrpc.server.spill module). Synchronous calls fetch
+    the actual result automatically (unless the `fetch_spilled' MTRPCProxy
+    constructor argument is false); asynchronous calls return instances
+    of this class as future results.
+
+    The JSON text of the result is fetched in chunks -- with read_chunk()
+    (in any order) or iter_chunks() (in order, the next chunks requested
+    in advance); load() fetches the whole result and deserializes it.
+    The chunks are requested with the routing key of the call -- and with
+    the `exchange' attribute (None => the proxy's default) that should be
+    set if the call has been sent with another exchange.
+
+    """
+
+    def __init__(self, rpc_proxy, full_name, timeout, handle, size, chunk_size, chunks):
+        self.full_name = full_name
+        self.timeout = timeout
+        self.handle = handle
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunks = chunks
+        self.exchange = None
+        self._rpc_proxy = rpc_proxy
+
+    def __repr__(self):
+        return '<{0} {1} ({2}, {3} bytes)>'.format(self.__class__.__name__,
+                                                   self.full_name, self.handle,
+                                                   self.size)
+
+    def read_chunk(self, chunk):
+        "Fetch a chunk (a part of the JSON text of the result)"
+        return self._rpc_proxy._spill_read(self, chunk).result()
+
+    def iter_chunks(self, prefetch=2):
+        "Fetch the chunks in order (up to `prefetch' of them requested at a time)"
+        prefetch = max(prefetch, 1)
+        futures = collections.deque()
+        next_chunk = 0
+        while futures or next_chunk < self.chunks:
+            while next_chunk < self.chunks and len(futures) < prefetch:
+                futures.append(self._rpc_proxy._spill_read(self, next_chunk))
+                next_chunk += 1
+            yield futures.popleft().result()
+
+    def load(self, release=True):
+        "Fetch and deserialize the result (then free it on the server)"
+        result_json = ''.join(self.iter_chunks())
+        if release:
+            self.release()
+        return encoding.loads(result_json)
+
+    def release(self):
+        "Free the result on the server (it is evicted after a while anyway)"
+        self._rpc_proxy._spill_release(self)
+
+
+def wait_all(futures, timeout=None):
+
+    """Wait until all given RPCFuture instances are completed.
+
+    Return a pair of lists: (completed futures, not completed futures);
+    the latter is not empty only if the timeout (in seconds) expired.
+
+    """
+
+    futures = list(futures)
+    if timeout is not None:
+        deadline = time.time() + timeout
+    for future in futures:
+        if timeout is None:
+            future._wait(None)
+        elif not future._wait(max(deadline - time.time(), 0)):
+            break
+    done = [future for future in futures if future.done()]
+    not_done = [future for future in futures if not future.done()]
+    return done, not_done
+
+
+def as_completed(futures, timeout=None):
+
+    """Iterate over given RPCFuture instances as they are completed.
+
+    Raise RPCClientTimeoutError if not all of them are completed before
+    the timeout (in seconds) expires.
+
+    """
+
+    futures = list(futures)
+    completed = Queue.Queue()
+    for future in futures:
+        future.add_done_callback(completed.put)
+    if timeout is not None:
+        deadline = time.time() + timeout
+    for count in xrange(len(futures)):
+        try:
+            if timeout is None:
+                yield completed.get()
+            else:
+                yield completed.get(timeout=max(deadline - time.time(), 0))
+        except Queue.Empty:
+            raise errors.RPCClientTimeoutError('{0} (of {1}) results not received '
+                                               'within {2}s'.format(len(futures) - count,
+                                                                    len(futures), timeout))
 
 
 class _RPCModuleMethodProxy(object):
 
     """Auxiliary automagic-callable-co-proxy class"""
 
-    def __init__(self, rpc_proxy, full_name):
+    def __init__(self, rpc_proxy, full_name, timeout=None):
         self._rpc_proxy = rpc_proxy
         self._full_name = full_name
+        self._timeout = timeout
 
     def __getattr__(self, local_name):
         if local_name.startswith('_'):
             raise AttributeError
         else:
-            if not bool(self._rpc_proxy):
-                raise errors.RPCClientError('MTRPCProxy instance is already closed')
             full_name = '{0}.{1}'.format(self._full_name, local_name)
-            return _RPCModuleMethodProxy(self._rpc_proxy, full_name)
+            return self._rpc_proxy._get_co_proxy(full_name, self._timeout)
 
     def __call__(self, *args, **kwargs):
-        return self._rpc_proxy._call(self._full_name, args, kwargs)
+        return self._rpc_proxy._call(self._full_name, args, kwargs,
+                                     timeout=self._timeout)
+
+    def async_(self, *args, **kwargs):
+        return self._rpc_proxy._call_async(self._full_name, args, kwargs,
+                                           timeout=self._timeout)
+
+    def notify_(self, *args, **kwargs):
+        "Call the method as a notification (no result, nothing to wait for)"
+        self._rpc_proxy._notify(self._full_name, args, kwargs)
+
+    def timeout_(self, timeout):
+        "Get the same method/module co-proxy with the call timeout (in seconds)"
+        return self._rpc_proxy._get_co_proxy(self._full_name, timeout)
 
     def __nonzero__(self):
         return bool(self._rpc_proxy)
 
 
+class _ResponseConsumer(threading.Thread):
+
+    """Auxiliary background thread: consumes responses of an RPC-proxy"""
+
+    sel_timeout = 60
+
+    def __init__(self, rpc_proxy):
+        threading.Thread.__init__(self, name='MTRPCProxy-ResponseConsumer')
+        self.daemon = True
+        self._rpc_proxy = rpc_proxy
+        self._stopping = False
+
+    def run(self):
+        rpc_proxy = self._rpc_proxy
+        try:
+            while not self._stopping:
+                sel_timeout = self.sel_timeout
+                next_deadline_in = rpc_proxy._expire_pending()
+                if next_deadline_in is not None:
+                    sel_timeout = min(sel_timeout, next_deadline_in)
+                # (it returns also when woken up -- to stop, or to take
+                # a new, earlier deadline into account)
+                rpc_proxy._transport.wait(sel_timeout)
+        except Exception:
+            rpc_proxy._log.error('Response consumer broken with error:',
+                                 exc_info=True)
+            rpc_proxy._fail_pending('Response consumer broken with error: '
+                                    '{0!r}'.format(sys.exc_info()[1]))
+
+    def wake(self):
+        "Make the thread recompute its wait timeout"
+        self._rpc_proxy._transport.wakeup()
+
+    def stop(self):
+        "Stop the thread; to be called from another thread"
+        self._stopping = True
+        self._rpc_proxy._transport.wakeup()
+        self.join()
+
+
+class _AutoBatcher(threading.Thread):
+
+    """Auxiliary background thread: sends calls made within a window as batches"""
+
+    def __init__(self, rpc_proxy, window, max_size):
+        threading.Thread.__init__(self, name='MTRPCProxy-AutoBatcher')
+        self.daemon = True
+        self._rpc_proxy = rpc_proxy
+        self._window = window
+        self._max_size = max_size
+        self._condition = threading.Condition()
+        self._calls = []  # (exchange, full name, args, kwargs, future) tuples
+        self._stopping = False
+
+    def add(self, exchange, full_name, call_args, call_kwargs, future):
+        with self._condition:
+            if self._stopping:
+                raise errors.RPCClientError('MTRPCProxy instance is already closed')
+            self._calls.append((exchange, full_name, call_args, call_kwargs, future))
+            if len(self._calls) == 1 or len(self._calls) >= self._max_size:
+                self._condition.notify()
+
+    def run(self):
+        condition = self._condition
+        while True:
+            with condition:
+                while not (self._calls or self._stopping):
+                    condition.wait()
+                if self._stopping:
+                    return
+                # (the window starts with the first call)
+                deadline = time.time() + self._window
+                while len(self._calls) < self._max_size and not self._stopping:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    condition.wait(remaining)
+                if self._stopping:
+                    return
+                calls, self._calls = self._calls, []
+            self._flush(calls)
+
+    def _flush(self, calls):
+        rpc_proxy = self._rpc_proxy
+        # only calls with the same exchange and routing key are combined
+        # (so that each request reaches the same server as if sent alone)
+        batches = OrderedDict()
+        for exchange, full_name, call_args, call_kwargs, future in calls:
+            if exchange is None:
+                exchange = rpc_proxy._req_exchange
+            routing_key = (None if exchange is None
+                           else rpc_proxy._prepare_routing_key(full_name, exchange))
+            batches.setdefault((exchange, routing_key), []).append(
+                    (full_name, call_args, call_kwargs, future))
+        max_size = self._max_size
+        for (exchange, routing_key), group in batches.iteritems():
+            for i in xrange(0, len(group), max_size):
+                self._send(group[i:i+max_size], exchange)
+
+    def _send(self, batch_calls, exchange):
+        try:
+            self._rpc_proxy._send_batch(batch_calls, exchange)
+        except Exception:
+            exc_info = sys.exc_info()
+            for _, _, _, future in batch_calls:
+                future._set_exc_info(exc_info)
+
+    def stop(self):
+        "Stop the thread, fail not sent calls; to be called from another thread"
+        with self._condition:
+            self._stopping = True
+            calls, self._calls = self._calls, []
+            self._condition.notify()
+        self.join()
+        exc = errors.RPCClientError('Request not sent -- '
+                                    'MTRPCProxy instance has been closed')
+        for _, _, _, _, future in calls:
+            future._set_exc_info((type(exc), exc, None))
+
+
+class _RPCBatch(object):
+
+    """Auxiliary class: collects calls to be sent together (see: MTRPCProxy._batch())"""
+
+    def __init__(self, rpc_proxy, exchange, custom_exceptions, timeout):
+        self._rpc_proxy = rpc_proxy
+        self._exchange = exchange
+        self._custom_exceptions = custom_exceptions
+        self._timeout = timeout
+        self._calls = []  # (full name, args, kwargs, future) tuples
+
+    def __getattr__(self, submod_name):
+        if submod_name.startswith('_'):
+            raise AttributeError
+        else:
+            return self._get_co_proxy(submod_name, None)
+
+    def _get_co_proxy(self, full_name, timeout):
+        return _RPCModuleMethodProxy(self, full_name, timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        calls, self._calls = self._calls, []
+        if not calls:
+            return
+        if tb is None:
+            self._rpc_proxy._send_batch(calls, self._exchange)
+        else:
+            exc = errors.RPCClientError('Batch not sent -- an exception occurred')
+            for _, _, _, future in calls:
+                future._set_exc_info((type(exc), exc, None))
+
+    def _call(self, full_name, call_args, call_kwargs, exchange=None, custom_exceptions=None,
+              timeout=None):
+        if custom_exceptions is None:
+            custom_exceptions = self._custom_exceptions
+        if timeout is None:
+            timeout = self._timeout
+        future = self._rpc_proxy._new_future(full_name, call_args, call_kwargs,
+                                             custom_exceptions, timeout)
+        self._calls.append((full_name, call_args, call_kwargs, future))
+        return future
+
+    _call_async = _call
+
+    def _notify(self, full_name, call_args, call_kwargs):
+        # (notifications are not batched -- they are sent at once)
+        self._rpc_proxy._notify(full_name, call_args, call_kwargs, self._exchange)
+
+
 
 #
 # The RPC-proxy class
@@ -106,9 +641,28 @@ class MTRPCProxy(object):
 
     """
 
+    _method_proxy_class = _RPCModuleMethodProxy
+
+    # how many ids of timed-out calls are remembered (to recognize their
+    # late responses)
+    max_expired_remembered = 1000
+
+    # how many method/module co-proxies and routing keys are cached
+    max_cached_co_proxies = 1000
+    max_cached_routing_keys = 1000
+
+    # (for {n} field of named reply queues)
+    _proxy_counter = itertools.count(1)
+
+    # durable exchanges already declared by proxies of this process
+    # -- as (host, virtual_host, exchange) tuples (see: _declare_exchange())
+    _declared_exchanges = set()
+
     def __init__(self, req_exchange=None, req_rk_pattern=DEFAULT_REQ_RK_PATTERN,
                  resp_exchange=DEFAULT_RESP_EXCHANGE, custom_exceptions=None,
-                 log=None, loglevel=None, immediate=False, **amqp_params):
+                 log=None, loglevel=None, immediate=False, timeout=None,
+                 reply_queue=None, auto_batch_window=None, auto_batch_max_size=100,
+                 cancel_on_timeout=False, fetch_spilled=True, **amqp_params):
 
         """RPC-proxy initialization.
 
@@ -146,34 +700,108 @@ class MTRPCProxy(object):
 
         * immediate (bool) -- publish request with "immediate" AMQP flag
 
+        * timeout (int/float or None) -- default call timeout in seconds
+          (default: None => wait for responses infinitely); it can be
+          overridden per call (see: the mtrpc.client module documentation);
+
+        * reply_queue (str or None) -- name of AMQP queue to receive
+          RPC-responses:
+
+          * None (default) -- a new server-named exclusive queue (for
+            each opened channel);
+          * mtrpc.common.const.DIRECT_REPLY_TO_QUEUE -- the broker
+            "direct reply-to" pseudo-queue (nothing to declare or bind;
+            needs RabbitMQ);
+          * other -- a named exclusive queue, declared once per connection
+            (not re-declared when the channel is reopened); it may contain
+            {hostname}, {pid} and {n} (number of the proxy within the
+            process) fields to be substituted using .format() method,
+            e.g. 'mtrpc.reply.{hostname}.{pid}.{n}';
+
+        * auto_batch_window (int/float or None) -- if given, calls made
+          (by any threads) within so many seconds since the first of them
+          are sent together, as batch messages (see: _batch()), grouped by
+          the exchange and routing key; each call still gets its own result
+          (default: None => no auto-batching);
+
+        * auto_batch_max_size (int) -- if so many calls have been collected,
+          they are sent before the window elapses (default: 100);
+
+        * cancel_on_timeout (bool) -- if true, synchronous calls whose
+          timeouts expire are cancelled (see: _cancel()) (default: False);
+
+        * fetch_spilled (bool) -- if true, large results spilled by the
+          server are fetched automatically by synchronous calls; if false,
+          RPCSpilledResult instances are returned (default: True);
+
         * amqp_params -- dict of keyword arguments for AMQP.Connection(),
-          see amqplib.client_0_8.Connection.__init__() for details.
+          see amqplib.client_0_8.Connection.__init__() for details -- or,
+          if the `transport' keyword argument is given (a transport name,
+          e.g. 'loopback', or a Transport subclass or its dotted path),
+          for that transport class, see: the mtrpc.common.transport module.
 
         """
 
         self._req_exchange = req_exchange
         self._req_rk_pattern = req_rk_pattern  # may contain {fields} used in
-                                               # _prepare_routing_key()...
+                                               # _format_routing_key()...
         if custom_exceptions is None:
             self._custom_exceptions = {}
         else:
             self._custom_exceptions = custom_exceptions
         self._resp_exchange = resp_exchange
         self._immediate = immediate
+        self._timeout = timeout
+        self._cancel_on_timeout = cancel_on_timeout
+        self._fetch_spilled = fetch_spilled
+        if reply_queue is not None and reply_queue != DIRECT_REPLY_TO_QUEUE:
+            reply_queue = reply_queue.format(hostname=socket.gethostname(),
+                                             pid=os.getpid(),
+                                             n=next(self._proxy_counter))
+        self._reply_queue = reply_queue
 
         self._call_lock = threading.RLock()
-        self._response = None
+        self._call_id_gen = itertools.count(1)
+        self._pending = {}  # maps call ids to RPCFuture instances
+        self._streams = {}  # maps call ids to not finished RPCResultStreams
+        self._deadlines = []  # heap of (deadline, call id) pairs
+        self._deadlines_lock = threading.Lock()
+        self._expired = OrderedDict()  # recently expired call ids
+        # maps (full name, timeout) to co-proxies:
+        self._co_proxies = utils.LRUCache(self.max_cached_co_proxies)
+        # maps (full name, exchange) to routing keys:
+        self._routing_keys = utils.LRUCache(self.max_cached_routing_keys)
+        self._consumer = None  # started on the first asynchronous call
         self._closed = False
 
         self._logging_init(log, loglevel)
         self._amqp_init(amqp_params)
 
+        if auto_batch_window is None:
+            self._auto_batcher = None
+        else:
+            self._auto_batcher = _AutoBatcher(self, auto_batch_window,
+                                              auto_batch_max_size)
+            self._auto_batcher.start()
+
 
     def __getattr__(self, submod_name):
         if submod_name.startswith('_'):
             raise AttributeError
         else:
-            return _RPCModuleMethodProxy(self, submod_name)
+            return self._get_co_proxy(submod_name, None)
+
+
+    def _get_co_proxy(self, full_name, timeout):
+        "Get a method/module co-proxy (cached, if not closed)"
+        if self._closed:
+            raise errors.RPCClientError('MTRPCProxy instance is already closed')
+        key = full_name, timeout
+        co_proxy = self._co_proxies.get(key)
+        if co_proxy is None:
+            co_proxy = self._method_proxy_class(self, full_name, timeout)
+            self._co_proxies[key] = co_proxy
+        return co_proxy
 
 
     def __enter__(self):
@@ -189,8 +817,11 @@ class MTRPCProxy(object):
 
 
     def _is_valid(self):
+        if self._consumer is not None:
+            # (the channel is being read by the consumer thread)
+            return self._consumer.is_alive()
         try:
-            self._amqp_channel.flow(True)
+            self._transport.ping()
             return True
         except Exception as exc:
             self._log.warn('Lost connection to broker: {0} {1!s}'.format(
@@ -200,14 +831,15 @@ class MTRPCProxy(object):
 
     def _close(self):
         "Close the proxy"
+        self._closed = True
+        if self._auto_batcher is not None:
+            self._auto_batcher.stop()
+        self._stop_consumer()
+        self._fail_pending('MTRPCProxy instance has been closed')
         try:
-            try:
-                if self._amqp_channel.connection:
-                    self._amqp_channel.basic_cancel(self._resp_queue)
-            finally:
-                self._amqp_channel.close()
+            self._transport.cancel(self._resp_queue)
         finally:
-            self._amqp_conn.close()
+            self._transport.close()
 
 
     def _logging_init(self, log, loglevel):
@@ -232,33 +864,293 @@ class MTRPCProxy(object):
     def _amqp_init(self, amqp_params):
         "Init AMQP communication"
         self._log.info('Initializing AMQP channel and connection...')
-        self._amqp_conn = amqp.Connection(**amqp_params)
-        self._amqp_channel = self._amqp_conn.channel()
+        self._transport = transport.from_params(amqp_params)
+        self._transport.return_callback = self._message_returned
+        self._transport.connect()
+        self._amqp_declared = set()  # queues declared within the connection
         self._resp_queue = self._bind_and_consume()
 
 
     def _amqp_reopen_channel(self):
-        if self._amqp_channel.channel_id:
-            try:
-                self._amqp_channel.close()
-            except Exception:
-                pass
-        self._amqp_channel = self._amqp_conn.channel()
+        self._stop_consumer()
+        self._fail_pending('AMQP channel has been reopened')
+        self._expired.clear()  # (responses to the old queue will not come)
+        self._transport.reopen()
         self._resp_queue = self._bind_and_consume()
 
-    def _call(self, full_name, call_args, call_kwargs, exchange=None, custom_exceptions=None):
+    def _call(self, full_name, call_args, call_kwargs, exchange=None, custom_exceptions=None,
+              timeout=None):
+        result = self._call_and_wait(full_name, call_args, call_kwargs, exchange,
+                                     custom_exceptions, timeout)
+        if isinstance(result, RPCSpilledResult) and self._fetch_spilled:
+            result.exchange = exchange
+            return result.load()
+        return result
+
+    def _call_and_wait(self, full_name, call_args, call_kwargs, exchange, custom_exceptions,
+                       timeout):
+        if self._auto_batcher is None:
+            with self._call_lock:
+                if self._consumer is None:
+                    return self._call_unlocked(full_name, call_args, call_kwargs, exchange,
+                                               custom_exceptions, timeout)
+        # (the consumer thread is responsible for getting responses
+        # and for expiring the overdue ones)
+        future = self._call_async(full_name, call_args, call_kwargs, exchange, custom_exceptions,
+                                  timeout)
+        try:
+            return future.result()
+        except errors.RPCClientTimeoutError:
+            if self._cancel_on_timeout:
+                self._cancel(future, exchange)
+            raise
+
+    def _call_unlocked(self, full_name, call_args, call_kwargs, exchange=None, custom_exceptions=None,
+                       timeout=None):
+
+        """Remotely call a procedure (RPC-method)
+
+        `timeout' (in seconds; default: None => the proxy's default)
+        -- if it expires, RPCClientTimeoutError is raised.
+
+        """
+
+        future = self._send_request(full_name, call_args, call_kwargs,
+                                    exchange, custom_exceptions, timeout)
+        try:
+            while not future.done():
+                remaining = None
+                if future.deadline is not None:
+                    remaining = future.deadline - time.time()
+                    if remaining <= 0:
+                        self._expire(future)
+                        if self._cancel_on_timeout:
+                            self._cancel(future, exchange)
+                        break
+                self._transport.wait(remaining)
+        except self._transport.errors:
+            self._pending.pop(future.call_id, None)
+            self._amqp_reopen_channel()
+            raise
+
+        if future.call_id in self._streams:
+            # (further chunks of the result will be received by the consumer)
+            self._ensure_consumer()
+        return future.result()
+
+    def _call_async(self, full_name, call_args, call_kwargs, exchange=None, custom_exceptions=None,
+                    timeout=None):
+
+        """Remotely call a procedure (RPC-method), don't wait for the result.
+
+        Return an RPCFuture instance (see also: wait_all() and as_completed()
+        functions); if the `timeout' (see: _call_unlocked()) expires, the
+        future is completed with RPCClientTimeoutError.
+
+        """
+
+        if self._auto_batcher is not None:
+            future = self._new_future(full_name, call_args, call_kwargs,
+                                      custom_exceptions, timeout)
+            self._auto_batcher.add(exchange, full_name, call_args, call_kwargs, future)
+            return future
         with self._call_lock:
-            return self._call_unlocked(full_name, call_args, call_kwargs, exchange, custom_exceptions)
+            self._ensure_consumer()
+            return self._send_request(full_name, call_args, call_kwargs,
+                                      exchange, custom_exceptions, timeout)
+
+    def _batch(self, exchange=None, custom_exceptions=None, timeout=None):
 
-    def _call_unlocked(self, full_name, call_args, call_kwargs, exchange=None, custom_exceptions=None):
+        """Get a batch -- to send many RPC-requests as one message.
+
+        RPC-methods called as batch attributes (within the `with' block)
+        return RPCFuture instances; the calls are sent (and then executed
+        by the server) together on exit of the block:
+
+            with rpc._batch() as batch:
+                add_future = batch.my_module.add(1, 2)
+                list_future = batch.system.list('')
+            print add_future.result(), list_future.result()
+
+        (All requests are sent with the routing key of the first one).
+
+        """
 
-        "Remotely call a procedure (RPC-method)"
+        return _RPCBatch(self, exchange, custom_exceptions, timeout)
+
+    def _wait_job(self, job_id, timeout=None, poll_wait=30, exchange=None):
+
+        """Wait for completion of a server job; return its result.
+
+        The job is a call of an RPC-method declared as a job (it returned
+        `job_id'); system.job_result is called repeatedly -- each call
+        waiting on the server side up to `poll_wait' seconds -- until the
+        job is completed (then its result is returned or its error is
+        raised) or `timeout' (in seconds, if not None) expires (then
+        RPCClientTimeoutError is raised).
+
+        """
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            wait = poll_wait
+            if timeout is not None:
+                wait = max(0, min(wait, deadline - time.time()))
+            try:
+                # (the call timeout must not expire while the server waits)
+                return self._call('system.job_result', [job_id, wait], {},
+                                  exchange, timeout=wait + poll_wait)
+            except errors.RPCJobNotDoneError:
+                if timeout is not None and time.time() >= deadline:
+                    raise errors.RPCClientTimeoutError('Job {0} not completed '
+                                                       'within {1}s'.format(job_id,
+                                                                            timeout))
+
+    def _notify(self, full_name, call_args, call_kwargs, exchange=None):
+
+        """Send a notification -- an RPC-request with null id.
+
+        The server executes the method but sends no response (errors,
+        if any, are recorded only in the server log and statistics, see:
+        system.notification_stats RPC-method) -- so no reply-to queue is
+        given and there is nothing to wait for.
+
+        """
+
+        self._log_call('notification', full_name, call_args, call_kwargs)
+        msg = self._prepare_msg(full_name, call_args, call_kwargs, None, None)
+        self._publish_notification(msg, full_name, exchange)
+
+    def _cancel(self, future, exchange=None):
+
+        """Cancel a call (see: _call_async()).
+
+        If the call has not been completed (or its timeout has expired),
+        a system.cancel notification is sent to the server -- with the
+        routing key of the call (`exchange' should also be the same) --
+        so that the server drops the request (if it has not been started
+        yet) or lets the running RPC-method know (it can stop early);
+        a not completed future is completed with RPCClientCancelledError.
+        (With a request queue shared by several server instances the
+        cancellation may reach another instance -- see: the module
+        documentation.)
+
+        Return True if the cancellation has been sent.
+
+        """
+
+        if self._pending.pop(future.call_id, None) is not None:
+            self._remember_expired(future)
+            exc = errors.RPCClientCancelledError('Call of {0} ({1}) cancelled'
+                                                 .format(future.full_name,
+                                                         future.call_id))
+            future._set_exc_info((type(exc), exc, None))
+        elif future.call_id in self._streams:
+            # (a streamed result is being received)
+            exc = errors.RPCClientCancelledError('Call of {0} ({1}) cancelled'
+                                                 .format(future.full_name,
+                                                         future.call_id))
+            self._streams.pop(future.call_id)._put_chunk(None, (type(exc), exc, None),
+                                                         False)
+        elif future.call_id not in self._expired:
+            # (already completed)
+            return False
+        self._log.info('* cancelling: %s (%s)', future.full_name, future.call_id)
+        # (the same reply-to as of the call -- the server checks it)
+        msg = self._prepare_msg('system.cancel', [future.call_id], {},
+                                self._resp_queue, None)
+        self._publish_notification(msg, future.full_name, exchange)
+        return True
+
+    def _publish_notification(self, msg, full_name, exchange):
+
+        "Publish a notification message with the routing key for `full_name'"
 
         if exchange is None:
             exchange = self._req_exchange
-
         if exchange is None:
             raise errors.RPCClientError('Must specify exchange either in constructor, or in _call')
+        routing_key = self._prepare_routing_key(full_name, exchange)
+        with self._call_lock:
+            try:
+                self._transport.publish(msg,
+                                        exchange=exchange,
+                                        routing_key=routing_key)
+            except self._transport.errors:
+                self._amqp_reopen_channel()
+                raise
+
+    def _spill_read(self, spilled, chunk):
+
+        "Request a chunk of a spilled result (see: RPCSpilledResult); return an RPCFuture"
+
+        with self._call_lock:
+            self._ensure_consumer()
+            # (with the routing key of the call -- to reach the same server)
+            return self._send_request('system.spill_read', [spilled.handle, chunk], {},
+                                      spilled.exchange, None, spilled.timeout,
+                                      routing_name=spilled.full_name)
+
+    def _spill_release(self, spilled):
+        self._log_call('notification', 'system.spill_release', [spilled.handle], {})
+        msg = self._prepare_msg('system.spill_release', [spilled.handle], {}, None, None)
+        self._publish_notification(msg, spilled.full_name, spilled.exchange)
+
+    def _ensure_consumer(self):
+        # (to be called with the lock held)
+        if self._consumer is not None and not self._consumer.is_alive():
+            # the consumer thread has been broken
+            self._amqp_reopen_channel()
+        if self._consumer is None:
+            self._consumer = _ResponseConsumer(self)
+            self._consumer.start()
+
+    def _send_request(self, full_name, call_args, call_kwargs, exchange, custom_exceptions,
+                      timeout=None, routing_name=None):
+
+        """Publish an RPC-request; return an RPCFuture for its response
+
+        (`routing_name' -- full name of the method whose routing key is to
+        be used; default: None => `full_name').
+
+        """
+
+        future = self._new_future(full_name, call_args, call_kwargs,
+                                  custom_exceptions, timeout)
+        msg = self._prepare_msg(full_name, call_args, call_kwargs,
+                                self._resp_queue, future.call_id)
+        self._publish(msg, routing_name or full_name, exchange, [future])
+        return future
+
+    def _send_batch(self, calls, exchange):
+
+        """Publish RPC-requests as one batch message (see: _RPCBatch, _AutoBatcher).
+
+        `calls' -- a list of (<full name>, <args>, <kwargs>, <future>) tuples
+        (if there is only one, it is sent as a usual request message).
+
+        """
+
+        with self._call_lock:
+            self._ensure_consumer()
+            if len(calls) == 1:
+                full_name, call_args, call_kwargs, future = calls[0]
+                msg = self._prepare_msg(full_name, call_args, call_kwargs,
+                                        self._resp_queue, future.call_id)
+                self._publish(msg, full_name, exchange, [future])
+                return
+            request_dicts = [self._prepare_request_dict(name, args, kwargs,
+                                                        call_future.call_id)
+                             for name, args, kwargs, call_future in calls]
+            msg = self._prepare_batch_msg(request_dicts, self._resp_queue,
+                                          calls[0][3].call_id)
+            self._publish(msg, calls[0][0], exchange,
+                          [call_future for _, _, _, call_future in calls])
+
+    def _new_future(self, full_name, call_args, call_kwargs, custom_exceptions, timeout):
+
+        "Log the call, create an RPCFuture (with a new call id) for it"
 
         if custom_exceptions is None:
             custom_exceptions = self._custom_exceptions
@@ -266,70 +1158,212 @@ class MTRPCProxy(object):
         if custom_exceptions is None:
             custom_exceptions = {}
 
-        all_args = itertools.chain(itertools.imap(repr, call_args),
-                                   ('{0}={1!r}'.format(key, val)
-                                    for key, val in call_kwargs.iteritems()))
-        self._log.info('* remote call: %s(%s)', full_name, ', '.join(all_args))
+        if timeout is None:
+            timeout = self._timeout
+
+        self._log_call('call', full_name, call_args, call_kwargs)
+        call_id = '{0}:{1}'.format(self._resp_queue, next(self._call_id_gen))
+        return RPCFuture(call_id, full_name, custom_exceptions, self._log, timeout)
+
+    def _log_call(self, kind, full_name, call_args, call_kwargs):
+        if self._log.isEnabledFor(logging.INFO):
+            all_args = itertools.chain(itertools.imap(repr, call_args),
+                                       ('{0}={1!r}'.format(key, val)
+                                        for key, val in call_kwargs.iteritems()))
+            self._log.info('* remote %s: %s(%s)', kind, full_name, ', '.join(all_args))
+
+    def _publish(self, msg, full_name, exchange, futures):
+
+        "Publish the request message with the routing key for `full_name'"
+
+        if exchange is None:
+            exchange = self._req_exchange
+
+        if exchange is None:
+            raise errors.RPCClientError('Must specify exchange either in constructor, or in _call')
+
+        routing_key = self._prepare_routing_key(full_name, exchange)
+        self._publish_to(msg, exchange, routing_key, futures)
+
+    def _publish_to(self, msg, exchange, routing_key, futures):
 
-        resp_queue = self._resp_queue
+        "Register futures as pending, publish the request message"
+
+        for future in futures:
+            self._pending[future.call_id] = future
+            if future.deadline is not None and self._consumer is not None:
+                # (to be expired by the consumer thread; synchronous calls
+                # without the consumer take care of their deadlines themselves)
+                with self._deadlines_lock:
+                    heapq.heappush(self._deadlines, (future.deadline, future.call_id))
+                    earliest = self._deadlines[0][1] == future.call_id
+                if earliest:
+                    self._consumer.wake()
         try:
-            msg = self._prepare_msg(full_name, call_args,
-                                    call_kwargs, resp_queue)
-            routing_key = self._prepare_routing_key(full_name, exchange)
-            self._amqp_channel.basic_publish(msg,
-                                             exchange=exchange,
-                                             routing_key=routing_key,
-                                             mandatory=True,
-                                             immediate=self._immediate)
-            self._amqp_channel.wait()
-            if not self._response:
-                reply_code, reply_text, exchange, rk, message = self._amqp_channel.returned_messages.get()
-                if message.reply_to != resp_queue:
-                    raise errors.RPCClientError("It should not happen! RPC-error id "
-                                         "{0!r} differs from RPC-request id {1!r}"
-                                         .format(message.reply_to, resp_queue))
-                raise amqp.exceptions.AMQPChannelException(
-                    reply_code, reply_text, (exchange, rk))
-
-        except amqp.exceptions.AMQPException:
+            self._transport.publish(msg,
+                                    exchange=exchange,
+                                    routing_key=routing_key,
+                                    mandatory=True,
+                                    immediate=self._immediate)
+        except self._transport.errors:
+            for future in futures:
+                self._pending.pop(future.call_id, None)
             self._amqp_reopen_channel()
             raise
 
-        finally:
-            response = self._response
-            self._response = None
+    def _message_returned(self, message, exc):
+        "Transport return callback: complete futures of the returned request(s)"
+        for call_id in self._returned_call_ids(message):
+            future = self._pending.pop(call_id, None)
+            if future is None:
+                self._log.warning('Returned message of unknown RPC-request: %r',
+                                  message.body)
+                continue
+            future._set_exc_info((type(exc), exc, None))
+
+    @staticmethod
+    def _returned_call_ids(message):
+        if message.body.startswith('['):
+            # a batch
+            try:
+                return [request_dict['id']
+                        for request_dict in encoding.loads(message.body)]
+            except Exception:
+                pass
+        return [message.properties.get('correlation_id')]
 
-        if response.id != resp_queue:
-            raise errors.RPCClientError("It should not happen! RPC-response id "
-                                 "{0!r} differs from RPC-request id {1!r}"
-                                 .format(response.id, resp_queue))
-        elif response.error:
-            self._raise_received_error(response.error, custom_exceptions)
-        else:
-            return response.result
+    def _expire(self, future):
+        "Complete a pending future with RPCClientTimeoutError"
+        if self._pending.pop(future.call_id, None) is None:
+            return
+        self._remember_expired(future)
+        exc = errors.RPCClientTimeoutError(
+                'Response to {0} ({1}) not received within {2}s'
+                .format(future.full_name, future.call_id, future.timeout))
+        future._set_exc_info((type(exc), exc, None))
 
+    def _remember_expired(self, future):
+        # (a late response will be dropped -- the call id is unique)
+        self._expired[future.call_id] = future.full_name
+        while len(self._expired) > self.max_expired_remembered:
+            self._expired.popitem(last=False)
 
-    def _bind_and_consume(self):
-        self._amqp_channel.exchange_declare(
+    def _expire_pending(self):
+
+        """Expire pending calls whose deadlines have passed.
+
+        Return the number of seconds to the nearest deadline (or None).
+
+        """
+
+        with self._deadlines_lock:
+            deadlines = self._deadlines
+            now = time.time()
+            overdue = []
+            while deadlines and (deadlines[0][0] <= now
+                                 or deadlines[0][1] not in self._pending):
+                overdue.append(heapq.heappop(deadlines)[1])
+            next_deadline_in = (deadlines[0][0] - now if deadlines else None)
+        for call_id in overdue:
+            future = self._pending.get(call_id)
+            if future is not None:
+                self._expire(future)
+        return next_deadline_in
+
+    def _fail_pending(self, reason):
+        "Complete all pending futures with RPCClientError"
+        for call_id in self._pending.keys():
+            future = self._pending.pop(call_id, None)
+            if future is not None:
+                exc = errors.RPCClientError('Response not received -- {0}'
+                                            .format(reason))
+                future._set_exc_info((type(exc), exc, None))
+        for call_id in self._streams.keys():
+            stream = self._streams.pop(call_id, None)
+            if stream is not None:
+                exc = errors.RPCClientError('Rest of the result not received -- {0}'
+                                            .format(reason))
+                stream._put_chunk(None, (type(exc), exc, None), False)
+
+    def _stop_consumer(self):
+        if self._consumer is not None:
+            self._consumer.stop()
+            self._consumer = None
+
+
+    def _declare_exchange(self):
+        "Declare the response exchange (unless already done); return bool"
+        declared_key = self._transport.broker_id + (self._resp_exchange,)
+        if declared_key in self._declared_exchanges:
+            return False
+        self._transport.declare_exchange(
                 exchange=self._resp_exchange,
                 type='direct',
                 durable=True,
                 auto_delete=False,
         )
-        resp_queue, x, x = self._amqp_channel.queue_declare(
-                durable=True,
-                exclusive=True,
-                auto_delete=True,
-        )
-        self._amqp_channel.queue_bind(
-                queue=resp_queue,
-                exchange=self._resp_exchange,
-                routing_key=resp_queue,   # (<-yes)
-        )
-        self._amqp_channel.basic_consume(
+        self._declared_exchanges.add(declared_key)
+        return True
+
+
+    def _declare_and_bind(self, resp_queue=''):
+        """Declare the response exchange and queue (unless already done)
+
+        `resp_queue' -- the name of a server-named queue already declared
+        within the connection (to be re-declared instead of a new one).
+
+        """
+
+        exchange_declared = self._declare_exchange()
+        if self._reply_queue is None:
+            resp_queue = self._transport.declare_queue(
+                    queue=resp_queue,
+                    durable=True,
+                    exclusive=True,
+                    auto_delete=True,
+            )
+        elif self._reply_queue in self._amqp_declared:
+            return self._reply_queue
+        else:
+            # (exclusive but not auto-deleted: it lasts as long as
+            # the connection, also when the channel is reopened)
+            resp_queue = self._transport.declare_queue(
+                    queue=self._reply_queue,
+                    durable=True,
+                    exclusive=True,
+                    auto_delete=False,
+            )
+        try:
+            self._transport.bind_queue(
+                    queue=resp_queue,
+                    exchange=self._resp_exchange,
+                    routing_key=resp_queue,   # (<-yes)
+            )
+        except transport.NotFoundError:
+            if exchange_declared:
+                raise
+            # the exchange has been deleted since declared -- once again
+            # (with the same queue: an exclusive queue outlives the channel
+            # and this one, never consumed, would not be auto-deleted)
+            self._declared_exchanges.discard(self._transport.broker_id
+                                             + (self._resp_exchange,))
+            self._transport.reopen()
+            return self._declare_and_bind(resp_queue)
+        if self._reply_queue is not None:
+            self._amqp_declared.add(resp_queue)
+        return resp_queue
+
+
+    def _bind_and_consume(self):
+        if self._reply_queue == DIRECT_REPLY_TO_QUEUE:
+            # (a pseudo-queue: nothing to declare or bind)
+            resp_queue = DIRECT_REPLY_TO_QUEUE
+        else:
+            resp_queue = self._declare_and_bind()
+        self._transport.consume(
                 queue=resp_queue,
-                no_ack=False,
                 callback=self._store_response,
+                no_ack=True,  # (so that late responses do not pile up)
                 consumer_tag=resp_queue,  # (<-yes)
         )
         return resp_queue
@@ -337,36 +1371,135 @@ class MTRPCProxy(object):
 
     def _store_response(self, msg):
         try:
-            response_dict = encoding.loads(msg.body)
-            self._response = Response(**response_dict)
+            response_data = encoding.loads(msg.body)
+            if type(response_data) is list:
+                # a batch
+                responses = [Response(**response_dict)
+                             for response_dict in response_data]
+            else:
+                responses = [Response(**response_data)]
         except Exception:
             raise errors.RPCClientError('Could not deserialize message: {0!r}\n{1}'
                                  .format(msg.body, traceback.format_exc()))
 
+        for response in responses:
+            self._complete_call(response)
+
+
+    def _complete_call(self, response):
+        if response.more is not None:
+            self._store_chunk(response)
+            return
+        future = self._pending.pop(response.id, None)
+        if (future is None and response.id == self._resp_queue
+              and len(self._pending) == 1 and not self._expired):
+            # the server could not read the request id
+            # (then it uses the reply-to queue name instead)
+            future = self._pending.pop(next(iter(self._pending)), None)
+        if future is None:
+            self._drop_response(response)
+        elif response.error:
+            try:
+                self._raise_received_error(response.error, future._custom_exceptions)
+            except Exception:
+                future._set_exc_info(sys.exc_info())
+        elif response.spilled is not None:
+            future._set_result(RPCSpilledResult(self, future.full_name, future.timeout,
+                                                **response.spilled))
+        else:
+            future._set_result(response.result)
+
+    def _store_chunk(self, response):
+        stream = self._streams.get(response.id)
+        if stream is None:
+            if response.chunk != 0:
+                # (the rest of a dropped -- e.g. expired -- streamed result)
+                self._log.debug('Chunk %r of response (id %r) dropped',
+                                response.chunk, response.id)
+                return
+            future = self._pending.pop(response.id, None)
+            if future is None:
+                self._drop_response(response)
+                return
+            stream = RPCResultStream(future.full_name, response.id,
+                                     future._custom_exceptions, future.timeout)
+            if response.more:
+                self._streams[response.id] = stream
+            future._set_result(stream)
+        more = response.more
+        exc_info = None
+        if response.chunk != stream._next_chunk:
+            exc = errors.RPCClientError('Chunk {0} of {1} result received while '
+                                        'chunk {2} expected'.format(response.chunk,
+                                                                    stream.full_name,
+                                                                    stream._next_chunk))
+            exc_info = (type(exc), exc, None)
+            more = False
+        elif response.error:
+            try:
+                self._raise_received_error(response.error, stream._custom_exceptions)
+            except Exception:
+                exc_info = sys.exc_info()
+        if not more:
+            self._streams.pop(response.id, None)
+        stream._put_chunk(response.result, exc_info, more)
+
+    def _drop_response(self, response):
+        full_name = self._expired.pop(response.id, None)
+        if full_name is not None:
+            self._log.info('Late response to %s (id %r) dropped',
+                           full_name, response.id)
+        else:
+            self._log.warning('Response of unknown RPC-request (id %r) dropped',
+                              response.id)
+
 
     def _prepare_msg(self, full_name, call_args,
-                     call_kwargs, resp_queue):
+                     call_kwargs, resp_queue, call_id):
+        request_dict = self._prepare_request_dict(full_name, call_args,
+                                                  call_kwargs, call_id)
+        return self._make_msg(request_dict, resp_queue, call_id)
+
+
+    def _prepare_batch_msg(self, request_dicts, resp_queue, correlation_id):
+        return self._make_msg(request_dicts, resp_queue, correlation_id)
+
+
+    def _prepare_request_dict(self, full_name, call_args, call_kwargs, call_id):
         request_dict = dict(
-                id=resp_queue,
+                id=call_id,
                 method=full_name,
                 params=call_args,
         )
         if call_kwargs:
             request_dict['kwparams'] = call_kwargs
+        return request_dict
+
 
+    def _make_msg(self, request_data, resp_queue, correlation_id):
         try:
-            message_data = encoding.dumps(request_dict)
-            return amqp.Message(
+            message_data = encoding.dumps(request_data)
+            return transport.Message(
                     message_data,
                     delivery_mode=2,
                     reply_to=resp_queue,
+                    correlation_id=correlation_id,
             )
         except Exception:
             raise errors.RPCClientError('Could not serialize request dict: {0!r}\n{1}'
-                                 .format(request_dict, traceback.format_exc()))
+                                 .format(request_data, traceback.format_exc()))
 
 
     def _prepare_routing_key(self, full_name, exchange):
+        key = full_name, exchange
+        routing_key = self._routing_keys.get(key)
+        if routing_key is None:
+            routing_key = self._format_routing_key(full_name, exchange)
+            self._routing_keys[key] = routing_key
+        return routing_key
+
+
+    def _format_routing_key(self, full_name, exchange):
         split_name = full_name.split('.')
         return self._req_rk_pattern.format(
                 full_name=full_name,
@@ -408,3 +1541,212 @@ class MTRPCProxy(object):
             if exc_data:
                 exc.__dict__.update(exc_data)
             raise exc
+
+
+
+#
+# The pool of RPC-proxies
+#
+
+class MTRPCProxyPool(object):
+
+    """A thread-safe pool of ready-to-use RPC-proxies.
+
+    Creating an RPC-proxy costs several AMQP round trips (connection,
+    channel, reply queue declaration, binding and consuming) -- the pool
+    lets many threads share a few proxies:
+
+        pool = MTRPCProxyPool(min_size=2, max_size=10,
+                              req_exchange='request_amqp_exchange',
+                              req_rk_pattern='request_amqp_routing_key',
+                              host="localhost:5672")
+
+        with pool.proxy() as rpc:   # (the proxy is used exclusively here)
+            add_result = rpc.my_module.add(1, 2)
+
+        pool.close()
+
+    """
+
+    def __init__(self, min_size=0, max_size=10, max_idle_time=300,
+                 validate_after=0, proxy_class=MTRPCProxy, **proxy_kwargs):
+
+        """Pool initialization.
+
+        Arguments:
+
+        * min_size (int) -- number of proxies created immediately and
+          never evicted as idle (default: 0);
+
+        * max_size (int) -- maximum number of proxies (default: 10);
+
+        * max_idle_time (int/float or None) -- proxies not used for so
+          many seconds are closed (default: 300; None => never);
+
+        * validate_after (int/float) -- proxies not used for so many
+          seconds are checked with MTRPCProxy._is_valid() on checkout;
+          invalid ones are closed and replaced (default: 0 => always);
+
+        * proxy_class -- MTRPCProxy or its subclass (default: MTRPCProxy);
+
+        * proxy_kwargs -- keyword arguments for proxy_class constructor
+          (see: MTRPCProxy.__init__() documentation).
+
+        """
+
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('Bad pool size limits: min_size={0!r}, '
+                             'max_size={1!r}'.format(min_size, max_size))
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.validate_after = validate_after
+        self._proxy_class = proxy_class
+        self._proxy_kwargs = proxy_kwargs
+
+        self._condition = threading.Condition()
+        self._idle = []  # stack of (proxy, time of checkin) pairs
+        self._size = 0   # number of proxies: idle + checked out
+        self._closed = False
+
+        for _ in xrange(min_size):
+            self._idle.append((self._new_proxy(), time.time()))
+            self._size += 1
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+
+    def proxy(self, timeout=None):
+        "Context manager: check out a proxy, check it in on exit"
+        return _ProxyCheckout(self, timeout)
+
+
+    def get(self, timeout=None):
+
+        """Check out a proxy (to be checked in with put()).
+
+        Wait for a free one if max_size proxies are checked out; raise
+        RPCClientTimeoutError if none is free within `timeout' seconds
+        (default: None => wait infinitely).
+
+        """
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            with self._condition:
+                to_close = self._evict_idle()
+                if self._closed:
+                    raise errors.RPCClientError('MTRPCProxyPool instance is '
+                                                'already closed')
+                if self._idle:
+                    rpc_proxy, checkin_time = self._idle.pop()
+                elif self._size < self.max_size:
+                    rpc_proxy = checkin_time = None
+                    self._size += 1
+                elif timeout is None:
+                    self._condition.wait()
+                    continue
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise errors.RPCClientTimeoutError(
+                                'No free proxy in the pool within '
+                                '{0}s'.format(timeout))
+                    self._condition.wait(remaining)
+                    continue
+            # (proxies are created, validated and closed with no lock held)
+            for idle_proxy in to_close:
+                self._close_proxy(idle_proxy)
+            if rpc_proxy is None:
+                try:
+                    return self._new_proxy()
+                except Exception:
+                    self._discard()
+                    raise
+            if (time.time() - checkin_time < self.validate_after
+                  or rpc_proxy._is_valid()):
+                return rpc_proxy
+            rpc_proxy._log.warning('Pooled proxy is not valid -- '
+                                   'it will be replaced')
+            self._close_proxy(rpc_proxy)
+            self._discard()
+
+
+    def put(self, rpc_proxy):
+        "Check in a proxy (got with get())"
+        with self._condition:
+            if not self._closed and not rpc_proxy._closed:
+                self._idle.append((rpc_proxy, time.time()))
+                self._condition.notify()
+                return
+        self._close_proxy(rpc_proxy)
+        self._discard()
+
+
+    def close(self):
+        "Close the pool and its idle proxies (checked out ones -- on checkin)"
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for rpc_proxy, checkin_time in idle:
+            self._close_proxy(rpc_proxy)
+
+
+    def _new_proxy(self):
+        return self._proxy_class(**self._proxy_kwargs)
+
+
+    def _evict_idle(self):
+        # (to be called with the lock held; returns proxies to be closed)
+        if self.max_idle_time is None:
+            return []
+        oldest_allowed = time.time() - self.max_idle_time
+        evictable = max(self._size - self.min_size, 0)
+        i = 0
+        # the stack bottom contains proxies unused for the longest time
+        while (i < len(self._idle) and i < evictable
+               and self._idle[i][1] < oldest_allowed):
+            i += 1
+        to_close = [rpc_proxy for rpc_proxy, checkin_time in self._idle[:i]]
+        del self._idle[:i]
+        self._size -= i
+        return to_close
+
+
+    def _discard(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+
+    def _close_proxy(self, rpc_proxy):
+        try:
+            rpc_proxy._close()
+        except Exception:
+            rpc_proxy._log.debug('Error when closing pooled proxy:',
+                                 exc_info=True)
+
+
+class _ProxyCheckout(object):
+
+    """Auxiliary context manager class: see MTRPCProxyPool.proxy()"""
+
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+
+    def __enter__(self):
+        self._rpc_proxy = self._pool.get(self._timeout)
+        return self._rpc_proxy
+
+    def __exit__(self, type, value, tb):
+        self._pool.put(self._rpc_proxy)
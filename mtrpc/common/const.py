@@ -31,6 +31,10 @@ RPC-modules/methods:
   * DEFAULT_RESP_EXCHANGE -- default name of AMQP exchange to be used to
     send RPC-responses by server to client (via AMQP broker);
 
+  * DIRECT_REPLY_TO_QUEUE -- name of the broker pseudo-queue for
+    "direct reply-to" (RabbitMQ); responses to requests with such
+    reply-to are sent by server via the default ('') exchange;
+
   * DEFAULT_LOG_HANDLER_SETTINGS -- default server logger handler
     settings (see: the fragment of mtrpc.server documentation about
     configuration file structure and content).
@@ -51,6 +55,7 @@ RPC_LOG_HANDLERS = '__rpc_log_handlers__'
 # Some defaults
 DEFAULT_REQ_RK_PATTERN = '{full_name}'
 DEFAULT_RESP_EXCHANGE = 'amq.direct'
+DIRECT_REPLY_TO_QUEUE = 'amq.rabbitmq.reply-to'
 DEFAULT_LOG_HANDLER_SETTINGS = dict(
         cls='StreamHandler',
         kwargs={},
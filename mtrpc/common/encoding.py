@@ -163,6 +163,28 @@ def dumps(obj, *args, **kwargs):
     kwargs['cls'] = MtrpcJsonEncoder
     return json.dumps(obj, *args, **kwargs)
 
+def iterdumps(obj, *args, **kwargs):
+    '''Serialize an object tree -- yielding pieces of the JSON text
+
+    (items of a list or tuple are serialized one by one, so that the whole
+    text does not need to be built in memory)
+
+    >>> ''.join(iterdumps([1, dict(a=2)]))
+    '[1, {"a": 2}]'
+    >>> list(iterdumps(dict(a=1)))
+    ['{"a": 1}']
+    '''
+    if not isinstance(obj, (list, tuple)):
+        yield dumps(obj, *args, **kwargs)
+        return
+    encode = MtrpcJsonEncoder(*args, **kwargs).encode
+    yield '['
+    separator = ''
+    for item in obj:
+        yield separator + encode(item)
+        separator = ', '
+    yield ']'
+
 def loads(s, *args, **kwargs):
     '''Deserialize an object tree
 
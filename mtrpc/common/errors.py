@@ -8,7 +8,9 @@
 * RPCError -- base MTRPC exception class;
 
 * RPCClientError -- used in mtrpc.client classes to indicate errors
-  that ocurred on the client side;
+  that ocurred on the client side (RPCClientTimeoutError -- its subclass
+  -- if a response has not been received in time; RPCClientCancelledError
+  -- if the call has been cancelled);
 
 * rest RPC*Error classes -- raised in mtrpc.server.* classes, sent to
   client and then re-raised; see the class docstrings for more info;
@@ -53,12 +55,33 @@ class RPCInternalServerError(RPCError):
 class RPCAccessDenied(RPCError):
     """Access denied"""
 
+class RPCRequestCancelledError(RPCError):
+    "Request cancelled by the client (before or during its execution)"
+
+class RPCJobPoolFullError(RPCError):
+    "Job not accepted -- too many jobs are waiting in the server job pool"
+
+class RPCJobNotFoundError(RPCError):
+    "No such job (unknown job id or the job result has already expired)"
+
+class RPCJobNotDoneError(RPCError):
+    "Job not completed yet (so its result is not available)"
+
+class RPCSpillNotFoundError(RPCError):
+    "No such spilled result (unknown handle or it has already been evicted)"
+
 #
 # RPC client exceptions
 
 class RPCClientError(RPCError):
     "Error detected on client side"
 
+class RPCClientTimeoutError(RPCClientError):
+    "Response not received by client within the call timeout"
+
+class RPCClientCancelledError(RPCClientError):
+    "Call cancelled by the client (so its response will not be received)"
+
 
 def raise_exc(exception, *args, **kwargs):
 
@@ -0,0 +1,716 @@
+# mtrpc/common/socket_transport.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""MTRPC transports -- direct (broker-less) connections over TCP or Unix sockets.
+
+For latency-critical point-to-point calls (e.g. between services on the
+same host or LAN) the server can listen for client connections itself
+-- no broker, no extra hops, no message persistence:
+
+* server config: "amqp_params": {"transport": "socket-server",
+                                 "listen": "0.0.0.0:7070"}
+  ("listen" -- "<host>:<port>" for TCP, or a path -- containing "/" or
+  prefixed with "unix:" -- for a Unix domain socket);
+
+* client:
+
+    with MTRPCProxy(transport='socket', address='rpchost:7070',
+                    req_exchange='request_amqp_exchange',
+                    req_rk_pattern='request_amqp_routing_key') as rpc:
+        add_result = rpc.my_module.add(1, 2)
+
+  or -- for multi-threaded applications, with pooled connections:
+
+    pool = MTRPCProxyPool(max_size=8, transport='socket', address=...,
+                          req_exchange=..., req_rk_pattern=...)
+
+Request and response bodies are the same JSON as with AMQP. Requests keep
+their exchange and routing key: on the server side they are routed (by
+the bindings declared by RPCManager, with an in-process broker -- the one
+of the 'loopback' transport, see: mtrpc.common.transport) to the manager,
+so task dispatching, access keys, the responder etc. work as usual.
+Responses are sent back directly to the connection the request came
+from (found by the request's reply-to name). Many calls (asynchronous
+ones, batches, streamed results...) can be in flight on one connection.
+A request routed nowhere is returned to the client (NO_ROUTE, or
+NOT_FOUND if the exchange does not exist).
+
+All server transports (the manager's and the responder's) listening on
+the same address share one endpoint: a thread accepting connections,
+reading requests and writing (buffered) responses.
+
+Framing: each frame is a header -- payload length (4 bytes) and frame
+type (1 byte), network byte order -- followed by the payload:
+
+* FRAME_MESSAGE: flags (1 byte: mandatory, immediate, has reply-to, has
+  correlation id), lengths of: exchange, routing key, reply-to and
+  correlation id (2 bytes each) and body (4 bytes), then those strings;
+
+* FRAME_RETURN (server -> client): reply code and length of reply text
+  (2 bytes each), the reply text, then a FRAME_MESSAGE payload.
+
+A client connection sending a frame larger than the endpoint's
+`max_frame_size' (64 MiB by default) is dropped -- before the frame is
+buffered.
+
+A Unix socket file left by a server that is gone is replaced; if
+a server still accepts connections on it, listening fails.
+
+"""
+
+import collections
+import errno
+import os
+import select
+import socket
+import stat
+import struct
+import threading
+import time
+import uuid
+
+from . import utils
+from .const import DIRECT_REPLY_TO_QUEUE
+from .transport import (Transport, LoopbackTransport, Message, TransportError,
+                        NotFoundError, MessageReturnedError, _LoopbackBroker,
+                        _LoopbackConsumer, _LoopbackQueue, _Wakeup)
+
+
+FRAME_MESSAGE = 1
+FRAME_RETURN = 2
+
+_frame_header = struct.Struct('!IB')
+_message_header = struct.Struct('!BHHHHI')
+_return_header = struct.Struct('!HH')
+
+# message flags
+_MANDATORY = 1
+_IMMEDIATE = 2
+_HAS_REPLY_TO = 4
+_HAS_CORRELATION_ID = 8
+
+_RETRY_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
+
+#
+# Framing
+
+def _to_str(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def frame(frame_type, payload):
+    return _frame_header.pack(len(payload), frame_type) + payload
+
+
+def encode_message(msg, exchange, routing_key, mandatory=False, immediate=False):
+    "Make a FRAME_MESSAGE payload"
+    reply_to = msg.properties.get('reply_to')
+    correlation_id = msg.properties.get('correlation_id')
+    flags = ((_MANDATORY if mandatory else 0)
+             | (_IMMEDIATE if immediate else 0)
+             | (_HAS_REPLY_TO if reply_to is not None else 0)
+             | (_HAS_CORRELATION_ID if correlation_id is not None else 0))
+    fields = (_to_str(exchange),
+              _to_str(routing_key),
+              _to_str(reply_to) if reply_to is not None else '',
+              _to_str(correlation_id) if correlation_id is not None else '',
+              _to_str(msg.body))
+    return _message_header.pack(flags, *map(len, fields)) + ''.join(fields)
+
+
+def decode_message(payload, offset=0):
+
+    """Parse a FRAME_MESSAGE payload
+
+    Return a tuple: (<Message instance>, <exchange>, <routing key>,
+    <mandatory flag>, <immediate flag>).
+
+    """
+
+    header = _message_header.unpack_from(payload, offset)
+    flags = header[0]
+    pos = offset + _message_header.size
+    fields = []
+    for length in header[1:]:
+        fields.append(payload[pos:pos + length])
+        pos += length
+    exchange, routing_key, reply_to, correlation_id, body = fields
+    properties = {}
+    if flags & _HAS_REPLY_TO:
+        properties['reply_to'] = reply_to
+    if flags & _HAS_CORRELATION_ID:
+        properties['correlation_id'] = correlation_id
+    return (Message(body, **properties), exchange, routing_key,
+            bool(flags & _MANDATORY), bool(flags & _IMMEDIATE))
+
+
+def encode_return(msg, reply_code, reply_text, exchange, routing_key):
+    "Make a FRAME_RETURN payload"
+    return (_return_header.pack(reply_code, len(reply_text)) + reply_text
+            + encode_message(msg, exchange, routing_key))
+
+
+def decode_return(payload):
+    """Parse a FRAME_RETURN payload; return (<Message instance>, <MessageReturnedError>)"""
+    reply_code, text_length = _return_header.unpack_from(payload)
+    pos = _return_header.size
+    reply_text = payload[pos:pos + text_length]
+    msg, exchange, routing_key, _, _ = decode_message(payload, pos + text_length)
+    return msg, MessageReturnedError(reply_code, reply_text, exchange, routing_key)
+
+
+class _FrameReader(object):
+
+    """Auxiliary class: splits received data into frames"""
+
+    def __init__(self, max_frame_size=None):
+        self.max_frame_size = max_frame_size  # (payload size; None => no limit)
+        self._chunks = []
+        self._size = 0
+        self._needed = _frame_header.size  # (bytes needed to parse anything)
+
+    def feed(self, data):
+        """Take received data; return a list of complete (frame type, payload) pairs
+
+        Raise TransportError if a frame exceeds `max_frame_size'.
+
+        """
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._size < self._needed:
+            return []
+        buf = ''.join(self._chunks)
+        frames = []
+        pos = 0
+        header_size = _frame_header.size
+        while True:
+            if len(buf) - pos < header_size:
+                self._needed = header_size
+                break
+            length, frame_type = _frame_header.unpack_from(buf, pos)
+            if self.max_frame_size is not None and length > self.max_frame_size:
+                raise TransportError('Frame too large: {0} bytes (the limit is {1})'
+                                     .format(length, self.max_frame_size))
+            end = pos + header_size + length
+            if end > len(buf):
+                self._needed = end - pos
+                break
+            frames.append((frame_type, buf[pos + header_size:end]))
+            pos = end
+        rest = buf[pos:]
+        self._chunks = [rest] if rest else []
+        self._size = len(rest)
+        return frames
+
+
+def parse_address(address):
+
+    """Parse a socket address; return a pair: (<address family>, <address>)
+
+    'unix:<path>' or '<path>' (containing '/') => AF_UNIX;
+    '<host>:<port>' => AF_INET.
+
+    """
+
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    if '/' in address:
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(':')
+    try:
+        return socket.AF_INET, (host, int(port))
+    except ValueError:
+        raise ValueError('Bad socket address: {0!r} (expected "<host>:<port>" '
+                         'or a Unix socket path)'.format(address))
+
+
+def _setup_socket(sock, family):
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        utils.setkeepalives(sock)
+
+
+#
+# Client side
+
+class SocketTransport(Transport):
+
+    """Direct transport, client side: a connection to a socket-server endpoint"""
+
+    errors = (TransportError, socket.error)
+
+    connect_timeout = 10  # in seconds
+    recv_size = 1 << 16
+
+    def __init__(self, address, **params):
+        super(SocketTransport, self).__init__(address=address, **params)
+        self.broker_id = ('socket', address)
+        self.address = address
+        self._sock = None
+        self._broken = False
+        self._write_lock = threading.Lock()
+        self._wakeup = _Wakeup()
+        self._reader = None
+        self._frames = collections.deque()  # (received, not dispatched yet)
+        self._consumers = {}  # maps consumer tags to (reply-to) queue names
+        self._callbacks = {}  # maps (reply-to) queue names to callbacks
+        self._direct_reply_to = None
+
+    def connect(self):
+        family, sockaddr = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.connect_timeout)
+            sock.connect(sockaddr)
+            sock.settimeout(None)
+            _setup_socket(sock, family)
+        except Exception:
+            sock.close()
+            raise
+        self._sock = sock
+        self._broken = False
+        self._reader = _FrameReader()
+        self._frames.clear()
+        self._wakeup.open()
+
+    def close(self):
+        try:
+            if self._sock is not None:
+                self._sock.close()
+        finally:
+            self._sock = None
+            self._wakeup.close()
+
+    def reopen(self):
+        # (there are no channels -- but a broken connection is re-established)
+        self._consumers.clear()
+        self._callbacks.clear()
+        if self._broken:
+            self.close()
+            self.connect()
+
+    def ping(self):
+        self._check_connection()
+        if select.select([self._sock], [], [], 0)[0]:
+            try:
+                if not self._sock.recv(1, socket.MSG_PEEK):
+                    self._broken = True
+            except socket.error:
+                self._broken = True
+            self._check_connection()
+
+    def qos(self, prefetch_count):
+        pass
+
+    def declare_exchange(self, exchange, type, durable=True, auto_delete=False):
+        pass
+
+    def declare_queue(self, queue='', durable=True, exclusive=False, auto_delete=False):
+        # (the server learns reply-to names from requests)
+        return queue or 'mtrpc.socket.{0}'.format(uuid.uuid4().hex)
+
+    def bind_queue(self, queue, exchange, routing_key):
+        pass
+
+    def consume(self, queue, callback, no_ack=False, consumer_tag=None):
+        if queue == DIRECT_REPLY_TO_QUEUE:
+            if self._direct_reply_to is None:
+                self._direct_reply_to = self.declare_queue()
+            consumer_tag = consumer_tag or queue
+            queue = self._direct_reply_to
+        consumer_tag = consumer_tag or queue
+        self._consumers[consumer_tag] = queue
+        self._callbacks[queue] = callback
+        return consumer_tag
+
+    def cancel(self, consumer_tag):
+        queue = self._consumers.pop(consumer_tag, None)
+        if queue is not None:
+            self._callbacks.pop(queue, None)
+
+    def publish(self, msg, exchange, routing_key, mandatory=False, immediate=False):
+        self._check_connection()
+        if (self._direct_reply_to is not None
+              and msg.properties.get('reply_to') == DIRECT_REPLY_TO_QUEUE):
+            properties = dict(msg.properties, reply_to=self._direct_reply_to)
+            msg = Message(msg.body, **properties)
+        data = frame(FRAME_MESSAGE, encode_message(msg, exchange, routing_key,
+                                                   mandatory, immediate))
+        with self._write_lock:
+            try:
+                self._sock.sendall(data)
+            except socket.error:
+                self._broken = True
+                raise
+
+    def ack(self, delivery_tag):
+        pass
+
+    def wait(self, timeout=None):
+        if self._wakeup.clear():
+            return False
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._frames:
+            self._check_connection()
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            ready = select.select([self._sock, self._wakeup], [], [], remaining)[0]
+            if self._wakeup in ready:
+                self._wakeup.clear()
+                return False
+            if not ready:
+                return False
+            try:
+                data = self._sock.recv(self.recv_size)
+            except socket.error as exc:
+                if exc.errno in _RETRY_ERRNOS:
+                    continue
+                self._broken = True
+                raise
+            if not data:
+                self._broken = True
+                raise TransportError('Connection to {0} closed by the server'
+                                     .format(self.address))
+            self._frames.extend(self._reader.feed(data))
+        while self._frames:
+            frame_type, payload = self._frames.popleft()
+            self._dispatch(frame_type, payload)
+        return True
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def _check_connection(self):
+        if self._sock is None:
+            raise TransportError('{0!r} is not connected'.format(self))
+        if self._broken:
+            raise TransportError('Connection to {0} is broken'.format(self.address))
+
+    def _dispatch(self, frame_type, payload):
+        if frame_type == FRAME_MESSAGE:
+            msg, exchange, routing_key, _, _ = decode_message(payload)
+            callback = self._callbacks.get(routing_key)
+            if callback is not None:  # (otherwise: no consumer -- dropped)
+                msg.delivery_info = dict(consumer_tag=routing_key,
+                                         delivery_tag=None,
+                                         redelivered=False,
+                                         exchange=exchange,
+                                         routing_key=routing_key)
+                callback(msg)
+        elif frame_type == FRAME_RETURN:
+            msg, exc = decode_return(payload)
+            if self.return_callback is not None:
+                self.return_callback(msg, exc)
+        else:
+            self._broken = True
+            raise TransportError('Unknown frame type: {0!r}'.format(frame_type))
+
+
+#
+# Server side
+
+class _SocketBroker(_LoopbackBroker):
+
+    """Auxiliary class: an in-process broker routing also to client connections"""
+
+    def __init__(self):
+        super(_SocketBroker, self).__init__()
+        self.reply_queues = {}  # maps reply-to names to queues of connections
+
+    def route(self, exchange, routing_key):
+        # (responses are routed by reply-to names, whatever the exchange)
+        queue = self.reply_queues.get(routing_key)
+        if queue is not None:
+            return [queue]
+        return super(_SocketBroker, self).route(exchange, routing_key)
+
+
+class _SocketConnection(object):
+
+    """Auxiliary class: a client connection accepted by an endpoint"""
+
+    def __init__(self, endpoint, sock):
+        self.endpoint = endpoint
+        self.sock = sock
+        self.reader = _FrameReader(endpoint.max_frame_size)
+        self.lock = threading.Lock()
+        self.outbuf = collections.deque()  # [data, offset] lists
+        self.reply_to_names = set()
+        self.closed = False
+        self.broken = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def _deliver(self, consumer, exchange, routing_key, msg):
+        # (called by the broker -- with its lock held -- for responses)
+        self.send(frame(FRAME_MESSAGE, encode_message(msg, exchange, routing_key)))
+
+    def send(self, data):
+        "Send data at once if possible, otherwise buffer it (for the endpoint thread)"
+        with self.lock:
+            if self.closed:
+                return
+            offset = 0
+            if not self.outbuf:
+                try:
+                    offset = self.sock.send(data)
+                except socket.error as exc:
+                    if exc.errno not in _RETRY_ERRNOS:
+                        self.broken = True
+                if offset == len(data) or self.broken:
+                    if self.broken:
+                        self.endpoint.wakeup.set()
+                    return
+            self.outbuf.append([data, offset])
+        self.endpoint.wakeup.set()
+
+    def flush(self):
+        "Send buffered data (as much as possible); return False if broken"
+        with self.lock:
+            outbuf = self.outbuf
+            while outbuf:
+                item = outbuf[0]
+                data, offset = item
+                try:
+                    sent = self.sock.send(buffer(data, offset))
+                except socket.error as exc:
+                    if exc.errno in _RETRY_ERRNOS:
+                        return True
+                    return False
+                if offset + sent < len(data):
+                    item[1] = offset + sent
+                    return True
+                outbuf.popleft()
+        return True
+
+
+class _SocketEndpoint(threading.Thread):
+
+    """Auxiliary thread: accepts connections, reads requests, writes buffered data"""
+
+    backlog = 128
+    sel_timeout = 60
+    recv_size = 1 << 16
+    max_frame_size = 1 << 26
+    stale_check_timeout = 1  # in seconds
+
+    def __init__(self, listen):
+        threading.Thread.__init__(self, name='SocketEndpoint-{0}'.format(listen))
+        self.daemon = True
+        self.listen = listen
+        self.users = 0  # number of server transports using the endpoint
+        self.broker = _SocketBroker()
+        self.wakeup = _Wakeup()
+        self._connections = []
+        self._stopping = False
+        self._family, sockaddr = parse_address(listen)
+        sock = socket.socket(self._family, socket.SOCK_STREAM)
+        try:
+            if self._family == socket.AF_UNIX:
+                self._remove_stale_socket_file(sockaddr)
+            else:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(sockaddr)
+            sock.listen(self.backlog)
+            sock.setblocking(0)
+        except Exception:
+            sock.close()
+            raise
+        self._listener = sock
+        self.wakeup.open()
+
+    @property
+    def address(self):
+        "The actual address (e.g. with the port number chosen by the system)"
+        if self._family == socket.AF_UNIX:
+            return self.listen
+        host, port = self._listener.getsockname()
+        return '{0}:{1}'.format(host, port)
+
+    def run(self):
+        listener = self._listener
+        try:
+            while not self._stopping:
+                connections = list(self._connections)
+                writers = [conn for conn in connections if conn.outbuf]
+                readable, writable, _ = select.select(
+                        [listener, self.wakeup] + connections, writers, [],
+                        self.sel_timeout)
+                if self.wakeup in readable:
+                    self.wakeup.clear()
+                if listener in readable:
+                    self._accept()
+                for conn in writable:
+                    if not conn.flush():
+                        self._drop(conn)
+                for conn in readable:
+                    if conn is not listener and conn is not self.wakeup:
+                        self._read(conn)
+                for conn in connections:
+                    if conn.broken:
+                        self._drop(conn)
+        finally:
+            for conn in list(self._connections):
+                self._drop(conn)
+            listener.close()
+            self.wakeup.close()
+            if self._family == socket.AF_UNIX:
+                self._remove_socket_file(self.listen[len('unix:'):]
+                                         if self.listen.startswith('unix:')
+                                         else self.listen)
+
+    def stop(self):
+        "Stop the thread; to be called from another thread"
+        self._stopping = True
+        self.wakeup.set()
+        self.join()
+
+    def _accept(self):
+        try:
+            sock, _ = self._listener.accept()
+        except socket.error as exc:
+            if exc.errno in _RETRY_ERRNOS + (errno.ECONNABORTED,):
+                return
+            raise
+        sock.setblocking(0)
+        _setup_socket(sock, self._family)
+        self._connections.append(_SocketConnection(self, sock))
+
+    def _read(self, conn):
+        if conn.closed:
+            return
+        try:
+            data = conn.sock.recv(self.recv_size)
+        except socket.error as exc:
+            if exc.errno in _RETRY_ERRNOS:
+                return
+            data = ''
+        if not data:
+            self._drop(conn)
+            return
+        try:
+            frames = conn.reader.feed(data)
+        except TransportError:
+            # (a frame over the size limit)
+            self._drop(conn)
+            return
+        for frame_type, payload in frames:
+            if frame_type != FRAME_MESSAGE:
+                # (protocol error)
+                self._drop(conn)
+                return
+            self._publish(conn, *decode_message(payload))
+
+    def _publish(self, conn, msg, exchange, routing_key, mandatory, immediate):
+        broker = self.broker
+        with broker.lock:
+            reply_to = msg.properties.get('reply_to')
+            if reply_to and reply_to not in conn.reply_to_names:
+                self._register_reply_to(conn, reply_to)
+            try:
+                returned = broker.publish(msg, exchange, routing_key, mandatory, immediate)
+            except NotFoundError:
+                returned = 404, 'NOT_FOUND'
+            if returned is not None:
+                reply_code, reply_text = returned
+                conn.send(frame(FRAME_RETURN, encode_return(msg, reply_code, reply_text,
+                                                            exchange, routing_key)))
+
+    def _register_reply_to(self, conn, reply_to):
+        # (to be called with the broker lock held)
+        queue = _LoopbackQueue(reply_to, conn, False)
+        queue.consumers.append(_LoopbackConsumer(conn, reply_to, queue, None, True))
+        self.broker.reply_queues[reply_to] = queue
+        conn.reply_to_names.add(reply_to)
+
+    def _drop(self, conn):
+        if conn in self._connections:
+            self._connections.remove(conn)
+        with self.broker.lock:
+            reply_queues = self.broker.reply_queues
+            for reply_to in conn.reply_to_names:
+                queue = reply_queues.get(reply_to)
+                if queue is not None and queue.owner is conn:
+                    del reply_queues[reply_to]
+        with conn.lock:
+            if not conn.closed:
+                conn.closed = True
+                conn.outbuf.clear()
+                conn.sock.close()
+
+    def _remove_stale_socket_file(self, path):
+        "Remove a socket file -- only if no server accepts connections on it"
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.settimeout(self.stale_check_timeout)
+            probe.connect(path)
+        except socket.error as exc:
+            if exc.errno == errno.ECONNREFUSED:
+                self._remove_socket_file(path)
+        finally:
+            probe.close()
+
+    @staticmethod
+    def _remove_socket_file(path):
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                os.remove(path)
+        except OSError:
+            pass
+
+
+_endpoints = {}  # maps listen addresses to _SocketEndpoint instances
+_endpoints_lock = threading.Lock()
+
+
+def _acquire_endpoint(listen):
+    with _endpoints_lock:
+        endpoint = _endpoints.get(listen)
+        if endpoint is None:
+            endpoint = _SocketEndpoint(listen)
+            endpoint.start()
+            _endpoints[listen] = endpoint
+        endpoint.users += 1
+        return endpoint
+
+
+def _release_endpoint(endpoint):
+    with _endpoints_lock:
+        endpoint.users -= 1
+        if endpoint.users:
+            return
+        del _endpoints[endpoint.listen]
+    endpoint.stop()
+
+
+class SocketServerTransport(LoopbackTransport):
+
+    """Direct transport, server side: listens for client connections
+
+    (requests are routed as with the loopback transport -- by bindings
+    of the broker of the endpoint; see: the module documentation).
+
+    """
+
+    def __init__(self, listen, **params):
+        super(SocketServerTransport, self).__init__(listen=listen, **params)
+        self.broker_id = ('socket', listen)
+        self.listen = listen
+        self._endpoint = None
+
+    @property
+    def address(self):
+        "The actual address the endpoint listens on (if connected)"
+        return self._endpoint.address if self._endpoint is not None else None
+
+    def _acquire_broker(self):
+        self._endpoint = _acquire_endpoint(self.listen)
+        return self._endpoint.broker
+
+    def _release_broker(self):
+        endpoint, self._endpoint = self._endpoint, None
+        _release_endpoint(endpoint)
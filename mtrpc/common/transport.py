@@ -0,0 +1,774 @@
+# mtrpc/common/transport.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""MTRPC transports -- messaging backends of the server threads and the client.
+
+The MTRPC server threads (see: mtrpc.server.threads) and the RPC-proxy
+(see: mtrpc.client) do not use any messaging library directly -- only
+a Transport instance: a connection (with one channel) to a broker,
+providing AMQP-like operations:
+
+* connect(), close(), reopen() (the channel, e.g. after a channel error),
+  ping();
+* qos() (the prefetch count), declare_exchange(), declare_queue(),
+  bind_queue();
+* consume(), cancel() -- consumer callbacks are called (with Message-like
+  objects: having `body', `properties' and `delivery_info' attributes)
+  by wait();
+* publish() (a Message instance), ack();
+* wait() -- wait for incoming messages and dispatch them; wakeup() --
+  make the current (or the next) wait() call return at once (that one
+  may be called from any thread).
+
+Messages returned by the broker (published with the `mandatory' or
+`immediate' flag but not delivered) are passed -- also by wait() -- to
+the `return_callback' attribute (if set): return_callback(message, exc).
+
+Available transports:
+
+* 'amqplib' (AMQPLibTransport, the default) -- a real AMQP broker, via
+  amqplib.client_0_8; connection parameters are keyword arguments for
+  amqplib.client_0_8.Connection();
+
+* 'loopback' (LoopbackTransport) -- an in-memory broker within the
+  process (exchanges, queues, bindings, consumers, acks and prefetch,
+  returns, "direct reply-to"), shared by all loopback transports using
+  the same `virtual_host' (the only connection parameter; others are
+  ignored) -- so the server and its clients can run in one process with
+  no network involved (e.g. in tests and benchmarks);
+
+* 'socket' and 'socket-server' -- direct (broker-less) connections over
+  TCP or Unix domain sockets, see: mtrpc.common.socket_transport.
+
+A transport is chosen with the 'transport' item of the connection
+parameters (the `amqp_params' of the server config, the keyword arguments
+of MTRPCProxy): a name from TRANSPORTS, a dotted path of a Transport
+subclass ('package.module.ClassName') or the class itself, see:
+from_params().
+
+"""
+
+import abc
+import collections
+import itertools
+import os
+import select
+import sys
+import threading
+import time
+
+from amqplib import client_0_8 as amqp
+
+from . import utils
+from .const import DIRECT_REPLY_TO_QUEUE
+
+
+DEFAULT_TRANSPORT = 'amqplib'
+
+# maps transport names to dotted paths of Transport subclasses
+TRANSPORTS = {
+    'amqplib': 'mtrpc.common.transport.AMQPLibTransport',
+    'loopback': 'mtrpc.common.transport.LoopbackTransport',
+    'socket': 'mtrpc.common.socket_transport.SocketTransport',
+    'socket-server': 'mtrpc.common.socket_transport.SocketServerTransport',
+}
+
+
+#
+# Errors
+
+class TransportError(Exception):
+    """Base class of errors raised by transports themselves"""
+
+
+class NotFoundError(TransportError):
+    """An exchange or a queue does not exist"""
+
+
+class MessageReturnedError(TransportError):
+
+    """A message has been returned by the broker (passed to return_callback)"""
+
+    def __init__(self, reply_code, reply_text, exchange, routing_key):
+        super(MessageReturnedError, self).__init__(
+                '{0} {1} (exchange: {2!r}, routing key: {3!r})'.format(
+                        reply_code, reply_text, exchange, routing_key))
+        self.reply_code = reply_code
+        self.reply_text = reply_text
+        self.exchange = exchange
+        self.routing_key = routing_key
+
+
+#
+# Messages
+
+class Message(object):
+
+    """A message: body (str) + properties (e.g. reply_to, correlation_id)"""
+
+    __slots__ = ('body', 'properties', 'delivery_info')
+
+    def __init__(self, body, **properties):
+        self.body = body
+        self.properties = properties
+        self.delivery_info = {}  # (set for delivered messages)
+
+    def __repr__(self):
+        return '<Message {0!r} {1!r}>'.format(self.body, self.properties)
+
+
+#
+# Auxiliary classes
+
+class _Wakeup(object):
+
+    """Auxiliary class: a sticky flag that can be waited for with select()
+
+    (it is pending from set() until clear(); pending-ness survives
+    closing and re-opening of the pipe).
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = False
+        self._fd_r = self._fd_w = None
+
+    def open(self):
+        with self._lock:
+            if self._fd_r is None:
+                self._fd_r, self._fd_w = os.pipe()
+                if self._pending:
+                    os.write(self._fd_w, 'w')
+
+    def close(self):
+        with self._lock:
+            if self._fd_r is not None:
+                os.close(self._fd_r)
+                os.close(self._fd_w)
+                self._fd_r = self._fd_w = None
+
+    def fileno(self):
+        return self._fd_r
+
+    def set(self):
+        with self._lock:
+            if not self._pending:
+                self._pending = True
+                if self._fd_w is not None:
+                    os.write(self._fd_w, 'w')
+
+    def clear(self):
+        "Clear the flag; return True if it was pending"
+        with self._lock:
+            if not self._pending:
+                return False
+            self._pending = False
+            if self._fd_r is not None:
+                os.read(self._fd_r, 1)
+            return True
+
+
+#
+# The transport interface
+
+class Transport(object):
+
+    """Abstract class: a connection (with one channel) to a message broker"""
+
+    __metaclass__ = abc.ABCMeta
+
+    # exception classes meaning that the channel (or the connection)
+    # is broken -- to be caught by users of the transport
+    errors = (TransportError,)
+
+    # called with (message, exc) for returned messages (see: wait())
+    return_callback = None
+
+    def __init__(self, **params):
+        self.params = params
+        # identifies the broker (e.g. to cache declarations)
+        self.broker_id = (params.get('host', 'localhost'),
+                          params.get('virtual_host', '/'))
+
+    def __repr__(self):
+        return '<{0} {1[0]}{1[1]}>'.format(self.__class__.__name__, self.broker_id)
+
+    @abc.abstractmethod
+    def connect(self):
+        """Connect to the broker, open the channel"""
+
+    @abc.abstractmethod
+    def close(self):
+        """Close the channel and the connection (connect() may be called again)"""
+
+    @abc.abstractmethod
+    def reopen(self):
+        """Open a new channel (e.g. the current one has been closed by an error)"""
+
+    @abc.abstractmethod
+    def ping(self):
+        """Check the channel (raise an exception if broken)"""
+
+    @abc.abstractmethod
+    def qos(self, prefetch_count):
+        """Set max. number of delivered but not acknowledged messages (0 => no limit)"""
+
+    @abc.abstractmethod
+    def declare_exchange(self, exchange, type, durable=True, auto_delete=False):
+        """Declare an exchange"""
+
+    @abc.abstractmethod
+    def declare_queue(self, queue='', durable=True, exclusive=False, auto_delete=False):
+        """Declare a queue (queue='' => server-named); return its name"""
+
+    @abc.abstractmethod
+    def bind_queue(self, queue, exchange, routing_key):
+        """Bind the queue to the exchange (NotFoundError if one does not exist)"""
+
+    @abc.abstractmethod
+    def consume(self, queue, callback, no_ack=False, consumer_tag=None):
+        """Start consuming from the queue -- callback(message) called by wait()"""
+
+    @abc.abstractmethod
+    def cancel(self, consumer_tag):
+        """Stop consuming"""
+
+    @abc.abstractmethod
+    def publish(self, msg, exchange, routing_key, mandatory=False, immediate=False):
+        """Publish a Message instance"""
+
+    @abc.abstractmethod
+    def ack(self, delivery_tag):
+        """Acknowledge a delivered message"""
+
+    @abc.abstractmethod
+    def wait(self, timeout=None):
+
+        """Wait for incoming messages; dispatch them to callbacks.
+
+        Wait no longer than `timeout' seconds (None => with no limit);
+        return True if anything has been dispatched, False if the timeout
+        expired or wakeup() has been called.
+
+        """
+
+    @abc.abstractmethod
+    def wakeup(self):
+        """Make the current (or the next) wait() return; may be called from any thread"""
+
+
+def get_transport_class(spec=None):
+
+    """Get a Transport subclass by its name, dotted path or itself
+
+    (spec=None => DEFAULT_TRANSPORT).
+
+    """
+
+    if spec is None:
+        spec = DEFAULT_TRANSPORT
+    if isinstance(spec, basestring):
+        path = TRANSPORTS.get(spec, spec)
+        if '.' not in path:
+            raise ValueError('Unknown transport: {0!r} (not one of {1} nor a '
+                             'dotted path)'.format(spec, sorted(TRANSPORTS)))
+        module_name, class_name = path.rsplit('.', 1)
+        __import__(module_name)
+        spec = getattr(sys.modules[module_name], class_name)
+    if not (isinstance(spec, type) and issubclass(spec, Transport)):
+        raise TypeError('{0!r} is not a Transport subclass'.format(spec))
+    return spec
+
+
+def from_params(params):
+
+    """Create a (not connected) transport from connection parameters
+
+    -- a dict of keyword arguments for the transport class constructor,
+    plus (optionally) the 'transport' item, see: get_transport_class()
+    (the dict is not modified).
+
+    """
+
+    params = dict(params)
+    transport_class = get_transport_class(params.pop('transport', None))
+    return transport_class(**params)
+
+
+#
+# AMQP via amqplib
+
+class AMQPLibTransport(Transport):
+
+    """AMQP transport using amqplib.client_0_8"""
+
+    errors = (amqp.exceptions.AMQPException, TransportError)
+
+    def __init__(self, **params):
+        super(AMQPLibTransport, self).__init__(**params)
+        self._conn = None
+        self._channel = None
+        self._wakeup = _Wakeup()
+
+    def connect(self):
+        self._conn = amqp.Connection(**self.params)
+        utils.setkeepalives(self._conn.transport.sock)
+        self._channel = self._conn.channel()
+        self._wakeup.open()
+
+    def close(self):
+        try:
+            try:
+                if self._channel is not None:
+                    self._channel.close()
+            finally:
+                if self._conn is not None:
+                    self._conn.close()
+        finally:
+            self._conn = self._channel = None
+            self._wakeup.close()
+
+    def reopen(self):
+        if self._channel.channel_id:
+            try:
+                self._channel.close()
+            except Exception:
+                pass
+        self._channel = self._conn.channel()
+
+    def ping(self):
+        self._channel.flow(True)
+
+    def qos(self, prefetch_count):
+        self._channel.basic_qos(prefetch_size=0, prefetch_count=prefetch_count,
+                                a_global=False)
+
+    def declare_exchange(self, exchange, type, durable=True, auto_delete=False):
+        self._channel.exchange_declare(exchange=exchange, type=type,
+                                       durable=durable, auto_delete=auto_delete)
+
+    def declare_queue(self, queue='', durable=True, exclusive=False, auto_delete=False):
+        queue, _, _ = self._channel.queue_declare(queue=queue, durable=durable,
+                                                  exclusive=exclusive,
+                                                  auto_delete=auto_delete)
+        return queue
+
+    def bind_queue(self, queue, exchange, routing_key):
+        try:
+            self._channel.queue_bind(queue=queue, exchange=exchange,
+                                     routing_key=routing_key)
+        except amqp.exceptions.AMQPChannelException as exc:
+            if exc.amqp_reply_code != 404:
+                raise
+            raise NotFoundError(str(exc))
+
+    def consume(self, queue, callback, no_ack=False, consumer_tag=None):
+        self._channel.basic_consume(queue=queue, no_ack=no_ack, callback=callback,
+                                    consumer_tag=consumer_tag or '')
+
+    def cancel(self, consumer_tag):
+        if self._channel.connection:
+            self._channel.basic_cancel(consumer_tag)
+
+    def publish(self, msg, exchange, routing_key, mandatory=False, immediate=False):
+        self._channel.basic_publish(amqp.Message(msg.body, **msg.properties),
+                                    exchange=exchange,
+                                    routing_key=routing_key,
+                                    mandatory=mandatory,
+                                    immediate=immediate)
+
+    def ack(self, delivery_tag):
+        self._channel.basic_ack(delivery_tag)
+
+    def wait(self, timeout=None):
+        if self._wakeup.clear():
+            return False
+        if not self._buffered():
+            ready = select.select([self._conn.transport.sock, self._wakeup],
+                                  [], [], timeout)[0]
+            if self._wakeup in ready:
+                self._wakeup.clear()
+                return False
+            if not ready:
+                return False
+        self._channel.wait()
+        returned_messages = self._channel.returned_messages
+        while not returned_messages.empty():
+            reply_code, reply_text, exchange, routing_key, message = returned_messages.get()
+            if self.return_callback is not None:
+                exc = amqp.exceptions.AMQPChannelException(reply_code, reply_text,
+                                                          (exchange, routing_key))
+                self.return_callback(message, exc)
+        return True
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def _buffered(self):
+        # (is there any data already read from the socket?)
+        return bool(self._channel.method_queue
+                    or not self._conn.method_reader.queue.empty()
+                    or getattr(self._conn.transport, '_read_buffer', None))
+
+
+#
+# In-process (loopback) broker
+
+class _LoopbackQueue(object):
+
+    def __init__(self, name, owner, auto_delete):
+        self.name = name
+        self.owner = owner  # (a transport -- for exclusive queues)
+        self.auto_delete = auto_delete
+        self.messages = collections.deque()  # (exchange, routing key, Message)
+        self.consumers = []
+
+
+class _LoopbackConsumer(object):
+
+    def __init__(self, transport, tag, queue, callback, no_ack):
+        self.transport = transport
+        self.tag = tag
+        self.queue = queue
+        self.callback = callback
+        self.no_ack = no_ack
+
+    def can_take(self):
+        transport = self.transport
+        return (self.no_ack or not transport._prefetch_count
+                or len(transport._unacked) < transport._prefetch_count)
+
+
+class _LoopbackBroker(object):
+
+    """Auxiliary class: exchanges and queues of one loopback virtual host
+
+    (all state is guarded by the `lock').
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.exchanges = {}  # maps names to (type, list of (routing key, queue))
+        self.queues = {}  # maps names to _LoopbackQueue instances
+        self._queue_counter = itertools.count(1)
+
+    def new_queue_name(self, prefix='loopback.gen-'):
+        return '{0}{1}'.format(prefix, next(self._queue_counter))
+
+    def publish(self, msg, exchange, routing_key, mandatory=False, immediate=False):
+
+        """Route the message to queues, dispatch them
+
+        Return None or -- if the message is to be returned -- a pair:
+        (<reply code>, <reply text>).
+
+        """
+
+        queues = self.route(exchange, routing_key)
+        if mandatory and not queues:
+            return 312, 'NO_ROUTE'
+        if immediate and not any(queue.consumers for queue in queues):
+            return 313, 'NO_CONSUMERS'
+        for queue in queues:
+            queue.messages.append((exchange, routing_key, msg))
+            self.dispatch(queue)
+
+    def route(self, exchange, routing_key):
+        if exchange == '':
+            queue = self.queues.get(routing_key)
+            return [queue] if queue is not None else []
+        try:
+            exchange_type, bindings = self.exchanges[exchange]
+        except KeyError:
+            raise NotFoundError('No exchange {0!r}'.format(exchange))
+        queues = []
+        for binding_rk, queue in bindings:
+            if ((exchange_type == 'fanout')
+                  or (exchange_type == 'topic' and _topic_match(binding_rk, routing_key))
+                  or binding_rk == routing_key):
+                if queue not in queues:
+                    queues.append(queue)
+        return queues
+
+    def dispatch(self, queue):
+        "Deliver messages of the queue to its consumers (if they can take them)"
+        consumers = queue.consumers
+        while queue.messages and consumers:
+            for i, consumer in enumerate(consumers):
+                if consumer.can_take():
+                    break
+            else:
+                return
+            # (round robin: the consumer goes to the end)
+            consumers.append(consumers.pop(i))
+            exchange, routing_key, msg = queue.messages.popleft()
+            consumer.transport._deliver(consumer, exchange, routing_key, msg)
+
+    def delete_queue(self, queue):
+        if self.queues.get(queue.name) is queue:
+            del self.queues[queue.name]
+        for _, bindings in self.exchanges.itervalues():
+            bindings[:] = [(rk, q) for rk, q in bindings if q is not queue]
+
+
+def _topic_match(pattern, routing_key):
+    return _topic_words_match(pattern.split('.'), routing_key.split('.'))
+
+
+def _topic_words_match(pattern_words, key_words):
+    if not pattern_words:
+        return not key_words
+    first = pattern_words[0]
+    if first == '#':
+        return any(_topic_words_match(pattern_words[1:], key_words[i:])
+                   for i in xrange(len(key_words) + 1))
+    if not key_words or (first != '*' and first != key_words[0]):
+        return False
+    return _topic_words_match(pattern_words[1:], key_words[1:])
+
+
+_loopback_brokers = {}  # maps virtual host names to _LoopbackBroker instances
+_loopback_brokers_lock = threading.Lock()
+
+
+class LoopbackTransport(Transport):
+
+    """In-process transport: an in-memory broker shared within the process"""
+
+    def __init__(self, **params):
+        super(LoopbackTransport, self).__init__(**params)
+        self.broker_id = ('loopback', params.get('virtual_host', '/'))
+        self._broker = None
+        self._connected = False
+        self._wakeup = _Wakeup()  # (pending if there are items in the inbox)
+        self._woken = False
+
+    def connect(self):
+        self._broker = self._acquire_broker()
+        self._consumers = {}  # maps tags to _LoopbackConsumer instances
+        self._unacked = {}  # maps delivery tags to (queue, exchange, rk, Message)
+        self._delivery_tag_gen = itertools.count(1)
+        self._prefetch_count = 0
+        self._inbox = collections.deque()  # (consumer or None, Message, exc)
+        self._direct_reply_to = None  # (the "direct reply-to" queue name)
+        self._wakeup.open()
+        self._connected = True
+
+    def close(self):
+        if not self._connected:
+            return
+        with self._broker.lock:
+            self._connected = False
+            self._reset_channel()
+            for queue in self._broker.queues.values():
+                if queue.owner is self:
+                    self._broker.delete_queue(queue)
+        self._wakeup.close()
+        self._release_broker()
+
+    def reopen(self):
+        self._check_connected()
+        with self._broker.lock:
+            self._reset_channel()
+
+    def ping(self):
+        self._check_connected()
+
+    def qos(self, prefetch_count):
+        self._check_connected()
+        self._prefetch_count = prefetch_count
+
+    def declare_exchange(self, exchange, type, durable=True, auto_delete=False):
+        self._check_connected()
+        with self._broker.lock:
+            self._broker.exchanges.setdefault(exchange, (type, []))
+
+    def declare_queue(self, queue='', durable=True, exclusive=False, auto_delete=False):
+        self._check_connected()
+        broker = self._broker
+        with broker.lock:
+            if not queue:
+                queue = broker.new_queue_name()
+            existing = broker.queues.get(queue)
+            if existing is None:
+                broker.queues[queue] = _LoopbackQueue(queue, self if exclusive else None,
+                                                      auto_delete)
+            elif existing.owner is not None and existing.owner is not self:
+                raise TransportError('Queue {0!r} is exclusive to another '
+                                     'connection'.format(queue))
+        return queue
+
+    def bind_queue(self, queue, exchange, routing_key):
+        self._check_connected()
+        broker = self._broker
+        with broker.lock:
+            if exchange not in broker.exchanges:
+                raise NotFoundError('No exchange {0!r}'.format(exchange))
+            if queue not in broker.queues:
+                raise NotFoundError('No queue {0!r}'.format(queue))
+            bindings = broker.exchanges[exchange][1]
+            binding = (routing_key, broker.queues[queue])
+            if binding not in bindings:
+                bindings.append(binding)
+
+    def consume(self, queue, callback, no_ack=False, consumer_tag=None):
+        self._check_connected()
+        broker = self._broker
+        with broker.lock:
+            if queue == DIRECT_REPLY_TO_QUEUE:
+                if self._direct_reply_to is None:
+                    self._direct_reply_to = broker.new_queue_name(DIRECT_REPLY_TO_QUEUE + '.')
+                    broker.queues[self._direct_reply_to] = _LoopbackQueue(
+                            self._direct_reply_to, self, False)
+                queue = self._direct_reply_to
+            if queue not in broker.queues:
+                raise NotFoundError('No queue {0!r}'.format(queue))
+            if not consumer_tag:
+                consumer_tag = broker.new_queue_name('loopback.ctag-')
+            consumer = _LoopbackConsumer(self, consumer_tag, broker.queues[queue],
+                                         callback, no_ack)
+            self._consumers[consumer_tag] = consumer
+            consumer.queue.consumers.append(consumer)
+            broker.dispatch(consumer.queue)
+        return consumer_tag
+
+    def cancel(self, consumer_tag):
+        self._check_connected()
+        with self._broker.lock:
+            self._cancel(consumer_tag)
+
+    def publish(self, msg, exchange, routing_key, mandatory=False, immediate=False):
+        self._check_connected()
+        if (self._direct_reply_to is not None
+              and msg.properties.get('reply_to') == DIRECT_REPLY_TO_QUEUE):
+            properties = dict(msg.properties, reply_to=self._direct_reply_to)
+            msg = Message(msg.body, **properties)
+        with self._broker.lock:
+            returned = self._broker.publish(msg, exchange, routing_key,
+                                            mandatory, immediate)
+            if returned is not None:
+                reply_code, reply_text = returned
+                self._put_returned(msg, reply_code, reply_text, exchange, routing_key)
+
+    def ack(self, delivery_tag):
+        self._check_connected()
+        broker = self._broker
+        with broker.lock:
+            if self._unacked.pop(delivery_tag, None) is None:
+                raise TransportError('Unknown delivery tag: {0!r}'.format(delivery_tag))
+            if self._prefetch_count:
+                for consumer in self._consumers.values():
+                    broker.dispatch(consumer.queue)
+
+    def wait(self, timeout=None):
+        self._check_connected()
+        lock = self._broker.lock
+        deadline = None if timeout is None else time.time() + timeout
+        dispatched = False
+        while True:
+            with lock:
+                if self._inbox:
+                    consumer, msg, exc = self._inbox.popleft()
+                else:
+                    self._wakeup.clear()
+                    if dispatched or self._woken:
+                        self._woken = False
+                        return dispatched
+                    consumer = msg = None
+            if consumer is not None:
+                consumer.callback(msg)
+                dispatched = True
+            elif msg is not None:
+                if self.return_callback is not None:
+                    self.return_callback(msg, exc)
+                dispatched = True
+            else:
+                remaining = None if deadline is None else max(deadline - time.time(), 0)
+                if not select.select([self._wakeup], [], [], remaining)[0]:
+                    return False
+
+    def wakeup(self):
+        if self._broker is None:
+            self._woken = True
+            return
+        with self._broker.lock:
+            self._woken = True
+            self._wakeup.set()
+
+    def _acquire_broker(self):
+        # (the broker of the virtual host; created if needed)
+        virtual_host = self.broker_id[1]
+        with _loopback_brokers_lock:
+            broker = _loopback_brokers.get(virtual_host)
+            if broker is None:
+                broker = _loopback_brokers[virtual_host] = _LoopbackBroker()
+        return broker
+
+    def _release_broker(self):
+        # (virtual host brokers live as long as the process)
+        pass
+
+    def _check_connected(self):
+        if not self._connected:
+            raise TransportError('{0!r} is not connected'.format(self))
+
+    # (the methods below are to be called with the broker lock held)
+
+    def _deliver(self, consumer, exchange, routing_key, msg):
+        delivered = Message(msg.body, **msg.properties)
+        delivery_tag = next(self._delivery_tag_gen)
+        delivered.delivery_info = dict(consumer_tag=consumer.tag,
+                                       delivery_tag=delivery_tag,
+                                       redelivered=False,
+                                       exchange=exchange,
+                                       routing_key=routing_key)
+        if not consumer.no_ack:
+            self._unacked[delivery_tag] = (consumer.queue, exchange, routing_key, msg)
+        self._inbox.append((consumer, delivered, None))
+        self._wakeup.set()
+
+    def _put_returned(self, msg, reply_code, reply_text, exchange, routing_key):
+        exc = MessageReturnedError(reply_code, reply_text, exchange, routing_key)
+        self._inbox.append((None, msg, exc))
+        self._wakeup.set()
+
+    def _reset_channel(self):
+        # (as if the channel was closed: consumers cancelled, unacknowledged
+        # messages requeued, prefetch count reset)
+        for consumer_tag in self._consumers.keys():
+            self._cancel(consumer_tag)
+        self._requeue(self._unacked.keys())
+        self._inbox.clear()
+        self._prefetch_count = 0
+
+    def _cancel(self, consumer_tag):
+        consumer = self._consumers.pop(consumer_tag, None)
+        if consumer is None:
+            return
+        queue = consumer.queue
+        queue.consumers.remove(consumer)
+        # messages delivered to the consumer but not dispatched yet go back
+        undispatched = [delivered for c, delivered, _ in self._inbox if c is consumer]
+        if undispatched:
+            self._inbox = collections.deque(item for item in self._inbox
+                                            if item[0] is not consumer)
+            self._requeue([delivered.delivery_info['delivery_tag']
+                           for delivered in undispatched])
+        if queue.auto_delete and not queue.consumers:
+            self._broker.delete_queue(queue)
+        else:
+            self._broker.dispatch(queue)
+
+    def _requeue(self, delivery_tags):
+        requeued = set()
+        for delivery_tag in sorted(delivery_tags, reverse=True):
+            entry = self._unacked.pop(delivery_tag, None)
+            if entry is not None:
+                queue, exchange, routing_key, msg = entry
+                queue.messages.appendleft((exchange, routing_key, msg))
+                requeued.add(queue)
+        for queue in requeued:
+            self._broker.dispatch(queue)
@@ -10,6 +10,8 @@ import logging.handlers
 from repr import Repr
 import socket
 import sys
+import threading
+from collections import Iterator, OrderedDict
 from mtrpc.common.const import RPC_LOG, RPC_LOG_HANDLERS, DEFAULT_LOG_HANDLER_SETTINGS
 
 #
@@ -125,6 +127,88 @@ def setkeepalives(sck, enabled=True, keepcnt=5, keepintvl=120, keepidle=300):
         sck.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 0)
 
 
+class LRUCache(object):
+
+    """A thread-safe mapping of up to `max_size' most recently used items"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value  # (now the most recently used)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+def parallel_map(func, items, parallelism=1):
+    """Return [func(item) for item in items], computed by up to N threads
+
+    The current thread is one of them (so parallelism=1 means plain
+    sequential computing). func() should not raise exceptions (if it
+    does, the first one is re-raised after all threads complete).
+
+    """
+
+    items = list(items)
+    results = [None] * len(items)
+    indexes = iter(xrange(len(items)))  # (shared by the threads)
+    lock = threading.Lock()
+    exc_infos = []
+
+    def work():
+        while True:
+            with lock:
+                i = next(indexes, None)
+            if i is None or exc_infos:
+                return
+            try:
+                results[i] = func(items[i])
+            except Exception:
+                exc_infos.append(sys.exc_info())
+
+    helpers = [threading.Thread(target=work, name='{0}/helper-{1}'.format(
+                                    threading.current_thread().name, i))
+               for i in xrange(1, min(parallelism, len(items)))]
+    for thread in helpers:
+        thread.daemon = True
+        thread.start()
+    work()
+    for thread in helpers:
+        thread.join()
+    if exc_infos:
+        exc_info = exc_infos[0]
+        raise exc_info[0], exc_info[1], exc_info[2]
+    return results
+
+
+def materialize(result):
+    """Turn an iterator (e.g. a generator) result into a list
+
+    (Other objects are returned unchanged.)
+
+    """
+
+    if isinstance(result, Iterator):
+        return list(result)
+    return result
+
+
 def log_repr(result):
     r = Repr()
     r.maxstring = 60
@@ -0,0 +1,361 @@
+# mtrpc/loopback_client.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""MegiTeam-RPC (MTRPC) framework -- the client part: loopback RPC-proxy.
+
+LoopbackMTRPCProxy calls RPC-methods of an RPC-tree loaded in the same
+process -- with no AMQP broker (and no server threads) involved. It is
+intended for co-located services and for tests:
+
+    from mtrpc.loopback_client import LoopbackMTRPCProxy
+    from mtrpc.server.methodtree import RPCTree
+
+    rpc_tree = RPCTree.load(config_dict, 'server')
+    with LoopbackMTRPCProxy(rpc_tree) as rpc:
+        add_result = rpc.my_module.add(1, 2)   # -> 3
+
+Requests are executed the way the server does it (by RPCTaskThread
+methods: deserialization, obtaining and authorizing the RPC-method,
+error formatting, streaming, spilling...), and responses are handled the
+way MTRPCProxy does it (errors are re-raised with _raise_received_error()
+etc.). The access dict (used for authorization) is synthetic: as if
+the request came via the `req_exchange' exchange (default: 'loopback')
+and a queue bound with the `binding_rk' routing key (default: '#'),
+see: mtrpc.server.threads.RPCManager.create_access_dict().
+
+By default requests and responses are serialized (round-tripped through
+the JSON codec), exactly as when sent via the broker -- so results and
+errors are the same as with MTRPCProxy. With `round_trip=False' the
+arguments and results of calls (not of batches or notifications) are
+passed as they are -- faster, but possibly different (e.g. tuples are
+not turned into lists; iterator results are turned into lists instead
+of being streamed; results are never spilled).
+
+Synchronous calls without timeout are executed in the calling thread;
+other calls (asynchronous ones, calls with timeouts, notifications) are
+executed by the proxy's pool of worker threads.
+
+LoopbackMTRPCProxy takes the same arguments as MTRPCProxy (see:
+MTRPCProxy.__init__() documentation; AMQP-related ones are ignored)
+preceded by `rpc_tree' (an RPCTree instance) plus optional keyword
+arguments:
+
+* round_trip (bool) -- see above (default: True);
+
+* workers (int) -- number of worker threads (default: 4);
+
+* binding_rk (str) -- see above (default: '#');
+
+* manager_attributes (dict or None) -- RPCManager attributes used to
+  execute requests: `batch_parallelism', `stream_chunk_size' and
+  `spill_threshold' (default: None => RPCManager class defaults);
+
+* server_log (logging.Logger instance or str) -- logger (or its name)
+  to be used as the server log (default: 'mtrpc.loopback.server').
+
+(To run the actual server threads in the same process as their clients,
+use the 'loopback' transport instead -- see: mtrpc.common.transport.)
+
+"""
+
+
+
+import functools
+import heapq
+import itertools
+import logging
+import Queue
+import threading
+
+from .client import MTRPCProxy, Response
+from .common import errors
+from .common import utils
+from .server import threads
+
+
+
+#
+# Auxiliary classes
+#
+
+class _LoopbackMessage(object):
+
+    """Auxiliary class: a response message (only its body is needed)"""
+
+    __slots__ = ('body',)
+
+    def __init__(self, body):
+        self.body = body
+
+
+class _LoopbackResultFifo(object):
+
+    """Auxiliary class: takes task results instead of the server result fifo"""
+
+    def __init__(self, rpc_proxy):
+        self._rpc_proxy = rpc_proxy
+
+    def put(self, result):
+        if not isinstance(result, threads.NoResult):
+            self._rpc_proxy._store_response(_LoopbackMessage(result.response_message))
+        if isinstance(result, threads.PartialResult):
+            result.sent.set()
+
+
+class _LoopbackWorkers(object):
+
+    """Auxiliary class: a pool of threads executing loopback requests"""
+
+    def __init__(self, size, log):
+        self._size = size
+        self._log = log
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, func):
+        with self._lock:
+            while len(self._threads) < self._size:
+                thread = threading.Thread(target=self._work,
+                                          name='LoopbackWorker-{0}'.format(len(self._threads) + 1))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        self._queue.put(func)
+
+    def stop(self):
+        with self._lock:
+            workers, self._threads = self._threads, []
+        for _ in workers:
+            self._queue.put(None)
+        for thread in workers:
+            thread.join()
+
+    def _work(self):
+        while True:
+            func = self._queue.get()
+            if func is None:
+                break
+            try:
+                func()
+            except Exception:
+                self._log.error('Error in loopback worker:', exc_info=True)
+
+
+class _DeadlineWatcher(threading.Thread):
+
+    """Auxiliary background thread: expires overdue calls of a loopback proxy"""
+
+    max_wait = 60
+
+    def __init__(self, rpc_proxy):
+        threading.Thread.__init__(self, name='LoopbackMTRPCProxy-DeadlineWatcher')
+        self.daemon = True
+        self._rpc_proxy = rpc_proxy
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+    def run(self):
+        while True:
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            next_deadline_in = self._rpc_proxy._expire_pending()
+            self._wakeup.wait(self.max_wait if next_deadline_in is None
+                              else next_deadline_in)
+
+    def wake(self):
+        "Make the thread recompute its wait timeout"
+        self._wakeup.set()
+
+    def stop(self):
+        "Stop the thread; to be called from another thread"
+        self._stopping = True
+        self._wakeup.set()
+        self.join()
+
+
+
+#
+# The loopback RPC-proxy class
+#
+
+class LoopbackMTRPCProxy(MTRPCProxy):
+
+    """The loopback MTRPC proxy class (see: the module documentation).
+
+    Get RPC-modules as they were LoopbackMTRPCProxy instance attributes;
+    call RPC-methods as their member functions.
+
+    """
+
+    loopback_queue = 'mtrpc.loopback'
+
+    def __init__(self, rpc_tree, *args, **kwargs):
+        "RPC-proxy initialization (see: the module documentation)"
+
+        self._rpc_tree = rpc_tree
+        self._round_trip = kwargs.pop('round_trip', True)
+        self._binding_rk = kwargs.pop('binding_rk', '#')
+        manager_attributes = kwargs.pop('manager_attributes', None) or {}
+        self._task_settings = dict(
+                (name, manager_attributes.get(name, getattr(threads.RPCManager, name)))
+                for name in ('batch_parallelism', 'stream_chunk_size', 'spill_threshold'))
+        server_log = kwargs.pop('server_log', 'mtrpc.loopback.server')
+        if isinstance(server_log, basestring):
+            server_log = logging.getLogger(server_log)
+        self._server_log = server_log
+        workers = kwargs.pop('workers', 4)
+        kwargs.setdefault('req_exchange', 'loopback')
+        self._result_fifo = _LoopbackResultFifo(self)
+        self._task_id_gen = itertools.count(1)
+        self._deadline_watcher = None
+        super(LoopbackMTRPCProxy, self).__init__(*args, **kwargs)
+        self._workers = _LoopbackWorkers(workers, self._log)
+
+    def _amqp_init(self, amqp_params):
+        # (no AMQP -- only the "reply-to queue" name, identifying the proxy)
+        self._resp_queue = '{0}.{1}'.format(self.loopback_queue, next(self._proxy_counter))
+
+    def _amqp_reopen_channel(self):
+        pass
+
+    def _is_valid(self):
+        return not self._closed
+
+    def _close(self):
+        "Close the proxy"
+        self._closed = True
+        if self._auto_batcher is not None:
+            self._auto_batcher.stop()
+        self._workers.stop()
+        if self._deadline_watcher is not None:
+            self._deadline_watcher.stop()
+            self._deadline_watcher = None
+        self._fail_pending('LoopbackMTRPCProxy instance has been closed')
+
+    def _call_and_wait(self, full_name, call_args, call_kwargs, exchange, custom_exceptions,
+                       timeout):
+        if self._auto_batcher is not None:
+            future = self._call_async(full_name, call_args, call_kwargs, exchange,
+                                      custom_exceptions, timeout)
+        else:
+            # (calls without timeout are executed in the calling thread)
+            inline = (timeout if timeout is not None else self._timeout) is None
+            future = self._send_request(full_name, call_args, call_kwargs, exchange,
+                                        custom_exceptions, timeout, inline=inline)
+        try:
+            return future.result()
+        except errors.RPCClientTimeoutError:
+            if self._cancel_on_timeout:
+                self._cancel(future, exchange)
+            raise
+
+    def _ensure_consumer(self):
+        # (responses are passed directly -- no consumer is needed)
+        pass
+
+    def _send_request(self, full_name, call_args, call_kwargs, exchange, custom_exceptions,
+                      timeout=None, routing_name=None, inline=False):
+
+        """Execute an RPC-request; return an RPCFuture for its response
+
+        (`inline' -- execute it in the calling thread, not by a worker).
+
+        """
+
+        future = self._new_future(full_name, call_args, call_kwargs,
+                                  custom_exceptions, timeout)
+        if self._round_trip:
+            msg = self._prepare_msg(full_name, call_args, call_kwargs,
+                                    self._resp_queue, future.call_id)
+            self._publish(msg, routing_name or full_name, exchange, [future], inline)
+        else:
+            access_dict = self._access_dict(routing_name or full_name, exchange,
+                                            self._resp_queue)
+            request = threads.RPCRequest(future.call_id, full_name,
+                                         list(call_args), dict(call_kwargs))
+            self._register(future)
+            self._execute(functools.partial(self._run_direct, request, access_dict),
+                          inline)
+        return future
+
+    def _publish(self, msg, full_name, exchange, futures, inline=False):
+
+        "Register futures as pending, execute the request message"
+
+        access_dict = self._access_dict(full_name, exchange, self._resp_queue)
+        for future in futures:
+            self._register(future)
+        self._execute(functools.partial(self._run_task, msg.body, access_dict),
+                      inline)
+
+    def _publish_notification(self, msg, full_name, exchange):
+
+        "Execute a notification message (by a worker)"
+
+        access_dict = self._access_dict(full_name, exchange,
+                                        msg.properties.get('reply_to'))
+        self._execute(functools.partial(self._run_task, msg.body, access_dict))
+
+    def _access_dict(self, full_name, exchange, reply_to):
+        if exchange is None:
+            exchange = self._req_exchange
+        routing_key = self._prepare_routing_key(full_name, exchange)
+        delivery_info = dict(consumer_tag=self.loopback_queue,
+                             delivery_tag=None,
+                             redelivered=False,
+                             exchange=exchange,
+                             routing_key=routing_key)
+        return threads.RPCManager.create_access_dict(
+                self.loopback_queue,
+                threads.BindingProps(exchange, self._binding_rk),
+                delivery_info,
+                reply_to)
+
+    def _register(self, future):
+        self._pending[future.call_id] = future
+        if future.deadline is not None:
+            with self._deadlines_lock:
+                if self._deadline_watcher is None:
+                    self._deadline_watcher = _DeadlineWatcher(self)
+                    self._deadline_watcher.start()
+                heapq.heappush(self._deadlines, (future.deadline, future.call_id))
+                earliest = self._deadlines[0][1] == future.call_id
+            if earliest:
+                self._deadline_watcher.wake()
+
+    def _execute(self, func, inline=False):
+        if self._closed:
+            raise errors.RPCClientError('LoopbackMTRPCProxy instance is already closed')
+        if inline:
+            func()
+        else:
+            self._workers.submit(func)
+
+    def _new_task_thread(self, request_message, access_dict):
+        task = threads.Task(next(self._task_id_gen),
+                            request_message=request_message,
+                            access_dict=access_dict,
+                            reply_to=access_dict['reply_to'])
+        return threads.RPCTaskThread(task, self._rpc_tree, self._result_fifo,
+                                     self._server_log, **self._task_settings)
+
+    def _run_task(self, request_message, access_dict):
+        # (the task thread object is not started -- its activity is
+        # executed by the current thread)
+        self._new_task_thread(request_message, access_dict).run()
+
+    def _run_direct(self, request, access_dict):
+        task_thread = self._new_task_thread(None, access_dict)
+        try:
+            rpc_method = task_thread.obtain_rpc_method(request, task_thread.task)
+            result = utils.materialize(task_thread.call_rpc_method(request, rpc_method,
+                                                                   task_thread.task))
+        except Exception:
+            self._server_log.error('Error in RPC call:', exc_info=True)
+            response = Response(None, task_thread.format_exception(), request.id)
+        else:
+            response = Response(result, None, request.id)
+        self._complete_call(response)
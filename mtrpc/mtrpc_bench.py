@@ -0,0 +1,512 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""mtrpc-bench -- a load generator for MTRPC servers.
+
+Unlike mtrpc-request (one call per process), it drives calls described
+by a workload spec through N concurrent clients for a given duration
+and reports -- per method and in total -- throughput, error rates and
+call latency percentiles (as text and, optionally, as JSON), e.g.:
+
+    mtrpc-bench -c 16 -d 30 bench.echo '"x"'
+    mtrpc-bench -f workload.json --json results.json
+    mtrpc-bench -f workload.json --http http://127.0.0.1:5000
+
+The target is the AMQP server (clients are MTRPCProxy instances; the
+options are the same as mtrpc-request's, other MTRPCProxy arguments --
+e.g. another transport -- can be given with -P NAME=VALUE) or -- with --http -- the HTTP
+frontend (clients POST keyword arguments as JSON to /call/...; positional
+arguments cannot be passed that way).
+
+A workload spec is a JSON file, e.g.:
+
+    {
+        "concurrency": 8,       # number of concurrent clients
+        "rate": null,           # target rate (calls/s, in total) or null
+        "duration": 30,         # measured time (in seconds)
+        "warmup": 2,            # not measured time before it
+        "timeout": 10,          # call timeout (in seconds) or null
+        "target": {},           # (optional) additional MTRPCProxy kwargs
+        "methods": [
+            {"method": "bench.echo", "args": ["x"], "weight": 3},
+            {"method": "users.get", "kwargs": {"user_id": "{randint:1:1000}"},
+             "weight": 1}
+        ]
+    }
+
+(all items but "methods" are optional; command line options override
+them; without -f, the workload is the method and args given in the
+command line). Each call is made to a method drawn at random according
+to the weights (the mix ratios). Strings in args and kwargs can contain
+placeholders, substituted for each call:
+
+* {client} -- number of the client (0...concurrency-1),
+* {seq} -- number of the call made by the client,
+* {randint:A:B} -- a random integer N, such that A <= N <= B,
+* {choice:X|Y|...} -- one of the given values (JSON-decoded if possible),
+* {randstr:N} -- a random string of N lowercase letters;
+
+a string being just one placeholder is replaced with the value itself
+(e.g. an int), not with its text.
+
+Without a rate, each client makes calls one after another as fast as it
+can (a closed loop); with a rate, calls are scheduled at regular
+intervals and their latencies are counted from the scheduled time (so
+that a stalled server is not hidden by clients waiting for it).
+
+"""
+
+import collections
+import httplib
+import logging
+import random
+import re
+import string
+import sys
+import threading
+import time
+import urlparse
+from optparse import OptionParser
+
+from mtrpc.client import MTRPCProxy
+from mtrpc.common import encoding
+from mtrpc.common import utils
+from mtrpc.mtrpc_request import decode_arg, add_proxy_options
+
+WORKLOAD_DEFAULTS = {
+    'concurrency': 1,
+    'rate': None,
+    'duration': 10,
+    'warmup': 1,
+    'timeout': 10,
+    'target': {},
+}
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+#
+# Workload specs
+
+_placeholder_regex = re.compile(r'\{(client|seq|randint|choice|randstr)(?::([^}]*))?\}')
+
+
+def _placeholder_value(name, arg, rng, context):
+    if name in ('client', 'seq'):
+        return context[name]
+    if name == 'randint':
+        low, high = arg.split(':')
+        return rng.randint(int(low), int(high))
+    if name == 'choice':
+        return decode_arg(rng.choice(arg.split('|')))
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in xrange(int(arg)))
+
+
+def render(template, rng, context):
+    "Substitute placeholders in strings in the template (args or kwargs)"
+    if isinstance(template, basestring):
+        match = _placeholder_regex.match(template)
+        if match is not None and match.end() == len(template):
+            return _placeholder_value(match.group(1), match.group(2), rng, context)
+        if '{' not in template:
+            return template
+        return _placeholder_regex.sub(
+                lambda m: unicode(_placeholder_value(m.group(1), m.group(2), rng, context)),
+                template)
+    if isinstance(template, list):
+        return [render(item, rng, context) for item in template]
+    if isinstance(template, dict):
+        return dict((key, render(value, rng, context))
+                    for key, value in template.iteritems())
+    return template
+
+
+class Workload(object):
+
+    """A workload spec: the method mix and the run settings"""
+
+    def __init__(self, spec):
+        settings = dict(WORKLOAD_DEFAULTS)
+        settings.update(spec)
+        unknown = set(settings) - set(WORKLOAD_DEFAULTS) - set(['methods'])
+        if unknown:
+            raise ValueError('Unknown workload spec items: {0}'
+                             .format(', '.join(sorted(unknown))))
+        self.concurrency = int(settings['concurrency'])
+        self.rate = float(settings['rate']) if settings['rate'] else None
+        self.duration = float(settings['duration'])
+        self.warmup = float(settings['warmup'] or 0)
+        self.timeout = float(settings['timeout']) if settings['timeout'] else None
+        self.target = dict(settings['target'])
+        self.methods = []
+        for method_spec in settings.get('methods') or ():
+            if 'method' not in method_spec:
+                raise ValueError('Workload method spec without "method": {0!r}'
+                                 .format(method_spec))
+            self.methods.append((str(method_spec['method']),
+                                 list(method_spec.get('args', [])),
+                                 dict(method_spec.get('kwargs', {})),
+                                 float(method_spec.get('weight', 1))))
+        if not self.methods:
+            raise ValueError('No methods in the workload spec')
+        if self.concurrency < 1 or self.duration <= 0:
+            raise ValueError('Concurrency and duration must be positive')
+        self._cum_weights = []
+        total = 0.0
+        for _, _, _, weight in self.methods:
+            total += weight
+            self._cum_weights.append(total)
+        if total <= 0:
+            raise ValueError('Method weights must not all be zero')
+
+    def pick(self, rng, context):
+        "Draw a call: return (<method name>, <args list>, <kwargs dict>)"
+        point = rng.random() * self._cum_weights[-1]
+        for (method, args, kwargs, _), cum_weight in zip(self.methods, self._cum_weights):
+            if point < cum_weight:
+                break
+        return method, render(args, rng, context), render(kwargs, rng, context)
+
+
+#
+# Targets (each one makes clients: callables taking method, args, kwargs)
+
+class AMQPTarget(object):
+
+    """Calls are made by MTRPCProxy instances (one per client)"""
+
+    def __init__(self, proxy_kwargs, timeout):
+        self.proxy_kwargs = proxy_kwargs
+        self.timeout = timeout
+        self.description = 'AMQP server (exchange: {0})'.format(
+                proxy_kwargs.get('req_exchange'))
+
+    def check(self, workload):
+        pass
+
+    def client(self):
+        rpc = MTRPCProxy(**self.proxy_kwargs)
+        timeout = self.timeout
+
+        def call(method, args, kwargs):
+            return utils.materialize(rpc._call(method, args, kwargs, timeout=timeout))
+
+        call.close = rpc._close
+        return call
+
+
+class HTTPError(Exception):
+    """Error response of the HTTP frontend"""
+
+
+class HTTPTarget(object):
+
+    """Calls are POST requests to the HTTP frontend (one connection per client)"""
+
+    def __init__(self, url, token=None, timeout=None):
+        parsed = urlparse.urlsplit(url)
+        if parsed.scheme not in ('http', 'https'):
+            raise ValueError('Bad HTTP frontend URL: {0!r}'.format(url))
+        self.connection_class = (httplib.HTTPSConnection if parsed.scheme == 'https'
+                                 else httplib.HTTPConnection)
+        self.netloc = parsed.netloc
+        self.path_prefix = parsed.path.rstrip('/') + '/call/'
+        self.headers = {'Content-Type': 'application/json'}
+        if token is not None:
+            self.headers['X-Auth-Token'] = token
+        self.timeout = timeout
+        self.description = 'HTTP frontend ({0})'.format(url)
+
+    def check(self, workload):
+        for method, args, _, _ in workload.methods:
+            if args:
+                raise ValueError('The HTTP frontend takes keyword arguments only '
+                                 '(method {0} has positional ones)'.format(method))
+
+    def client(self):
+        connection = self.connection_class(self.netloc, timeout=self.timeout)
+
+        def call(method, args, kwargs):
+            try:
+                connection.request('POST', self.path_prefix + method.replace('.', '/'),
+                                   encoding.dumps(kwargs), self.headers)
+                response = connection.getresponse()
+                body = response.read()
+            except Exception:
+                connection.close()  # (will be reconnected with the next request)
+                raise
+            if response.status != 200:
+                raise HTTPError('HTTP {0}'.format(response.status))
+            return encoding.loads(body)['response']
+
+        call.close = connection.close
+        return call
+
+
+#
+# Running and reporting
+
+class _Pacer(object):
+
+    """Auxiliary class: schedules calls of all clients at the target rate"""
+
+    def __init__(self, start, rate):
+        self._start = start
+        self._interval = 1.0 / rate
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def next_slot(self):
+        with self._lock:
+            slot = self._start + self._count * self._interval
+            self._count += 1
+        return slot
+
+
+def error_name(exc):
+    if isinstance(exc, HTTPError):
+        return str(exc)
+    return exc.__class__.__name__
+
+
+def run(workload, target, seed=None):
+
+    """Run the workload against the target
+
+    Return a dict: {<method name>: (<sorted latencies list>,
+    <Counter of error names>)} and the measured time (in seconds).
+
+    """
+
+    target.check(workload)
+    clients = []
+    try:
+        for _ in xrange(workload.concurrency):
+            clients.append(target.client())
+    except Exception:
+        for call in clients:
+            call.close()
+        raise
+
+    start = time.time() + 0.1  # (let all threads get ready)
+    measure_from = start + workload.warmup
+    deadline = measure_from + workload.duration
+    pacer = _Pacer(start, workload.rate) if workload.rate else None
+    thread_stats = []
+
+    def work(client_no, call):
+        rng = random.Random(None if seed is None else (seed, client_no))
+        context = {'client': client_no, 'seq': 0}
+        latencies = collections.defaultdict(list)
+        errors = collections.defaultdict(collections.Counter)
+        thread_stats.append((latencies, errors))
+        now = time.time()
+        if now < start:
+            time.sleep(start - now)
+        while True:
+            if pacer is not None:
+                scheduled = pacer.next_slot()
+                now = time.time()
+                if scheduled > now:
+                    time.sleep(scheduled - now)
+            else:
+                scheduled = time.time()
+            if scheduled >= deadline:
+                break
+            method, args, kwargs = workload.pick(rng, context)
+            context['seq'] += 1
+            try:
+                call(method, args, kwargs)
+            except Exception as exc:
+                error = error_name(exc)
+            else:
+                error = None
+            if scheduled >= measure_from:
+                latencies[method].append(time.time() - scheduled)
+                if error is not None:
+                    errors[method][error] += 1
+
+    threads = [threading.Thread(target=work, args=(client_no, call),
+                                name='mtrpc-bench-{0}'.format(client_no))
+               for client_no, call in enumerate(clients)]
+    try:
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for call in clients:
+            call.close()
+
+    results = {}
+    for latencies, errors in thread_stats:
+        for method, method_latencies in latencies.iteritems():
+            result = results.setdefault(method, ([], collections.Counter()))
+            result[0].extend(method_latencies)
+            result[1].update(errors[method])
+    for method_latencies, _ in results.itervalues():
+        method_latencies.sort()
+    return results, min(time.time(), deadline) - measure_from
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[int(round((len(sorted_values) - 1) * fraction))]
+
+
+def summarize_method(latencies, errors, elapsed):
+
+    """Make the summary dict of calls of a method (or of all calls)
+
+    `latencies' -- sorted list of call latencies (in seconds), `errors'
+    -- Counter of error names, `elapsed' -- measured time (in seconds).
+
+    """
+
+    calls = len(latencies)
+    error_count = sum(errors.itervalues())
+    summary = {
+        'calls': calls,
+        'errors': error_count,
+        'error_rate': float(error_count) / calls if calls else 0.0,
+        'calls_per_sec': calls / elapsed if elapsed > 0 else 0.0,
+        'error_types': dict(errors),
+        'latency_ms': {},
+    }
+    if calls:
+        latency_ms = summary['latency_ms']
+        for fraction in PERCENTILES:
+            latency_ms['p{0:g}'.format(fraction * 100)] = percentile(latencies, fraction) * 1000
+        latency_ms['max'] = latencies[-1] * 1000
+        latency_ms['mean'] = sum(latencies) / calls * 1000
+    return summary
+
+
+def summarize(results, elapsed, workload, target):
+    "Make the report dict (it is what --json dumps)"
+    all_latencies = sorted(latency for latencies, _ in results.itervalues()
+                           for latency in latencies)
+    all_errors = collections.Counter()
+    for _, errors in results.itervalues():
+        all_errors.update(errors)
+    return {
+        'target': target.description,
+        'concurrency': workload.concurrency,
+        'rate': workload.rate,
+        'duration': elapsed,
+        'warmup': workload.warmup,
+        'methods': dict((method, summarize_method(latencies, errors, elapsed))
+                        for method, (latencies, errors) in results.iteritems()),
+        'total': summarize_method(all_latencies, all_errors, elapsed),
+    }
+
+
+def format_report(report):
+    lines = ['target: {0}; concurrency: {1}; rate: {2}; measured: {3:.1f}s '
+             '(after {4:g}s of warmup)'.format(
+                     report['target'], report['concurrency'],
+                     '{0:g} calls/s'.format(report['rate']) if report['rate'] else 'unlimited',
+                     report['duration'], report['warmup'])]
+    lines.extend(format_method_table(report['methods'], report['total']))
+    return '\n'.join(lines)
+
+
+def format_method_table(methods, total):
+    "Format summaries of methods (and the total one) as lines of a table"
+    lines = []
+    columns = ['p{0:g}'.format(fraction * 100) for fraction in PERCENTILES] + ['max']
+    lines.append('{0:<32} {1:>8} {2:>7} {3:>7} {4:>9} '.format(
+            'method', 'calls', 'errors', 'err %', 'calls/s')
+        + ' '.join('{0:>9}'.format(column + ' ms') for column in columns))
+    rows = sorted(methods.iteritems()) + [('TOTAL', total)]
+    for method, summary in rows:
+        latency_ms = summary['latency_ms']
+        lines.append('{0:<32} {1:>8} {2:>7} {3:>7.2f} {4:>9.1f} '.format(
+                method, summary['calls'], summary['errors'],
+                summary['error_rate'] * 100, summary['calls_per_sec'])
+            + ' '.join('{0:>9.2f}'.format(latency_ms[column]) if latency_ms
+                       else '{0:>9}'.format('-') for column in columns))
+    for method, summary in sorted(methods.iteritems()):
+        for error, count in sorted(summary['error_types'].iteritems()):
+            lines.append('  {0}: {1} x {2}'.format(method, error, count))
+    return lines
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] (-f WORKLOAD | method args...)")
+    add_proxy_options(parser)
+    parser.set_defaults(loglevel='CRITICAL')
+    parser.add_option('-f', '--workload', dest='workload', default=None, help='Workload spec (JSON file)', metavar='FILE')
+    parser.add_option('-c', '--concurrency', dest='concurrency', type='int', default=None, help='Number of concurrent clients')
+    parser.add_option('-d', '--duration', dest='duration', type='float', default=None, help='Measured time (in seconds)')
+    parser.add_option('-w', '--warmup', dest='warmup', type='float', default=None, help='Not measured time before it (in seconds)')
+    parser.add_option('-t', '--rate', dest='rate', type='float', default=None, help='Target rate (calls/s in total; default: as fast as possible)')
+    parser.add_option('-T', '--timeout', dest='timeout', type='float', default=None, help='Call timeout (in seconds)')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=None, help='Random seed (for repeatable method mixes and args)')
+    parser.add_option('-R', '--raw', dest='raw', action='store_true', help="Don't decode JSON in command line params")
+    parser.add_option('-k', '--keyword', dest='keyword', action='store_true', help='Pass NAME=VALUE command line params as keyword arguments')
+    parser.add_option('-P', '--proxy-param', dest='proxy_params', action='append', default=[], help='Additional MTRPCProxy keyword argument (e.g. transport=socket); can be repeated', metavar='NAME=VALUE')
+    parser.add_option('--http', dest='http', default=None, help='Target the HTTP frontend at the URL (e.g. http://127.0.0.1:5000) instead of the AMQP server', metavar='URL')
+    parser.add_option('--token', dest='token', default=None, help='X-Auth-Token for the HTTP frontend')
+    parser.add_option('-j', '--json', dest='json', default=None, help="Write the report as JSON to the file ('-' => stdout, instead of the text report)", metavar='FILE')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    try:
+        if o.workload is not None:
+            if a:
+                parser.error('method args cannot be given with a workload spec file')
+            with open(o.workload) as spec_file:
+                spec = encoding.loads(spec_file.read())
+        elif a:
+            args, kwargs = [], {}
+            for arg in a[1:]:
+                if o.keyword and '=' in arg:
+                    name, _, arg = arg.partition('=')
+                    kwargs[name] = arg if o.raw else decode_arg(arg)
+                else:
+                    args.append(arg if o.raw else decode_arg(arg))
+            spec = {'methods': [{'method': a[0], 'args': args, 'kwargs': kwargs}]}
+        else:
+            parser.print_help()
+            sys.exit(1)
+        for name in ('concurrency', 'duration', 'warmup', 'rate', 'timeout'):
+            if getattr(o, name) is not None:
+                spec[name] = getattr(o, name)
+        workload = Workload(spec)
+        if o.http is not None:
+            target = HTTPTarget(o.http, o.token, workload.timeout)
+        else:
+            proxy_kwargs = dict((name, getattr(o, name)) for name in (
+                    'req_exchange', 'req_rk_pattern', 'loglevel', 'host',
+                    'userid', 'password', 'reply_queue'))
+            proxy_kwargs.update(workload.target)
+            for param in o.proxy_params:
+                name, sep, value = param.partition('=')
+                if not sep:
+                    raise ValueError('Bad proxy param: {0!r} (expected NAME=VALUE)'
+                                     .format(param))
+                proxy_kwargs[name] = decode_arg(value)
+            target = AMQPTarget(proxy_kwargs, workload.timeout)
+        target.check(workload)
+    except (ValueError, EnvironmentError) as exc:
+        parser.error(str(exc))
+
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        results, elapsed = run(workload, target, o.seed)
+    except Exception:
+        logging.getLogger().error('Cannot run the workload', exc_info=True)
+        sys.exit(1)
+    report = summarize(results, elapsed, workload, target)
+    if o.json == '-':
+        print encoding.dumps(report)
+    else:
+        print format_report(report)
+        if o.json is not None:
+            with open(o.json, 'w') as json_file:
+                json_file.write(encoding.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
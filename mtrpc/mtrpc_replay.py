@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""mtrpc-replay -- re-issuing captured traffic against an MTRPC server.
+
+Requests recorded by a server (see: mtrpc.server.capture) are sent again
+-- each one with its original exchange and routing key, at its original
+time offset from the first one (or N times faster: -S N); call ids are
+replaced (responses come to the replaying proxies). As with mtrpc-bench,
+throughput, error rates and latency percentiles (counted from the
+scheduled time) are reported per method -- and also how far the replay
+lagged behind the schedule (if much, the numbers say more about the
+replaying process than about the server), e.g.:
+
+    mtrpc-replay -H rabbit:5672 -o v1.results requests.capture
+    mtrpc-replay -H rabbit:5672 -S 4 --compare v1.results requests.capture
+
+Divergence in results: with -o, a digest of the result (or the name of
+the error) of each call is saved; with --compare, they are compared with
+those saved by an earlier replay of the same capture (e.g. against the
+previous release) -- and the number of calls with different outcomes is
+reported per method (together with some examples: numbers of the
+capture records and the outcomes).
+
+Notifications are sent too (but there is nothing to measure); a batch
+is measured as one call (named "batch:" + the name of its first method)
+completed when all its responses have come. Streamed results are read
+to the end and spilled results are fetched (with the -r routing key
+pattern) before their digests are computed.
+
+"""
+
+import collections
+import hashlib
+import itertools
+import logging
+import Queue
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+from mtrpc.client import MTRPCProxy, RPCResultStream, RPCSpilledResult
+from mtrpc.common import encoding
+from mtrpc.mtrpc_bench import error_name, summarize_method, format_method_table
+from mtrpc.mtrpc_request import decode_arg, add_proxy_options
+from mtrpc.server.capture import read_capture
+
+MAX_DIVERGENCE_EXAMPLES = 5
+
+
+class ReplayProxy(MTRPCProxy):
+
+    """RPC-proxy re-issuing captured request messages"""
+
+    def _replay(self, request_data, exchange, routing_key, timeout=None):
+
+        """Publish a decoded request (or batch) with new call ids
+
+        Return a list of RPCFutures (empty if only notifications are sent).
+
+        """
+
+        request_dicts = request_data if isinstance(request_data, list) else [request_data]
+        futures = []
+        for request_dict in request_dicts:
+            if request_dict.get('id') is not None:
+                future = self._new_future(request_dict.get('method'),
+                                          request_dict.get('params') or [],
+                                          request_dict.get('kwparams') or {},
+                                          None, timeout)
+                request_dict['id'] = future.call_id
+                futures.append(future)
+        if futures:
+            msg = self._make_msg(request_data, self._resp_queue, futures[0].call_id)
+        else:
+            msg = self._make_msg(request_data, None, None)
+        with self._call_lock:
+            if futures:
+                self._ensure_consumer()
+            self._publish_to(msg, exchange, routing_key, futures)
+        return futures
+
+
+def outcome_digest(result=None, exc=None):
+    "A short digest of the call outcome: of the result or of the error name"
+    if exc is not None:
+        return 'error:' + error_name(exc)
+    return hashlib.sha1(encoding.dumps(result, sort_keys=True)).hexdigest()[:16]
+
+
+def _materialize(future, exchange):
+    # (to be called not by the proxy consumer thread)
+    result = future.result()
+    if isinstance(result, RPCResultStream):
+        result = list(result)
+    elif isinstance(result, RPCSpilledResult):
+        result.exchange = exchange
+        result = result.load()
+    return result
+
+
+def replay(records, proxies, speedup=1.0, timeout=None, exchange=None):
+
+    """Replay the capture records
+
+    Return a tuple: (<dict: {<method name>: (<sorted latencies list>,
+    <Counter of error names>)}>, <dict: {<record number>: (<method
+    name>, <outcome digest>)}>, <number of notifications>, <number of
+    skipped (undecodable) records>, <replay time>, <max. lag behind the
+    schedule>).
+
+    """
+
+    completed = Queue.Queue()
+    latencies = collections.defaultdict(list)
+    errors = collections.defaultdict(collections.Counter)
+    outcomes = {}
+    notifications = skipped = 0
+    max_lag = 0.0
+    proxy_cycle = itertools.cycle(proxies)
+
+    def collect():
+        while True:
+            item = completed.get()
+            if item is None:
+                break
+            record_no, method, record_exchange, futures, scheduled, done_time = item
+            digests = []
+            exc = None
+            for future in futures:
+                try:
+                    digests.append(outcome_digest(_materialize(future, record_exchange)))
+                except Exception as future_exc:
+                    exc = exc or future_exc
+                    digests.append(outcome_digest(exc=future_exc))
+            latencies[method].append(done_time - scheduled)
+            if exc is not None:
+                errors[method][error_name(exc)] += 1
+            outcomes[record_no] = (method, ','.join(digests))
+
+    collector = threading.Thread(target=collect, name='mtrpc-replay-collector')
+    collector.daemon = True
+    collector.start()
+    pending = []
+    start = first_timestamp = None
+    try:
+        for record_no, record in enumerate(records):
+            try:
+                request_data = encoding.loads(record.body)
+                request_dicts = (request_data if isinstance(request_data, list)
+                                 else [request_data])
+                method = request_dicts[0]['method']
+            except Exception:
+                skipped += 1
+                continue
+            if isinstance(request_data, list):
+                method = 'batch:' + method
+            if start is None:
+                start = time.time()
+                first_timestamp = record.timestamp
+            scheduled = start + (record.timestamp - first_timestamp) / speedup
+            now = time.time()
+            if scheduled > now:
+                time.sleep(scheduled - now)
+            else:
+                max_lag = max(max_lag, now - scheduled)
+            record_exchange = exchange if exchange is not None else record.exchange
+            futures = next(proxy_cycle)._replay(request_data, record_exchange,
+                                                record.routing_key, timeout)
+            if not futures:
+                notifications += 1
+                continue
+            pending.append(_Tracker(completed, (record_no, method, record_exchange,
+                                                futures, scheduled)))
+        for tracker in pending:
+            tracker.wait()
+    finally:
+        completed.put(None)
+        collector.join()
+    for method_latencies in latencies.itervalues():
+        method_latencies.sort()
+    results = dict((method, (latencies[method], errors[method])) for method in latencies)
+    elapsed = time.time() - start if start is not None else 0.0
+    return results, outcomes, notifications, skipped, elapsed, max_lag
+
+
+class _Tracker(object):
+
+    """Auxiliary class: puts call info into the queue when all futures are done"""
+
+    def __init__(self, completed, info):
+        self._completed = completed
+        self._info = info
+        futures = info[3]
+        self._remaining = len(futures)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        for future in futures:
+            future.add_done_callback(self._future_done)
+
+    def _future_done(self, future):
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining:
+                return
+        self._completed.put(self._info + (time.time(),))
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+
+
+def save_outcomes(path, outcomes):
+    with open(path, 'w') as outcomes_file:
+        for record_no in sorted(outcomes):
+            method, digest = outcomes[record_no]
+            outcomes_file.write('{0}\t{1}\t{2}\n'.format(record_no, method, digest))
+
+
+def load_outcomes(path):
+    outcomes = {}
+    with open(path) as outcomes_file:
+        for line in outcomes_file:
+            record_no, method, digest = line.rstrip('\n').split('\t')
+            outcomes[int(record_no)] = (method, digest)
+    return outcomes
+
+
+def compare_outcomes(outcomes, reference):
+
+    """Compare outcomes of calls with the reference ones
+
+    Return a dict: {<method name>: {'compared': <number of calls>,
+    'diverged': <number of calls>, 'examples': [[<record number>,
+    <reference outcome>, <outcome>], ...]}}.
+
+    """
+
+    divergence = {}
+    for record_no, (method, digest) in sorted(outcomes.iteritems()):
+        if record_no not in reference:
+            continue
+        method_divergence = divergence.setdefault(method, {'compared': 0,
+                                                           'diverged': 0,
+                                                           'examples': []})
+        method_divergence['compared'] += 1
+        reference_digest = reference[record_no][1]
+        if digest != reference_digest:
+            method_divergence['diverged'] += 1
+            if len(method_divergence['examples']) < MAX_DIVERGENCE_EXAMPLES:
+                method_divergence['examples'].append([record_no, reference_digest, digest])
+    return divergence
+
+
+def format_divergence(divergence):
+    lines = ['{0:<32} {1:>8} {2:>8} {3:>7}'.format('method', 'compared', 'diverged', '%')]
+    for method, method_divergence in sorted(divergence.iteritems()):
+        compared = method_divergence['compared']
+        diverged = method_divergence['diverged']
+        lines.append('{0:<32} {1:>8} {2:>8} {3:>7.2f}'.format(
+                method, compared, diverged, 100.0 * diverged / compared))
+        for record_no, reference_digest, digest in method_divergence['examples']:
+            lines.append('  record {0}: {1} => {2}'.format(record_no, reference_digest, digest))
+    return lines
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] CAPTURE_FILE")
+    add_proxy_options(parser)
+    parser.set_defaults(loglevel='CRITICAL', req_exchange=None)
+    parser.add_option('-S', '--speedup', dest='speedup', type='float', default=1.0, help='Replay N times faster than the original timing (default: 1)', metavar='N')
+    parser.add_option('-c', '--connections', dest='connections', type='int', default=4, help='Number of replaying proxies (connections)')
+    parser.add_option('-T', '--timeout', dest='timeout', type='float', default=30, help='Call timeout (in seconds)')
+    parser.add_option('-P', '--proxy-param', dest='proxy_params', action='append', default=[], help='Additional MTRPCProxy keyword argument (e.g. transport=socket); can be repeated', metavar='NAME=VALUE')
+    parser.add_option('-o', '--save-outcomes', dest='save_outcomes', default=None, help='Save digests of call outcomes to the file', metavar='FILE')
+    parser.add_option('--compare', dest='compare', default=None, help='Compare outcomes with those saved (with -o) by an earlier replay', metavar='FILE')
+    parser.add_option('-j', '--json', dest='json', default=None, help="Write the report as JSON to the file ('-' => stdout, instead of the text report)", metavar='FILE')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    if len(a) != 1:
+        parser.print_help()
+        sys.exit(1)
+    if o.speedup <= 0 or o.connections < 1:
+        parser.error('speedup and number of connections must be positive')
+    proxy_kwargs = dict((name, getattr(o, name)) for name in (
+            'req_exchange', 'req_rk_pattern', 'loglevel', 'host',
+            'userid', 'password', 'reply_queue'))
+    for param in o.proxy_params:
+        name, sep, value = param.partition('=')
+        if not sep:
+            parser.error('Bad proxy param: {0!r} (expected NAME=VALUE)'.format(param))
+        proxy_kwargs[name] = decode_arg(value)
+    try:
+        reference = load_outcomes(o.compare) if o.compare is not None else None
+        records = read_capture(a[0])
+    except (ValueError, EnvironmentError) as exc:
+        parser.error(str(exc))
+
+    logging.basicConfig(level=logging.WARNING)
+    proxies = []
+    try:
+        for _ in xrange(o.connections):
+            proxies.append(ReplayProxy(**proxy_kwargs))
+        results, outcomes, notifications, skipped, elapsed, max_lag = replay(
+                records, proxies, o.speedup, o.timeout, o.req_exchange)
+    except Exception:
+        logging.getLogger().error('Cannot replay the capture', exc_info=True)
+        sys.exit(1)
+    finally:
+        for rpc in proxies:
+            rpc._close()
+
+    all_latencies = sorted(latency for latencies, _ in results.itervalues()
+                           for latency in latencies)
+    all_errors = collections.Counter()
+    for _, errors in results.itervalues():
+        all_errors.update(errors)
+    report = {
+        'capture': a[0],
+        'speedup': o.speedup,
+        'duration': elapsed,
+        'max_lag': max_lag,
+        'notifications': notifications,
+        'skipped': skipped,
+        'methods': dict((method, summarize_method(latencies, errors, elapsed))
+                        for method, (latencies, errors) in results.iteritems()),
+        'total': summarize_method(all_latencies, all_errors, elapsed),
+    }
+    if reference is not None:
+        report['divergence'] = compare_outcomes(outcomes, reference)
+    if o.save_outcomes is not None:
+        save_outcomes(o.save_outcomes, outcomes)
+
+    if o.json == '-':
+        print encoding.dumps(report)
+        return
+    lines = ['capture: {0}; speedup: {1:g}; replayed in {2:.1f}s (max. lag behind '
+             'the schedule: {3:.1f} ms); notifications: {4}; skipped records: {5}'
+             .format(a[0], o.speedup, elapsed, max_lag * 1000, notifications, skipped)]
+    lines.extend(format_method_table(report['methods'], report['total']))
+    if reference is not None:
+        lines.append('divergence from {0}:'.format(o.compare))
+        lines.extend(format_divergence(report['divergence']))
+    print '\n'.join(lines)
+    if o.json is not None:
+        with open(o.json, 'w') as json_file:
+            json_file.write(encoding.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,16 +15,22 @@ def decode_arg(arg):
     except ValueError:
         return arg
 
-def main():
-    parser = OptionParser(usage="usage: %prog [options] method args...")
+def add_proxy_options(parser):
+    """Add options specifying MTRPCProxy arguments (used also by mtrpc-bench)"""
     parser.add_option('-x', '--exchange', dest='req_exchange', default='rpc.friendly.exchange', help='AMQP exchange name', metavar='EXCHANGE')
     parser.add_option('-r', '--routing-key', dest='req_rk_pattern', default='rk.usr.{full_name}', help='AMQP routing key pattern', metavar='RK')
     parser.add_option('-l', '--loglevel', dest='loglevel', default='WARNING', help='Log level', metavar='LEVEL')
     parser.add_option('-H', '--host', dest='host', default='localhost:5672', help='AMQP broker')
     parser.add_option('-u', '--user', dest='userid', default='guest', help='AMQP user login')
     parser.add_option('-p', '--password', dest='password', default='guest', help='AMQP user password')
+    parser.add_option('-q', '--reply-queue', dest='reply_queue', default=None, help='AMQP reply queue name (e.g. amq.rabbitmq.reply-to => direct reply-to; default: a new server-named queue)', metavar='QUEUE')
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] method args...")
+    add_proxy_options(parser)
     parser.add_option('-R', '--raw', dest='raw', action='store_true', help="Don't decode JSON in command line params")
     parser.add_option('-j', '--json', dest='json', action='store_true', help="Dump response in JSON format")
+    parser.add_option('-N', '--notify', dest='notify', action='store_true', help="Send a notification (don't wait for any response)")
 
     (o, a) = parser.parse_args(sys.argv[1:])
 
@@ -43,14 +49,20 @@ def main():
         args = [decode_arg(arg) for arg in args]
 
     retcode = 0
+    notify = o.__dict__.pop('notify')
     with MTRPCProxy(**o.__dict__) as rpc:
         try:
-            ret = getattr(rpc, meth)(*args)
+            if notify:
+                getattr(rpc, meth).notify_(*args)
+            else:
+                ret = getattr(rpc, meth)(*args)
         except Exception:
             logging.getLogger().error('RPC call failed', exc_info=True)
             retcode = 1
         else:
-            if o.json:
+            if notify:
+                pass
+            elif o.json:
                 print encoding.dumps(ret),
             else:
                 print ret,
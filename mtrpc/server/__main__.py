@@ -92,6 +92,13 @@ To run your MTRPC server:
 * define your RPC-modules and methods,
 * run an AMQP broker and then -- your server script.
 
+Alternatively, run the mtrpc-server script with config file(s) as
+arguments (only the dependencies of the selected server class -- AMQP
+by default, -H => HTTP, -c => CLI -- are imported); with
+--profile-startup it prints how long startup phases took (imports,
+config load/validation, RPC-tree build, module post-inits -- see:
+mtrpc.server.startup) just before the server is started.
+
 There is also possibility to instantiate the classes from
 mtrpc.server.methodtree and mtrpc.server.threads directly (without using
 MTRPCServerInterface)-- but it would be a rather unnecessary effort
@@ -218,10 +225,34 @@ Server configuration file structure and content
       variables will be set as global attributes of the particular Python
       module);
 
+  * "lazy": False (default) or True -- whether modules described by the
+    manifest (see below) should be imported (and post-initialized) only
+    when any of their RPC-methods is called for the first time (until
+    then, e.g., system.list and system.help are served from the
+    manifest); modules changed since the manifest was written are
+    loaded at once;
+
+  * "manifest": a string (empty by default) -- path of the RPC-tree
+    manifest file, written by `mtrpc-server --write-manifest FILE
+    config_file...' (see: the mtrpc.server.manifest module); modules
+    whose source files have not changed since it was written are built
+    from it -- without introspection of their members, argument
+    specifications and docs (faster warm starts); obligatory if "lazy"
+    is true;
+
+  * "update_manifest": False (default) or True -- whether the manifest
+    should be (re)written on RPC-tree load if it is missing or out of
+    date;
+
 * amqp_params: a dict (an obligatory item), containing keyword arguments
   for AMQP Connection(), is to be used by the manager and the responder
   (see the amqplib.client_0_8.connection.Connection.__init__() signature
-  for argument specification);
+  for argument specification); it may also contain the "transport" item:
+  a transport name (e.g. "loopback") or a dotted path of a Transport
+  subclass -- then the other items are arguments for that transport (see:
+  the mtrpc.common.transport module; e.g. {"transport": "socket-server",
+  "listen": "0.0.0.0:7070"} makes the server accept direct client
+  connections, with no broker -- see: mtrpc.common.socket_transport);
 
 * exchange_types: a dict (empty by default) mapping AMQP exchange
   names to their types (in practice only two types are important:
@@ -375,9 +406,39 @@ callable objects).
   named "kwparams"; to get the context see the original protocol
   specification: http://json-rpc.org/wiki/specification).
 
-* Protocol-related note: MTRPC doesn't implement JSON-RPC notifications
-  (they are not very useful in that context) and responds to them with
-  error messages.
+* Protocol-related note: if an RPC-method returns an iterator (e.g. it is
+  a generator function), its result is streamed: sent as a series of
+  response messages, each with additional "chunk" (sequence number) and
+  "more" (false in the last one) members and "result" being a list of
+  up to `stream_chunk_size' items (an RPCManager attribute); an error
+  can be sent in the last one (in batches and system.map results such
+  iterators are turned into lists).
+
+* Protocol-related note: if `spill_threshold' (an RPCManager attribute,
+  see: the "manager_attributes" config section) is set, a result whose
+  JSON text is larger (in bytes) is not sent in the response: it contains
+  a "spilled" member (a dict with "handle", "size", "chunk_size" and
+  "chunks" items) instead -- to fetch the text chunk by chunk with the
+  system.spill_read RPC-method (see: mtrpc.server.spill module).
+
+* Incoming requests can be recorded -- for replaying them later with
+  the mtrpc-replay tool, e.g. against a new release -- by setting
+  `capture_path' (and, optionally, `capture_sample_rate' and
+  `capture_max_bytes'; RPCManager attributes, see: the
+  "manager_attributes" config section and the mtrpc.server.capture
+  module).
+
+* Protocol-related note: JSON-RPC notifications (requests with null id)
+  are executed but no responses are sent for them (request messages may
+  then have no `reply_to'); their errors are only logged and counted
+  (see: system.notification_stats RPC-method).
+
+* Protocol-related note: there is another MTRPC extension (borrowed from
+  JSON-RPC 2.0): a batch -- a JSON array of requests sent as one message;
+  the response is one message as well: a JSON array of responses (in the
+  same order). Requests of a batch are executed by one task thread --
+  or, concurrently, by up to `batch_parallelism' threads (an RPCManager
+  attribute, see: the "manager_attributes" config section).
 
 The function (or another callable object) that defines an RPC-method can
 have attributes that will be used by MTRPC:
@@ -385,6 +446,22 @@ have attributes that will be used by MTRPC:
 * __doc__, i.e. the good old Python docstring -- will be turned into the
   RPC-method docstring (RPC-method `doc' attribute);
 
+* bulk -- a callable implementing many calls at once: it takes a list of
+  dicts (one per call, mapping argument names to values) and returns
+  a list of results (in the same order; an exception instance as an item
+  is raised for that call); concurrent calls of the RPC-method are then
+  gathered -- within `bulk_window' seconds (an optional attribute;
+  default: 0.005) or up to `bulk_max_size' calls (default: 100) -- and
+  served with one call of it (see also: system.bulk_stats RPC-method);
+
+* job -- if true, the RPC-method is long-running: its calls are executed
+  by the server job pool (not by task threads) and they return job ids at
+  once; results are to be fetched with system.job_status/job_result
+  RPC-methods (see: mtrpc.server.jobs module documentation);
+
+* spill -- if false, large results of the RPC-method are never spilled
+  (see: the note about `spill_threshold' above); default: true;
+
 **Attention:** Any strings that may be sent into the client side and that
 may contain non-ascii characters *must* be unicode strings -- in particular
 it applies to the RPC-module/method docstrings!
@@ -412,11 +489,23 @@ For information about AMQP routing keys, exchange and queue names etc.
 
 """
 
+import sys
+
 from . import daemonize
-from mtrpc.server.amqp import AmqpServer
-from mtrpc.server.cli import MtrpcCli
-from mtrpc.server.http import HttpServer
-from mtrpc.server.server_config import ServerConfig
+from . import startup
+
+# (server classes are imported only when selected -- so that the
+# dependencies of the other ones, e.g. flask and gunicorn of the HTTP
+# backend or readline of the CLI, are not loaded)
+AMQP_SERVER = 'mtrpc.server.amqp.AmqpServer'
+CLI = 'mtrpc.server.cli.MtrpcCli'
+HTTP_SERVER = 'mtrpc.server.http.HttpServer'
+
+
+def get_server_class(path):
+    module_name, class_name = path.rsplit('.', 1)
+    __import__(module_name)
+    return getattr(sys.modules[module_name], class_name)
 
 
 def main():
@@ -424,16 +513,32 @@ def main():
     parser = OptionParser(usage='%prog [options] config_file...')
     parser.add_option('-d', '--daemon', dest='daemon', action='store_true', default=False, help='daemonize')
     parser.add_option('-p', '--pidfile', dest='pidfile', action='store', default=None, help='write pid to file')
-    parser.add_option('-c', '--cli', dest='server_class', action='store_const', const=MtrpcCli, default=AmqpServer,
+    parser.add_option('-c', '--cli', dest='server_class', action='store_const', const=CLI, default=AMQP_SERVER,
                       help='run CLI')
-    parser.add_option('-H', '--http', dest='server_class', action='store_const', const=HttpServer,
+    parser.add_option('-H', '--http', dest='server_class', action='store_const', const=HTTP_SERVER,
                       help='run HTTP backend')
+    parser.add_option('--profile-startup', dest='profile_startup', action='store_true', default=False,
+                      help='print (to stderr) how long startup phases took: imports, config load/validation, '
+                           'RPC-tree build, module post-inits...')
+    parser.add_option('--write-manifest', dest='manifest_path', action='store', default=None,
+                      help='load the RPC-tree, write its manifest (for lazy loading) to the file and exit',
+                      metavar='FILE')
 
     (o, a) = parser.parse_args()
 
-    server = ServerConfig(a, o.server_class)
+    profile = startup.StartupProfile()
+    with profile.phase('imports (server)', o.server_class):
+        from mtrpc.server.server_config import ServerConfig
+        server_class = get_server_class(o.server_class)
+
+    server = ServerConfig(a, server_class, profile=profile,
+                          profile_report=sys.stderr if o.profile_startup else None)
+
+    if o.manifest_path is not None:
+        server.write_manifest(o.manifest_path)
+        return
 
-    if o.daemon and o.server_class is not MtrpcCli:
+    if o.daemon and o.server_class != CLI:
         daemonize.daemonize()
 
     server.run()
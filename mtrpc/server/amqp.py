@@ -82,8 +82,8 @@ class AmqpServer(MTRPCServerInterface):
                                               self.result_fifo,
                                               self.mutex,
                                               log=log,
-                                              **config['responder_'
-                                                       'attributes'])
+                                              attributes=config['responder_'
+                                                                'attributes'])
 
         self.manager = threads.RPCManager(config['amqp_params'],
                                           config['bindings'],
@@ -96,7 +96,7 @@ class AmqpServer(MTRPCServerInterface):
                                           self.mutex,
                                           final_callback,
                                           log=log,
-                                          **config['manager_attributes'])
+                                          attributes=config['manager_attributes'])
         self.manager.start()
         signal.pause()
 
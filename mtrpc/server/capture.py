@@ -0,0 +1,156 @@
+# mtrpc/server/capture.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""MTRPC-server traffic capture -- recording incoming requests.
+
+If `capture_path' (an RPCManager attribute; None by default => nothing
+is recorded) is set, the manager appends incoming request messages to
+that capture file: a fraction of them -- `capture_sample_rate' (1.0 by
+default => all) -- until the file size reaches `capture_max_bytes'
+(None by default => no limit). A capture can be replayed against
+a server with the mtrpc-replay tool (see: mtrpc.mtrpc_replay).
+
+The file is a header ('MTRPCCAP' and a version byte) followed by
+records; each record is a fixed-size part -- arrival timestamp (8-byte
+float), lengths of the binding's exchange, the binding's routing key,
+the message routing key (2 bytes each) and the message body (4 bytes),
+network byte order -- followed by those strings. A file is only
+appended to (also by later server runs); a record truncated by a crash
+is ignored by read_capture() and cut off when the file is opened for
+appending again (so that later records are readable).
+
+"""
+
+import os
+import random
+import struct
+import threading
+import time
+from collections import namedtuple
+
+
+MAGIC = 'MTRPCCAP'
+VERSION = 1
+
+_file_header = MAGIC + chr(VERSION)
+_record_header = struct.Struct('!dHHHI')
+
+
+CapturedRequest = namedtuple('CapturedRequest',
+                             'timestamp exchange binding_rk routing_key body')
+
+
+class CaptureWriter(object):
+
+    """Appends (sampled) request records to a capture file"""
+
+    flush_interval = 1  # in seconds
+
+    def __init__(self, path, sample_rate=1.0, max_bytes=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.recorded = 0
+        self.skipped = 0  # (not sampled or over the size limit)
+        self.full = False  # (a record has not fit within the size limit)
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._file = open(path, 'ab')
+        self._file.seek(0, os.SEEK_END)
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._file.write(_file_header)
+            self._size = len(_file_header)
+        else:
+            with open(path, 'rb') as existing:
+                if existing.read(len(_file_header)) != _file_header:
+                    self._file.close()
+                    raise ValueError('{0} is not an MTRPC capture file (version {1})'
+                                     .format(path, VERSION))
+                records_end = _records_end(existing, self._size)
+            if records_end < self._size:
+                # (a record truncated by a crash -- appending after it
+                # would make all later records unreadable)
+                self._file.truncate(records_end)
+                self._size = records_end
+        self._last_flush = time.time()
+
+    def record(self, timestamp, exchange, binding_rk, routing_key, body):
+        """Append a record (if sampled and the size limit allows)
+
+        Return True if the request has been recorded.
+
+        """
+
+        if self.sample_rate < 1 and self._random.random() >= self.sample_rate:
+            self.skipped += 1
+            return False
+        fields = (exchange, binding_rk, routing_key, body)
+        fields = [field.encode('utf-8') if isinstance(field, unicode) else field
+                  for field in fields]
+        data = (_record_header.pack(timestamp, *map(len, fields))
+                + ''.join(fields))
+        with self._lock:
+            if self._file is None:
+                return False
+            if self.max_bytes is not None and self._size + len(data) > self.max_bytes:
+                self.skipped += 1
+                self.full = True
+                return False
+            self._file.write(data)
+            self._size += len(data)
+            self.recorded += 1
+            if timestamp - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = timestamp
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_capture(path):
+    "Return an iterator over records (CapturedRequest instances) of a capture file"
+    capture_file = open(path, 'rb')
+    if capture_file.read(len(_file_header)) != _file_header:
+        capture_file.close()
+        raise ValueError('{0} is not an MTRPC capture file (version {1})'
+                         .format(path, VERSION))
+    return _iter_records(capture_file)
+
+
+def _records_end(capture_file, file_size):
+    "Return the offset of the end of the last complete record"
+    end = capture_file.tell()
+    header_size = _record_header.size
+    while True:
+        header = capture_file.read(header_size)
+        if len(header) < header_size:
+            return end
+        record_end = end + header_size + sum(_record_header.unpack(header)[1:])
+        if record_end > file_size:
+            return end
+        capture_file.seek(record_end)
+        end = record_end
+
+
+def _iter_records(capture_file):
+    with capture_file:
+        header_size = _record_header.size
+        while True:
+            header = capture_file.read(header_size)
+            if len(header) < header_size:
+                break
+            timestamp, exchange_len, binding_rk_len, rk_len, body_len = (
+                    _record_header.unpack(header))
+            exchange = capture_file.read(exchange_len)
+            binding_rk = capture_file.read(binding_rk_len)
+            routing_key = capture_file.read(rk_len)
+            body = capture_file.read(body_len)
+            if len(body) < body_len:
+                break  # (a truncated record)
+            yield CapturedRequest(timestamp, exchange, binding_rk, routing_key, body)
@@ -7,6 +7,7 @@ from flask import Flask, Response, abort, jsonify, request
 from gunicorn.config import Config
 from gunicorn.app.base import Application
 
+from mtrpc.common import utils
 from mtrpc.common.errors import RPCMethodArgError, RPCAccessDenied
 from mtrpc.server.core import MTRPCServerInterface
 from mtrpc.server import schema
@@ -99,8 +100,8 @@ class HttpServer(MTRPCServerInterface):
     @classmethod
     def call_rpc_object(cls, rpc_object, args):
         try:
-            rpc_object.authorize(cls.access_args())
-            return jsonify(response=rpc_object(**args))
+            rpc_object.authorize(**cls.access_args())
+            return jsonify(response=utils.materialize(rpc_object(**args)))
         except RPCMethodArgError as exc:
             abort(400, str(exc).replace('{name}', rpc_object.full_name))
         except RPCAccessDenied:
@@ -121,7 +122,7 @@ class HttpServer(MTRPCServerInterface):
         if self.matches_root_token(self.auth_token()):
             return
         try:
-            ret = rpc_object.authorize(self.access_args())
+            ret = rpc_object.authorize(**self.access_args())
         except RPCAccessDenied:
             abort(403, 'Access denied')
 
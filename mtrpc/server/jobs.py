@@ -0,0 +1,160 @@
+# mtrpc/server/jobs.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""MTRPC-server job pool -- for long-running RPC-methods.
+
+A call of an RPC-method whose callable has a true `job' attribute is not
+executed by the task thread that received the request: it is only put
+into the job pool (see: RPCMethod.__call__() in the methodtree module)
+and the new job id (a random, hard to guess string) is returned at once.
+Jobs are executed by a bounded number of worker threads; if too many
+jobs are waiting, new ones are rejected (RPCJobPoolFullError).
+
+Results (or errors) of completed jobs are kept for `result_ttl' seconds
+(but no more than `max_results' of them) -- to be fetched with the
+system.job_status and system.job_result RPC-methods (the latter can
+wait for the job completion).
+
+The pool used by the server is the `job_pool' module attribute; its
+limits can be changed by setting its attributes (before the first job
+is submitted).
+
+"""
+
+import Queue
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from ..common.errors import (RPCJobPoolFullError, RPCJobNotFoundError,
+                             RPCJobNotDoneError)
+
+
+class Job(object):
+
+    """A submitted call of a job RPC-method"""
+
+    def __init__(self, method_name, func):
+        self.id = uuid.uuid4().hex
+        self.method_name = method_name
+        self.func = func
+        self.status = 'queued'  # -> 'running' -> 'done' or 'failed'
+        self.result = None
+        self.exc_info = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def info(self):
+        return dict(id=self.id,
+                    method=self.method_name,
+                    status=self.status,
+                    submitted=self.submitted,
+                    started=self.started,
+                    finished=self.finished)
+
+
+class JobPool(object):
+
+    """Executes jobs by worker threads, keeps their results for a while"""
+
+    max_workers = 4
+    max_queued = 100  # (more waiting jobs => RPCJobPoolFullError)
+    result_ttl = 3600  # (in seconds)
+    max_results = 1000
+    max_wait = 60  # (upper limit of `wait' in result(), in seconds)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._queued = 0
+        self._workers = []
+        self._jobs = {}  # maps ids to jobs (not expired ones)
+        self._finished = OrderedDict()  # ids of completed jobs (oldest first)
+
+    def submit(self, method_name, func):
+        """Put a job (to be executed as func()) into the pool; return its id"""
+        with self._lock:
+            if self._queued >= self.max_queued:
+                raise RPCJobPoolFullError('Job {0} not accepted -- {1} jobs are '
+                                          'already waiting'.format(method_name,
+                                                                   self._queued))
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work,
+                                          name='JobWorker-{0}'.format(len(self._workers) + 1))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+            self._purge()
+            job = Job(method_name, func)
+            self._jobs[job.id] = job
+            self._queued += 1
+        self._queue.put(job)
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            try:
+                return self._jobs[job_id]
+            except KeyError:
+                raise RPCJobNotFoundError('No job {0!r} (unknown id or its result '
+                                          'has already expired)'.format(job_id))
+
+    def status(self, job_id):
+        """Get job info (a dict)"""
+        job = self.get(job_id)
+        with self._lock:
+            return job.info()
+
+    def result(self, job_id, wait=0):
+        """Get the job result (or raise its error), waiting up to `wait' seconds"""
+        job = self.get(job_id)
+        if not job.done.wait(max(0, min(wait, self.max_wait))):
+            raise RPCJobNotDoneError('Job {0} not completed yet (status: {1})'
+                                     .format(job_id, job.status))
+        if job.exc_info is not None:
+            raise job.exc_info[0], job.exc_info[1]
+        return job.result
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._queued -= 1
+                job.status = 'running'
+                job.started = time.time()
+            try:
+                result = job.func()
+            except Exception:
+                exc_info = sys.exc_info()[:2]
+                result = None
+            else:
+                exc_info = None
+            with self._lock:
+                job.func = None
+                job.result = result
+                job.exc_info = exc_info
+                job.status = 'failed' if exc_info else 'done'
+                job.finished = time.time()
+                self._finished[job.id] = job.finished
+                self._purge()
+            job.done.set()
+
+    def _purge(self):
+        # (to be called with the lock held)
+        expired_before = time.time() - self.result_ttl
+        finished = self._finished
+        while finished:
+            job_id, finish_time = next(finished.iteritems())
+            if finish_time >= expired_before and len(finished) <= self.max_results:
+                break
+            del finished[job_id]
+            del self._jobs[job_id]
+
+
+job_pool = JobPool()
@@ -0,0 +1,173 @@
+# mtrpc/server/manifest.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""RPC-tree manifests -- for lazy RPC-tree loading and fast warm starts.
+
+A manifest describes an RPC-tree loaded from a config: for each item of
+the "paths"/"imports" lists of the "rpc_tree_init" config section (an
+*entry*, keyed by its top-level RPC-module name) -- the RPC-modules
+(full names, docs and names of their py-modules) and the RPC-methods
+(full names, help texts, argument specifications and the `readonly',
+`job' and `spill' flags) it defines, and modification times of the
+source files of those py-modules (and of the modules defining the
+RPC-method callables).
+
+A manifest is written for a (fully loaded) RPC-tree with write_manifest()
+(see also: the --write-manifest option of the mtrpc-server script and the
+"update_manifest" item of "rpc_tree_init").
+
+If the "manifest" item of "rpc_tree_init" is given:
+
+* entries whose source files are unchanged (the same modification times)
+  are built from the manifest -- with no introspection (member lookup,
+  argument specifications, help text formatting) of the py-modules;
+  post-inits are run as usual;
+
+* if the "lazy" item of "rpc_tree_init" is true, unchanged entries are
+  not imported on RPC-tree load (changed ones are loaded at once, as
+  the manifest may lack their new RPC-methods): their RPC-modules and
+  RPC-methods are created from the manifest -- methods as
+  methodtree.LazyRPCMethod placeholders -- and the actual py-module is
+  imported and post-initialized when any of its methods is obtained from
+  the tree for the first time (so e.g. system.list and system.help are
+  served from the manifest).
+
+The file is a JSON object:
+
+    {
+        "version": 2,
+        "entries": {
+            <top-level RPC-module name>: {
+                "request": <the "paths"/"imports" item>,
+                "files": {<source file path>: <modification time>, ...}
+                         (or null -- if the entry cannot be built from
+                         the manifest, e.g. some py-module is not
+                         in sys.modules),
+                "modules": [{"name": <full name>, "doc": <doc>,
+                             "pymod": <py-module name or null>},
+                            ...],
+                "methods": [{"name": <full name>, "help": <help text>,
+                             "signature": <argument specification>,
+                             "readonly": ..., "job": ..., "spill": ...},
+                            ...]
+            },
+            ...
+        }
+    }
+
+"""
+
+import json
+import os
+import sys
+
+
+VERSION = 2
+
+
+def source_file(module):
+    """Get the source file path of a module (None if it has no file)"""
+
+    path = getattr(module, '__file__', None)
+    if path is None:
+        return None
+    base, ext = os.path.splitext(path)
+    if ext in ('.pyc', '.pyo') and os.path.exists(base + '.py'):
+        path = base + '.py'
+    return os.path.abspath(path)
+
+
+def _entry_files(pymods, callables):
+    files = {}
+    modules = set(pymods)
+    for callable_obj in callables:
+        module = sys.modules.get(getattr(callable_obj, '__module__', None))
+        if module is not None:
+            modules.add(module)
+    for module in modules:
+        if sys.modules.get(module.__name__) is not module:
+            return None
+        path = source_file(module)
+        if path is not None:
+            files[path] = os.stat(path).st_mtime
+    return files
+
+
+def make_manifest(rpc_tree):
+    """Make the manifest (a dict) for an RPC-tree loaded from a config"""
+
+    entries = {}
+    items = {}  # maps entry names to lists of (full name, RPC-object) pairs
+    for name, request in rpc_tree.load_requests.iteritems():
+        lazy_entry = rpc_tree.lazy_entries.get(name)
+        if lazy_entry is not None:
+            # (not loaded yet => the same as in the manifest it comes from)
+            entries[name] = lazy_entry.manifest_entry
+        elif name in rpc_tree:
+            items[name] = [(name, rpc_tree[name])]
+            items[name].extend(rpc_tree.all_items(name, deep=True))
+        else:
+            # (the module defines no RPC-module)
+            entries[name] = dict(request=request, files={}, modules=[], methods=[])
+
+    for name, entry_items in items.iteritems():
+        modules = []
+        methods = []
+        pymods = []
+        callables = []
+        for full_name, rpc_object in entry_items:
+            if isinstance(rpc_object, rpc_tree.RPCModule):
+                pymod = rpc_tree.pymods.get(full_name)
+                modules.append(dict(name=full_name,
+                                    doc=rpc_object.doc,
+                                    pymod=pymod.__name__ if pymod is not None else None))
+                if pymod is not None:
+                    pymods.append(pymod)
+            else:
+                methods.append(dict(name=full_name,
+                                    help=rpc_object.__doc__,
+                                    signature=rpc_object.arg_spec,
+                                    readonly=bool(rpc_object.readonly),
+                                    job=bool(rpc_object.job),
+                                    spill=bool(rpc_object.spill)))
+                callables.append(rpc_object.callable_obj)
+        entries[name] = dict(request=rpc_tree.load_requests[name],
+                             files=_entry_files(pymods, callables),
+                             modules=modules,
+                             methods=methods)
+    return dict(version=VERSION, entries=entries)
+
+
+def write_manifest(rpc_tree, path):
+    manifest = make_manifest(rpc_tree)
+    # (written to a temporary file first -- not to leave a truncated
+    # manifest if interrupted; renaming replaces the old one atomically)
+    tmp_path = '{0}.tmp{1}'.format(path, os.getpid())
+    with open(tmp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def read_manifest(path):
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('version') != VERSION:
+        raise ValueError('{0} is not an RPC-tree manifest (version {1})'
+                         .format(path, VERSION))
+    return manifest
+
+
+def is_up_to_date(entry):
+    """Check whether source files of a manifest entry are unchanged"""
+
+    files = entry['files']
+    if files is None:
+        return False
+    for path, mtime in files.iteritems():
+        try:
+            if os.stat(path).st_mtime != mtime:
+                return False
+        except OSError:
+            return False
+    return True
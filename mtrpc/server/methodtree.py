@@ -16,11 +16,13 @@ Terminology note
 
 """
 
+import functools
 import inspect
 import itertools
 import os
 import string
 import textwrap
+import threading
 import traceback
 import types
 import warnings
@@ -28,11 +30,14 @@ import sys
 import imp
 from mtrpc.common import utils
 
-from collections import defaultdict, Callable, Mapping
+from collections import defaultdict, Callable, Mapping, OrderedDict
 
 from mtrpc.common.const import RPC_METHOD_LIST, RPC_POSTINIT, RPC_MODULE_DOC, DEFAULT_LOG_HANDLER_SETTINGS
-from mtrpc.common.errors import RPCMethodArgError, RPCNotFoundError
+from mtrpc.common.errors import RPCMethodArgError, RPCNotFoundError, RPCInternalServerError
+from mtrpc.server import jobs
+from mtrpc.server import manifest
 from mtrpc.server import schema
+from mtrpc.server import startup
 
 
 #
@@ -117,36 +122,153 @@ def get_effective_signature(obj):
     return inspect.formatargspec(official_args, spec.varargs, spec.keywords, official_defaults)
 
 
+class BulkDispatcher(object):
+
+    """Gathers concurrent calls of an RPC-method to serve them in bulk.
+
+    The first call starts collecting a batch; the calling thread waits
+    until the window (in seconds) elapses or max_size calls are gathered,
+    then calls bulk_callable(<list of argument dicts>) and fans the
+    returned results (a list: one item per call, in the same order)
+    out to all waiting calls. An exception instance as a result item
+    is raised by its call.
+
+    """
+
+    def __init__(self, bulk_callable, window=0.005, max_size=100):
+        self.bulk_callable = bulk_callable
+        self.window = window
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._batch = None  # the batch being collected
+        self._calls = 0
+        self._batches = 0
+        self._max_batch_size = 0
+        self._size_histogram = defaultdict(int)  # power-of-2 size buckets
+
+    class _Batch(object):
+        def __init__(self):
+            self.arg_dicts = []
+            self.full = threading.Event()
+            self.done = threading.Event()
+            self.results = None
+            self.exc_info = None
+
+    def call(self, arg_dict):
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = self._Batch()
+            index = len(batch.arg_dicts)
+            batch.arg_dicts.append(arg_dict)
+            if len(batch.arg_dicts) >= self.max_size:
+                self._batch = None
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            self._run(batch)
+        else:
+            batch.done.wait()
+        if batch.exc_info is not None:
+            raise batch.exc_info[0], batch.exc_info[1], batch.exc_info[2]
+        result = batch.results[index]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _run(self, batch):
+        # (no more calls can join the batch now)
+        size = len(batch.arg_dicts)
+        with self._lock:
+            self._calls += size
+            self._batches += 1
+            self._max_batch_size = max(self._max_batch_size, size)
+            self._size_histogram[1 << (size.bit_length() - 1)] += 1
+        try:
+            results = list(self.bulk_callable(batch.arg_dicts))
+            if len(results) != size:
+                raise RPCInternalServerError('Bulk implementation returned {0} '
+                                             'results for {1} calls'
+                                             .format(len(results), size))
+            batch.results = results
+        except Exception:
+            batch.exc_info = sys.exc_info()
+        finally:
+            batch.done.set()
+
+    def stats(self):
+        """Get batch size statistics (a dict)"""
+        with self._lock:
+            return dict(
+                calls=self._calls,
+                batches=self._batches,
+                mean_batch_size=(float(self._calls) / self._batches
+                                 if self._batches else None),
+                max_batch_size=self._max_batch_size,
+                # maps '<min>-<max>' size ranges to numbers of batches
+                size_histogram=dict(
+                    (str(low) if low == 1 else '{0}-{1}'.format(low, 2 * low - 1),
+                     count)
+                    for low, count in self._size_histogram.iteritems()),
+            )
+
+
 class RPCMethod(Callable):
     """Callable object wrapper with some additional attributes.
 
     When an instance is called:
     1) there is a check whether given arguments match the argument
        specification of the callable -- if not, RPCMethodArgError is thrown;
-    2) the callable is called, the result is returned.
+    2) the callable is called, the result is returned (or -- if the
+       callable has the `bulk' attribute -- the call is served by
+       a BulkDispatcher, together with other concurrent calls; or -- if
+       the callable has a true `job' attribute -- the call is put into
+       the job pool and the job id is returned, see: the jobs module).
     """
 
-    def __init__(self, callable_obj, full_name=''):
+    def __init__(self, callable_obj, full_name='', help_text=None, arg_spec=None):
 
         """Initialize with a callable object as the argument.
 
         Use docstring of the callable object as a base for the `doc'
         RPC-method attribute.
+
+        `help_text' and `arg_spec' (the formatted argument specification)
+        can be given (e.g. from the RPC-tree manifest) to skip
+        introspection of the callable object.
         """
 
         if not isinstance(callable_obj, Callable):
             raise TypeError('Method object must be callable')
         self.callable_obj = callable_obj
-        spec = inspect.getargspec(self.callable_obj)
-        self._arg_test_callable = self._test_argspec(spec)
+        if arg_spec is None:
+            arg_spec = inspect.formatargspec(*inspect.getargspec(self.callable_obj))
+        self.arg_spec = arg_spec
+        self._arg_test_callable = None  # (created on the first call)
         self.full_name = full_name
-        self.__doc__ = format_method_help(full_name, callable_obj)
+        if help_text is None:
+            help_text = format_method_help(full_name, callable_obj)
+        self.__doc__ = help_text
         self.readonly = getattr(callable_obj, 'readonly', False)
+        self.job = getattr(callable_obj, 'job', False)
+        self.spill = getattr(callable_obj, 'spill', True)
+        bulk_callable = getattr(callable_obj, 'bulk', None)
+        if bulk_callable is None:
+            self.bulk_dispatcher = None
+        else:
+            self.bulk_dispatcher = BulkDispatcher(
+                    bulk_callable,
+                    window=getattr(callable_obj, 'bulk_window', 0.005),
+                    max_size=getattr(callable_obj, 'bulk_max_size', 100))
 
-    def _test_argspec(self, spec):
+    def _test_argspec(self, arg_spec):
         # create argument testing callable object:
         _arg_test_callable_str = ('def _arg_test_callable{0}: pass'
-                                  .format(inspect.formatargspec(*spec)))
+                                  .format(arg_spec))
         _temp_namespace = {}
         exec _arg_test_callable_str in _temp_namespace
         return _temp_namespace['_arg_test_callable']
@@ -180,12 +302,21 @@ class RPCMethod(Callable):
     def __call__(self, *args, **kw):
         """Call the method"""
 
+        arg_test_callable = self._arg_test_callable
+        if arg_test_callable is None:
+            arg_test_callable = self._arg_test_callable = self._test_argspec(self.arg_spec)
         try:
             # test given arguments (params)
-            self._arg_test_callable(*args, **kw)
+            arg_test_callable(*args, **kw)
         except TypeError:
             self._raise_arg_error(args, kw)
         else:
+            if self.job:
+                return jobs.job_pool.submit(self.full_name, functools.partial(
+                        self.callable_obj, *args, **kw))
+            if self.bulk_dispatcher is not None:
+                return self.bulk_dispatcher.call(
+                        inspect.getcallargs(self.callable_obj, *args, **kw))
             return self.callable_obj(*args, **kw)
 
     def _raise_arg_error(self, args, kw):
@@ -197,6 +328,56 @@ class RPCMethod(Callable):
                                 .format(', '.join(itertools.chain(a, kw)), get_effective_signature(self.callable_obj)))
 
 
+class LazyRPCMethod(object):
+    """Placeholder of an RPC-method of a lazily loaded module.
+
+    Its attributes (help text, `readonly', `job' and `spill') come from
+    the RPC-tree manifest (see: the manifest module). When it is obtained
+    from the RPC-tree (or called) the module is imported -- and the
+    RPC-methods it defines replace the placeholders.
+    """
+
+    bulk_dispatcher = None
+
+    def __init__(self, rpc_tree, entry_name, full_name, help_text,
+                 readonly=False, job=False, spill=True):
+        self.rpc_tree = rpc_tree
+        self.entry_name = entry_name  # (the top-level RPC-module name)
+        self.full_name = full_name
+        self.__doc__ = help_text
+        self.readonly = readonly
+        self.job = job
+        self.spill = spill
+
+    def load(self):
+        """Load the module, return the actual RPC-method"""
+        self.rpc_tree.load_lazy_entry(self.entry_name)
+        return self.rpc_tree.item_dict[self.full_name]
+
+    def authorize(self, **kwargs):
+        return self.load().authorize(**kwargs)
+
+    def format_args(self, args, kw):
+        return self.load().format_args(args, kw)
+
+    def __call__(self, *args, **kw):
+        return self.load()(*args, **kw)
+
+
+class _LazyEntry(object):
+
+    """Auxiliary class: a not yet loaded "paths"/"imports" item"""
+
+    def __init__(self, request, import_module, manifest_entry):
+        self.request = request
+        self.import_module = import_module
+        self.manifest_entry = manifest_entry
+        self.loading = False
+
+    def __repr__(self):
+        return '<lazily loaded: {0}>'.format(self.request)
+
+
 class RPCModule(Mapping):
     """RPC-module maps local names to RPC-methods and other RPC-modules"""
 
@@ -209,6 +390,7 @@ class RPCModule(Mapping):
         self._sorted_submod_items = None  # sorted (locname, RPC-module) pairs
         # public attributes:
         self.full_name = full_name
+        self.doc = doc
         self.__doc__ = format_module_help(full_name, doc)
 
     def authorize(self, **kwargs):
@@ -216,6 +398,7 @@ class RPCModule(Mapping):
 
     def declare_attrs(self, doc):
         """Add doc if needed, re-generate help text if needed"""
+        self.doc = doc
         self.__doc__ = format_module_help(self.full_name, doc)
 
     def add_method(self, local_name, rpc_method):
@@ -224,11 +407,16 @@ class RPCModule(Mapping):
             raise ValueError("Local RPC-name must not be empty")
         if local_name in self._method_dict:
             raise ValueError("Local RPC-name {0} already is use".format(local_name))
-        if not isinstance(rpc_method, RPCMethod):
+        if not isinstance(rpc_method, (RPCMethod, LazyRPCMethod)):
             raise TypeError("`rpc_method' argument must be an RPCMethod instance")
         self._sorted_method_items = None  # forget the cache
         self._method_dict[local_name] = rpc_method
 
+    def remove_method(self, local_name):
+        """Remove a method"""
+        del self._method_dict[local_name]
+        self._sorted_method_items = None  # forget the cache
+
     def add_submod(self, local_name, rpc_module):
         """Add a new submodule"""
         if not local_name:
@@ -320,20 +508,72 @@ class RPCTree(Mapping):
                     'custom_mod_loggers': {}
                 },
                 'mod_globals': {}
-            }
+            },
+            'lazy': False,
+            'manifest': '',
+            'update_manifest': False,
         }
     }
 
     CONFIG_SCHEMAS = [schema.by_example(CONFIG_DEFAULTS)]
 
     @classmethod
-    def load(cls, config, rpc_mode):
+    def load(cls, config, rpc_mode, profile=None):
         paths = config['rpc_tree_init']['paths']
         imports = config['rpc_tree_init']['imports']
         postinit_kwargs = config['rpc_tree_init']['postinit_kwargs']
+        lazy = config['rpc_tree_init'].get('lazy', False)
+        manifest_path = config['rpc_tree_init'].get('manifest', '')
+        update_manifest = config['rpc_tree_init'].get('update_manifest', False)
+        if profile is None:
+            profile = startup.NULL_PROFILE
         root_mod = types.ModuleType('_MTRPC_ROOT_MODULE_')
         root_method_list = []
         setattr(root_mod, RPC_METHOD_LIST, root_method_list)
+
+        # with a manifest: modules found in it are not imported now (lazy
+        # loading) or are built from it if their sources are unchanged
+        manifest_entries = {}
+        manifest_stale = False
+        if lazy and not manifest_path:
+            raise ValueError('Lazy RPC-tree loading needs a manifest (the '
+                             '"manifest" item of "rpc_tree_init" config section)')
+        if manifest_path and not lazy and not os.path.exists(manifest_path):
+            manifest_stale = True  # (not written yet)
+        elif manifest_path:
+            with profile.phase('manifest load'):
+                try:
+                    manifest_entries = manifest.read_manifest(manifest_path)['entries']
+                except (EnvironmentError, ValueError) as exc:
+                    if lazy:
+                        raise
+                    warnings.warn('Cannot use RPC-tree manifest -- {0}'.format(exc))
+                    manifest_stale = True
+        load_requests = OrderedDict()  # maps top-level names to paths/imports items
+        lazy_entries = {}
+        warm_entries = {}
+
+        def add_module(dst_name, request, import_module):
+            manifest_entry = manifest_entries.get(dst_name)
+            if manifest_entry is not None and manifest_entry['request'] != request:
+                manifest_entry = None
+            up_to_date = (manifest_entry is not None
+                          and manifest.is_up_to_date(manifest_entry))
+            if lazy and up_to_date:
+                lazy_entries[dst_name] = _LazyEntry(request, import_module,
+                                                    manifest_entry)
+            else:
+                # (entries changed since the manifest was written are
+                # loaded now -- the manifest may lack their new methods)
+                with profile.phase('imports (rpc_tree_init)', request):
+                    module = import_module()
+                setattr(root_mod, dst_name, module)
+                if up_to_date:
+                    warm_entries[dst_name] = (module, manifest_entry)
+                else:
+                    root_method_list.append(dst_name)
+            load_requests[dst_name] = request
+
         # load modules using absolute filesystem paths
         for path_req in paths:
             tokens = [s.strip() for s in path_req.rsplit(None, 2)]
@@ -345,12 +585,11 @@ class RPCTree(Mapping):
                 file_path = path_req
                 # e.g. '/home/zuo/foo.py' => dst_name='foo'
                 dst_name = os.path.splitext(os.path.basename(file_path))[0]
-            name_owner = getattr(root_mod, dst_name, None)
+            name_owner = getattr(root_mod, dst_name, None) or lazy_entries.get(dst_name)
             if name_owner is None:
                 module_name = 'mtrpc_pathloaded_{0}'.format(dst_name)
-                module = imp.load_source(module_name, file_path)
-                setattr(root_mod, dst_name, module)
-                root_method_list.append(dst_name)
+                add_module(dst_name, path_req,
+                           functools.partial(imp.load_source, module_name, file_path))
             else:
                 raise ValueError('Cannot load module from path "{0}" as '
                                  '"{1}" -- because "{1}" name is already '
@@ -371,38 +610,208 @@ class RPCTree(Mapping):
             else:
                 raise ValueError('Malformed import request: "{0}"'
                                  .format(import_req))
-            name_owner = getattr(root_mod, dst_name, None)
+            name_owner = getattr(root_mod, dst_name, None) or lazy_entries.get(dst_name)
             if name_owner is None:
-                module = __import__(src_name,
-                                    fromlist=['__dict__'],
-                                    level=0)
-                setattr(root_mod, dst_name, module)
-                root_method_list.append(dst_name)
+                add_module(dst_name, import_req,
+                           functools.partial(__import__, src_name,
+                                             fromlist=['__dict__'],
+                                             level=0))
             else:
                 raise ValueError('Cannot import module "{0}" as "{1}" -- '
                                  'because "{1}" name is already used by '
                                  'module {2!r}'
                                  .format(src_name, dst_name, name_owner))
 
-        return cls(root_mod, utils.basic_postinit, postinit_kwargs, rpc_mode)
+        rpc_tree = cls(root_mod, utils.basic_postinit, postinit_kwargs, rpc_mode,
+                       profile=profile,
+                       load_requests=load_requests,
+                       lazy_entries=lazy_entries,
+                       warm_entries=warm_entries)
+
+        manifest_stale = manifest_stale or any(
+                name not in lazy_entries and name not in rpc_tree.warm_entry_names
+                for name in load_requests)
+        if update_manifest and manifest_path and manifest_stale:
+            with profile.phase('manifest write'):
+                try:
+                    rpc_tree.write_manifest(manifest_path)
+                except EnvironmentError as exc:
+                    warnings.warn('Cannot write RPC-tree manifest -- {0}'.format(exc))
+        return rpc_tree
 
     def __init__(self,
                  root_pymod=None,
                  default_postinit_callable=(lambda: None),
                  postinit_kwargs=None,
-                 rpc_mode='server'):
+                 rpc_mode='server',
+                 profile=None,
+                 load_requests=None,
+                 lazy_entries=None,
+                 warm_entries=None):
+
+        """Build the tree (populate it with RPC-modules/methods)
+
+        If `profile' (a startup.StartupProfile instance) is given, times
+        of the build and of module post-inits are recorded in it.
 
-        """Build the tree (populate it with RPC-modules/methods)"""
+        `load_requests', `lazy_entries' and `warm_entries' are passed by
+        load() (see: the manifest module).
+
+        """
 
         self.item_dict = {}  # maps full names to RPC-objects
         self.rpc_mode = rpc_mode
         if postinit_kwargs is None:
             postinit_kwargs = {}
+        self._profile = profile if profile is not None else startup.NULL_PROFILE
+        # maps top-level RPC-module names to "paths"/"imports" items
+        self.load_requests = load_requests if load_requests is not None else OrderedDict()
+        # maps top-level RPC-module names to not yet loaded _LazyEntry instances
+        self.lazy_entries = {}
+        self._lazy_lock = threading.RLock()
+        self._default_postinit_callable = default_postinit_callable
+        self._postinit_kwargs = postinit_kwargs
+        self._initialized_pymods = {}
+        self.pymods = {}  # maps RPC-module full names to their py-modules
+        # (names of top-level modules built from the manifest)
+        self.warm_entry_names = set()
+
+        with self._profile.phase('tree build'):
+            self._build_subtree(root_pymod, '',
+                                default_postinit_callable, postinit_kwargs,
+                                ancestor_pymods=set(),
+                                initialized_pymods=self._initialized_pymods,
+                                pymods2anticipated_names=defaultdict(set))
+            for name, (pymod, manifest_entry) in (warm_entries or {}).iteritems():
+                self._build_entry(name, pymod, manifest_entry)
+            for name, lazy_entry in (lazy_entries or {}).iteritems():
+                self._add_lazy_entry(name, lazy_entry)
+
+    def _build_entry(self, name, pymod, manifest_entry=None):
+
+        """Build the subtree of a top-level module -- from the manifest entry if possible"""
+
+        if manifest_entry is not None and self._build_from_manifest(manifest_entry):
+            self.warm_entry_names.add(name)
+        else:
+            self._build_subtree(pymod, name,
+                                self._default_postinit_callable,
+                                self._postinit_kwargs,
+                                ancestor_pymods=set(),
+                                initialized_pymods=self._initialized_pymods,
+                                pymods2anticipated_names=defaultdict(set))
+
+    def _build_from_manifest(self, manifest_entry):
 
-        self._build_subtree(root_pymod, '',
-                            default_postinit_callable, postinit_kwargs,
-                            ancestor_pymods=set(), initialized_pymods={},
-                            pymods2anticipated_names=defaultdict(set))
+        """Build the subtree of a top-level module without introspection
+
+        RPC-modules, their post-inits and RPC-methods (help texts and
+        argument specifications included) are taken from the manifest
+        entry. Return False (with nothing built) if any of the py-modules
+        or callables it refers to cannot be found.
+
+        """
+
+        modules = []
+        methods = defaultdict(list)  # maps module full names to method items
+        for method_info in manifest_entry['methods']:
+            module_full_name, local_name = str(method_info['name']).rsplit('.', 1)
+            methods[module_full_name].append((local_name, method_info))
+        for module_info in manifest_entry['modules']:
+            full_name = str(module_info['name'])
+            pymod = None
+            if module_info['pymod'] is not None:
+                pymod = sys.modules.get(module_info['pymod'])
+                if pymod is None or pymod in self._initialized_pymods:
+                    return False
+            elif methods.get(full_name):
+                return False
+            method_objs = []
+            for local_name, method_info in methods.get(full_name, ()):
+                callable_obj = getattr(pymod, local_name, None)
+                if not callable(callable_obj):
+                    return False
+                method_objs.append((local_name, callable_obj, method_info))
+            modules.append((full_name, module_info['doc'], pymod, method_objs))
+
+        for full_name, doc, pymod, method_objs in modules:
+            self.get_rpc_module(full_name, doc)
+            if pymod is not None:
+                self._initialized_pymods[pymod] = full_name
+                self.pymods[full_name] = pymod
+                postinit_callable = getattr(pymod, RPC_POSTINIT, None)
+                if postinit_callable is None:
+                    postinit_callable = self._default_postinit_callable
+                self._mod_postinit(postinit_callable, self._postinit_kwargs,
+                                   pymod, full_name)
+            for local_name, callable_obj, method_info in method_objs:
+                self.add_rpc_method(full_name, local_name, callable_obj,
+                                    help_text=method_info['help'],
+                                    arg_spec=method_info['signature'])
+        return True
+
+    def _add_lazy_entry(self, name, lazy_entry):
+
+        """Create RPC-modules and RPC-method placeholders from a manifest entry"""
+
+        for module_info in lazy_entry.manifest_entry['modules']:
+            self.get_rpc_module(str(module_info['name']), module_info['doc'])
+        for method_info in lazy_entry.manifest_entry['methods']:
+            full_name = str(method_info['name'])
+            module_full_name, local_name = full_name.rsplit('.', 1)
+            rpc_method = LazyRPCMethod(self, name, full_name,
+                                       method_info['help'],
+                                       readonly=method_info['readonly'],
+                                       job=method_info['job'],
+                                       spill=method_info['spill'])
+            self.item_dict[module_full_name].add_method(local_name, rpc_method)
+            self.item_dict[full_name] = rpc_method
+        self.lazy_entries[name] = lazy_entry
+
+    def load_lazy_entry(self, name):
+
+        """Import and post-initialize a lazily loaded top-level module
+
+        (the RPC-methods it defines replace the placeholders).
+
+        """
+
+        with self._lazy_lock:
+            lazy_entry = self.lazy_entries.get(name)
+            if lazy_entry is None or lazy_entry.loading:
+                return  # (already loaded or being loaded by this thread)
+            lazy_entry.loading = True
+            try:
+                module = lazy_entry.import_module()
+            except:
+                lazy_entry.loading = False
+                raise
+            placeholder_names = set(str(method_info['name']) for method_info
+                                    in lazy_entry.manifest_entry['methods'])
+            for full_name in placeholder_names:
+                del self.item_dict[full_name]
+                module_full_name, local_name = full_name.rsplit('.', 1)
+                self.item_dict[module_full_name].remove_method(local_name)
+            manifest_entry = lazy_entry.manifest_entry
+            try:
+                self._build_entry(name, module,
+                                  manifest_entry if manifest.is_up_to_date(manifest_entry)
+                                  else None)
+            finally:
+                del self.lazy_entries[name]
+            method_names = set(full_name for full_name, rpc_object
+                               in self.all_items(name, deep=True)
+                               if isinstance(rpc_object, RPCMethod))
+            if method_names != placeholder_names:
+                warnings.warn('RPC-tree manifest is out of date -- RPC-methods '
+                              'of {0} missing: [{1}], not in the manifest: [{2}]'
+                              .format(name,
+                                      ', '.join(sorted(placeholder_names - method_names)),
+                                      ', '.join(sorted(method_names - placeholder_names))))
+
+    def write_manifest(self, path):
+        """Write the manifest of the tree (see: the manifest module)"""
+        manifest.write_manifest(self, path)
 
     def _build_subtree(self, cur_pymod, cur_full_name,
                        default_postinit_callable, postinit_kwargs,
@@ -472,6 +881,7 @@ class RPCTree(Mapping):
                 return
             # declare (create if needed) RPC-module
             self.get_rpc_module(cur_full_name, doc)
+            self.pymods[cur_full_name] = cur_pymod
             # post-init on Python module
             if postinit_callable is None:
                 postinit_callable = default_postinit_callable
@@ -549,10 +959,12 @@ class RPCTree(Mapping):
                            .format(full_name, pymod, exc.args[0], _kwargs))
 
         # run the post-init callable
-        postinit_callable(**this_postinit_kwargs)
+        with self._profile.phase('postinits', full_name):
+            postinit_callable(**this_postinit_kwargs)
 
-    def add_rpc_method(self, module_full_name, method_local_name, callable_obj):
-        """Add RPC-method"""
+    def add_rpc_method(self, module_full_name, method_local_name, callable_obj,
+                       help_text=None, arg_spec=None):
+        """Add RPC-method (see: RPCMethod for `help_text' and `arg_spec')"""
 
         if not callable(callable_obj):
             return
@@ -565,7 +977,8 @@ class RPCTree(Mapping):
         assert method_full_name not in self.item_dict
 
         rpc_module = self.item_dict[module_full_name]
-        rpc_method = RPCMethod(callable_obj, method_full_name)
+        rpc_method = RPCMethod(callable_obj, method_full_name,
+                               help_text=help_text, arg_spec=arg_spec)
         rpc_module.add_method(method_local_name, rpc_method)
         self.item_dict[method_full_name] = rpc_method
 
@@ -607,16 +1020,23 @@ class RPCTree(Mapping):
 
         return rpc_module
 
-    def try_to_obtain(self, full_name, access_dict, required_type=None):
+    def try_to_obtain(self, full_name, access_dict, required_type=None, load=True):
+
+        """Restricted access: get RPC-module/method only if key matches keyhole
 
-        """Restricted access: get RPC-module/method only if key matches keyhole"""
+        If `load' is false, a LazyRPCMethod placeholder is returned as it
+        is -- without loading its module (and without authorization,
+        which needs the actual RPC-method), e.g. to get its help text.
+
+        """
 
         # RPC-object name must be a key in the RPC-tree
         try:
-            rpc_object = self[full_name]
+            rpc_object = self._get_item(full_name, load)
         except KeyError:
             raise RPCNotFoundError('RPC-name not found: {0}'.format(full_name))
-        rpc_object.authorize(**access_dict)
+        if not isinstance(rpc_object, LazyRPCMethod):
+            rpc_object.authorize(**access_dict)
         return rpc_object
 
     #
@@ -731,7 +1151,19 @@ class RPCTree(Mapping):
 
     def __getitem__(self, full_name):
         """Get RPC-module or method (by full name)"""
-        return self.item_dict[full_name]
+        return self._get_item(full_name, load=True)
+
+    def _get_item(self, full_name, load):
+        try:
+            rpc_object = self.item_dict[full_name]
+        except KeyError:
+            if not self.lazy_entries:
+                raise
+            with self._lazy_lock:  # (wait for a lazy load in progress)
+                rpc_object = self.item_dict[full_name]
+        if load and isinstance(rpc_object, LazyRPCMethod):
+            rpc_object = rpc_object.load()
+        return rpc_object
 
     def __contains__(self, full_name):
         """Check existence of (full) name"""
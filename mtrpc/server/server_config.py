@@ -1,13 +1,12 @@
 import json
 
-import pkg_resources
-from jsonschema import validators, Draft4Validator
-
+from mtrpc.server import startup
 from mtrpc.server.config import loader
 from mtrpc.server.methodtree import RPCTree
 
 
 def extend_with_default(validator_class):
+    from jsonschema import validators
     validate_properties = validator_class.VALIDATORS["properties"]
 
     def set_defaults(validator, properties, instance, schema):
@@ -21,7 +20,16 @@ def extend_with_default(validator_class):
     return validators.extend(validator_class, {"properties": set_defaults})
 
 
-DefaultValidatingDraft4Validator = extend_with_default(Draft4Validator)
+# (jsonschema is imported when the first config is validated)
+_default_validating_validator = None
+
+
+def get_default_validating_validator():
+    global _default_validating_validator
+    if _default_validating_validator is None:
+        from jsonschema import Draft4Validator
+        _default_validating_validator = extend_with_default(Draft4Validator)
+    return _default_validating_validator
 
 
 def load_config(config_path):
@@ -41,6 +49,7 @@ def load_config(config_path):
         return ['{key}: {value}'.format(key=key, value=value)]
 
     if ':' in config_path:
+        import pkg_resources
         package, relative_path = config_path.split(':', 1)
 
         resource_manager = pkg_resources.ResourceManager()
@@ -53,11 +62,18 @@ def load_config(config_path):
 
 class ServerConfig(object):
 
-    def __init__(self, config_paths, server_class, rpc_tree_class=RPCTree):
+    # if profile (a startup.StartupProfile) is given, durations of startup
+    # phases are recorded in it; with profile_report set to a file the
+    # report is written to that file just before the server is started
+    def __init__(self, config_paths, server_class, rpc_tree_class=RPCTree,
+                 profile=None, profile_report=None):
+        self.profile = profile if profile is not None else startup.NULL_PROFILE
+        self.profile_report = profile_report
         config_dict = {}
-        for p in config_paths:
-            fp = load_config(p)
-            config_dict = loader.load_props(fp, config_dict)
+        with self.profile.phase('config load'):
+            for p in config_paths:
+                fp = load_config(p)
+                config_dict = loader.load_props(fp, config_dict)
         self.config_dict = config_dict
         self.server_class = server_class
         self.rpc_tree_class = rpc_tree_class
@@ -66,20 +82,36 @@ class ServerConfig(object):
 
     def validate_config(self, cls):
         if hasattr(cls, 'CONFIG_SCHEMAS'):
+            validator_class = get_default_validating_validator()
             for schema in cls.CONFIG_SCHEMAS:
-                validator = DefaultValidatingDraft4Validator(schema)
+                validator = validator_class(schema)
                 validator.validate(self.config_dict)
 
     def validate(self):
-        self.validate_config(self.rpc_tree_class)
-        self.validate_config(self.server_class)
+        with self.profile.phase('config validation'):
+            self.validate_config(self.rpc_tree_class)
+            self.validate_config(self.server_class)
 
     def run(self, final_callback=None):
         self.validate()
-        self.rpc_tree = self.rpc_tree_class.load(self.config_dict, rpc_mode=self.server_class.RPC_MODE)
-        server = self.server_class(self.config_dict)
+        self.rpc_tree = self.rpc_tree_class.load(self.config_dict,
+                                                 rpc_mode=self.server_class.RPC_MODE,
+                                                 profile=self.profile)
+        with self.profile.phase('server init'):
+            server = self.server_class(self.config_dict)
+        if self.profile_report is not None:
+            print >>self.profile_report, self.profile.format_report()
+            self.profile_report.flush()
         server.start(self.rpc_tree, final_callback=final_callback)
 
+    def write_manifest(self, path):
+        """Load the RPC-tree (not lazily) and write its manifest"""
+        self.validate()
+        config_dict = dict(self.config_dict)
+        config_dict['rpc_tree_init'] = dict(config_dict['rpc_tree_init'], lazy=False)
+        rpc_tree = self.rpc_tree_class.load(config_dict, rpc_mode=self.server_class.RPC_MODE)
+        rpc_tree.write_manifest(path)
+
     def stop(self):
         if hasattr(self.server, 'stop'):
             self.server.stop()
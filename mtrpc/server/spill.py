@@ -0,0 +1,217 @@
+# mtrpc/server/spill.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""MTRPC-server spill store -- for large results.
+
+If the serialized (JSON) result of an RPC-method call is larger than the
+`spill_threshold' (an RPCManager attribute; None by default => results
+are never spilled), it is not sent in the response message: it is written
+into a temporary file (items of a list result are serialized one by one,
+so the whole JSON text is never built in memory) which is then memory-
+mapped; the response contains only a small "spilled" member instead of
+the result:
+
+    {"handle": <a random, hard to guess string>,
+     "size": <size of the JSON text>,
+     "chunk_size": <size of a chunk>,
+     "chunks": <number of chunks>}
+
+The JSON text is to be fetched chunk by chunk with the system.spill_read
+RPC-method (and then joined and deserialized by the client); when no
+longer needed, it can be freed with system.spill_release.
+
+Spilled results are evicted when not accessed for `ttl' seconds, and
+also -- the least recently used first -- when their total size would
+exceed the `disk_budget' (a result that alone would exceed it cannot be
+spilled -- RPCServerSerializationError is sent instead).
+
+The store used by the server is the `spill_store' module attribute; its
+limits can be changed by setting its attributes.
+
+"""
+
+import mmap
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from ..common import encoding
+from ..common.errors import (RPCServerSerializationError, RPCMethodArgError,
+                             RPCSpillNotFoundError)
+
+
+class SpilledResult(object):
+
+    """A JSON text (of a result) in a memory-mapped temporary file"""
+
+    def __init__(self, file_obj, size, chunk_size):
+        self.id = uuid.uuid4().hex
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunks = (size + chunk_size - 1) // chunk_size
+        self.last_access = time.time()
+        self._file = file_obj
+        self._mmap = mmap.mmap(file_obj.fileno(), size, access=mmap.ACCESS_READ)
+
+    def info(self):
+        return dict(handle=self.id,
+                    size=self.size,
+                    chunk_size=self.chunk_size,
+                    chunks=self.chunks)
+
+    def read(self, chunk):
+        if not 0 <= chunk < self.chunks:
+            raise RPCMethodArgError('Bad chunk number: {0!r} (the result has '
+                                    '{1} chunks)'.format(chunk, self.chunks))
+        offset = chunk * self.chunk_size
+        return self._mmap[offset:offset + self.chunk_size]
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()  # (the file has no name -- so it is deleted)
+
+
+class _SpillWriter(object):
+
+    """Collects pieces of a JSON text; moves them to a file when too many"""
+
+    buffer_size = 1 << 16
+
+    def __init__(self, store, threshold):
+        self.store = store
+        self.threshold = threshold
+        self.pieces = []
+        self.buffered = 0
+        self.size = 0
+        self.file = None
+
+    def write(self, piece):
+        self.pieces.append(piece)
+        self.buffered += len(piece)
+        self.size += len(piece)
+        if self.file is None:
+            if self.size > self.threshold:
+                self.file = tempfile.TemporaryFile(prefix='mtrpc-spill-',
+                                                   dir=self.store.directory)
+                self.flush()
+        elif self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.store._reserve(self.buffered)
+        data = ''.join(self.pieces)
+        self.pieces = []
+        self.buffered = 0
+        self.file.write(data)
+
+
+class SpillStore(object):
+
+    """Keeps spilled results, evicts them by TTL and by the disk budget"""
+
+    chunk_size = 1 << 20  # (in bytes, of the JSON text)
+    ttl = 600  # (in seconds, since the last access)
+    disk_budget = 1 << 30  # (in bytes, for all spilled results)
+    directory = None  # (for temporary files; None => the system default)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # maps ids to results (least recently used first)
+        self._used = 0  # (bytes of stored and being written results)
+
+    def dump(self, obj, threshold):
+
+        """Serialize obj; return a pair: (<JSON text>, None) or (None, <info>)
+
+        -- the latter if the JSON text is larger than `threshold' bytes
+        (then it is spilled; <info> is a dict to be sent to the client).
+
+        """
+
+        writer = _SpillWriter(self, threshold)
+        try:
+            for piece in encoding.iterdumps(obj):
+                writer.write(piece)
+            if writer.file is None:
+                return ''.join(writer.pieces), None
+            writer.flush()
+            writer.file.flush()
+            result = SpilledResult(writer.file, writer.size, self.chunk_size)
+        except BaseException:
+            if writer.file is not None:
+                writer.file.close()
+                self._release(writer.size - writer.buffered)
+            raise
+        with self._lock:
+            self._results[result.id] = result
+        return None, result.info()
+
+    def read(self, handle, chunk):
+        """Get the chunk (a part of the JSON text) of the spilled result"""
+        with self._lock:
+            self._purge()
+            result = self._results.pop(handle, None)
+            if result is None:
+                raise RPCSpillNotFoundError('No spilled result {0!r} (unknown '
+                                            'handle or the result has already '
+                                            'been evicted)'.format(handle))
+            result.last_access = time.time()
+            self._results[handle] = result  # (now the most recently used)
+            return result.read(chunk)
+
+    def release(self, handle):
+        """Free the spilled result; return False if there was no such one"""
+        with self._lock:
+            result = self._results.pop(handle, None)
+        if result is None:
+            return False
+        result.close()
+        self._release(result.size)
+        return True
+
+    def stats(self):
+        with self._lock:
+            self._purge()
+            return dict(results=len(self._results),
+                        disk_used=self._used,
+                        disk_budget=self.disk_budget)
+
+    def _reserve(self, size):
+        with self._lock:
+            self._purge()
+            evicted = []
+            while self._used + size > self.disk_budget and self._results:
+                evicted.append(self._evict(next(iter(self._results))))
+            if self._used + size > self.disk_budget:
+                raise RPCServerSerializationError('Result too large -- its size '
+                                                  'exceeds the server disk budget '
+                                                  'for spilled results')
+            self._used += size
+        for result in evicted:
+            result.close()
+
+    def _release(self, size):
+        with self._lock:
+            self._used -= size
+
+    def _purge(self):
+        # (to be called with the lock held)
+        expired_before = time.time() - self.ttl
+        results = self._results
+        while results:
+            handle, result = next(results.iteritems())
+            if result.last_access >= expired_before:
+                break
+            self._evict(handle).close()
+
+    def _evict(self, handle):
+        # (to be called with the lock held)
+        result = self._results.pop(handle)
+        self._used -= result.size
+        return result
+
+
+spill_store = SpillStore()
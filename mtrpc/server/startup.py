@@ -0,0 +1,88 @@
+# mtrpc/server/startup.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""MTRPC-server startup profiling.
+
+A StartupProfile instance collects durations of startup phases (imports,
+config loading and validation, RPC-tree building, RPC-module post-inits
+etc.): code of a phase is executed within `with profile.phase(name):'
+-- optionally with `detail' (e.g. the module name) to have durations of
+particular items of the phase recorded as well. Phases can be nested:
+the time of an inner phase is not counted as time of the outer one.
+
+The report (format_report()) is what the `--profile-startup' option of
+the server script (see: mtrpc.server.__main__) prints.
+
+"""
+
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+
+class StartupProfile(object):
+
+    """Collects durations of server startup phases"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases = OrderedDict()  # maps phase names to durations (in seconds)
+        self.items = defaultdict(list)  # maps phase names to (detail, duration) lists
+        self._stack = []  # (of [phase name, duration of inner phases])
+
+    @contextmanager
+    def phase(self, name, detail=None):
+        frame = [name, 0.0]
+        self._stack.append(frame)
+        start = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - start
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][1] += duration
+            self.phases[name] = self.phases.get(name, 0.0) + duration - frame[1]
+            if detail is not None:
+                self.items[name].append((detail, duration))
+
+    def format_report(self, top=5):
+        """Return the report (a string) -- including `top' slowest items of each phase"""
+
+        total = time.time() - self.started
+        lines = ['Startup profile (total: {0:.3f} s):'.format(total)]
+        phases = self.phases.items()
+        phases.append(('(other)', max(total - sum(self.phases.itervalues()), 0.0)))
+        for name, duration in phases:
+            lines.append('  {0:40} {1:8.3f} s {2:6.1%}'.format(
+                    name, duration, duration / total if total else 0.0))
+            items = sorted(self.items.get(name, ()), key=lambda item: -item[1])
+            for detail, item_duration in items[:top]:
+                lines.append('      {0:36} {1:8.3f} s'.format(detail or '(root)',
+                                                              item_duration))
+            if len(items) > top:
+                lines.append('      ({0} more)'.format(len(items) - top))
+        return '\n'.join(lines)
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+class NullProfile(object):
+
+    """Collects nothing (used when no profile is given)"""
+
+    _null_phase = _NullPhase()
+
+    def phase(self, name, detail=None):
+        return self._null_phase
+
+
+NULL_PROFILE = NullProfile()
@@ -7,12 +7,20 @@
 
 import __builtin__
 
-from ..common.utils import basic_postinit
-
-
-__rpc_doc__ = u'Standard MTRPC introspection methods'
-__rpc_methods__ = 'list', 'list_string', 'help', 'help_string'
+from ..common.errors import RPCMethodArgError
+from ..common.utils import basic_postinit, materialize, parallel_map
+from . import jobs
+from . import methodtree
+from . import spill
+from . import threads
+
+
+__rpc_doc__ = u'Standard MTRPC introspection (and auxiliary) methods'
+__rpc_methods__ = ('list', 'list_string', 'help', 'help_string', 'map', 'bulk_stats',
+                   'notification_stats', 'job_status', 'job_result', 'cancel',
+                   'spill_read', 'spill_release', 'spill_stats')
 rpc_tree = None  # set by __rpc_postinit__
+max_map_parallelism = 8  # (can be set with "mod_globals" config section)
 
 
 def __rpc_postinit__(rpc_tree, mod, full_name, logging_settings, mod_globals):
@@ -100,6 +108,227 @@ def help_string(name, deep=False):
 help_string.readonly = True
 
 
+def map(method_name, params_list, parallelism=1):
+    u"""Call a method many times -- once for each of given argument sets.
+
+    Arguments:
+
+    * method_name (string) -- full (absolute) name of the method,
+      e.g. 'module.some.method';
+    * params_list (list) -- argument sets, each being a list (of
+      positional arguments) or a dict (of keyword arguments);
+    * parallelism (int) -- max. number of concurrent calls (limited
+      by the server settings).
+
+    Result: a list of dicts {"result": <result>, "error": <error>}
+    -- one for each argument set (in the same order); error is null or
+    a dict {"name": ..., "message": ..., "data": ...} (as in responses).
+
+    """
+
+    access_dict = getattr(threads.call_context, 'access_dict', None) or {}
+    cancel_token = getattr(threads.call_context, 'cancel_token', None)
+    # resolved and authorized once (not for each argument set)
+    rpc_method = rpc_tree.try_to_obtain(method_name, access_dict,
+                                        required_type=methodtree.RPCMethod)
+    if not isinstance(rpc_method, methodtree.RPCMethod):
+        raise RPCMethodArgError('{0} is not an RPC-method'.format(method_name))
+    if not isinstance(params_list, __builtin__.list):
+        raise RPCMethodArgError('params_list must be a list')
+    try:
+        parallelism = max(1, min(int(parallelism), max_map_parallelism))
+    except (TypeError, ValueError):
+        raise RPCMethodArgError('parallelism must be an integer')
+
+    def call(params):
+        threads.call_context.access_dict = access_dict
+        threads.call_context.cancel_token = cancel_token
+        try:
+            # (argument sets not started yet are dropped on cancellation)
+            threads.check_cancelled()
+            if isinstance(params, dict):
+                result = materialize(rpc_method(**params))
+            elif isinstance(params, __builtin__.list):
+                result = materialize(rpc_method(*params))
+            else:
+                raise RPCMethodArgError('Argument set must be a list or dict: '
+                                        '{0!r}'.format(params))
+        except RPCMethodArgError as exc:
+            exc.args = tuple(arg.replace('{name}', method_name)
+                             if isinstance(arg, basestring) else arg
+                             for arg in exc.args)
+            return dict(result=None, error=threads.format_exception(__rpc_log__))
+        except Exception:
+            __rpc_log__.debug('Error in %s call (within system.map):',
+                              method_name, exc_info=True)
+            return dict(result=None, error=threads.format_exception(__rpc_log__))
+        finally:
+            threads.call_context.access_dict = None
+            threads.call_context.cancel_token = None
+        return dict(result=result, error=None)
+
+    return parallel_map(call, params_list, parallelism)
+
+
+def bulk_stats(module_name='', deep=True):
+    u"""Get statistics of bulk-served methods (batch sizes achieved).
+
+    Arguments:
+
+    * module_name (string) -- full (absolute) name of a particular module,
+      e.g. '', 'system', 'module.some.other';
+    * deep (bool) -- if set to True (default), include methods from all
+      the subtree, not only direct children.
+
+    Result: a dict that maps full method names to dicts with keys:
+    "calls", "batches", "mean_batch_size", "max_batch_size" and
+    "size_histogram" (maps size ranges, e.g. "4-7", to numbers of
+    batches) -- for methods defined with the `bulk' attribute.
+
+    """
+
+    return dict((name, item.bulk_dispatcher.stats())
+                for name, item in _iter_mod_subitems(module_name, deep)
+                if getattr(item, 'bulk_dispatcher', None) is not None)
+bulk_stats.readonly = True
+
+
+def notification_stats():
+    u"""Get statistics of executed notifications (requests with null id).
+
+    Result: a dict with keys: "executed" (number of notifications
+    executed), "failed" (number of failed ones), "failed_by_method" (maps
+    full method names to numbers of failures) and "recent_failures"
+    (a list of dicts {"method": ..., "error": ..., "time": ...}; error is
+    a dict {"name": ..., "message": ..., "data": ...}).
+
+    Notifications get no responses -- so this (and the server log) is
+    the only place where their failures are recorded.
+
+    """
+
+    return threads.notification_stats.stats()
+notification_stats.readonly = True
+
+
+def job_status(job_id):
+    u"""Get the status of a job (a call of an RPC-method declared as a job).
+
+    Arguments:
+
+    * job_id (string) -- returned by the call of the job RPC-method.
+
+    Result: a dict with keys: "id", "method" (full method name), "status"
+    ("queued", "running", "done" or "failed"), "submitted", "started" and
+    "finished" (Unix timestamps or null).
+
+    RPCJobNotFoundError is raised for unknown (or expired) job ids.
+
+    """
+
+    return jobs.job_pool.status(job_id)
+job_status.readonly = True
+
+
+def job_result(job_id, wait=0):
+    u"""Get the result of a job (or its error -- raised as for other calls).
+
+    Arguments:
+
+    * job_id (string) -- returned by the call of the job RPC-method;
+    * wait (number) -- how many seconds to wait for the job completion
+      (0 by default; limited by the server settings), so that repeated
+      calls with non-zero `wait' can be used to await the completion.
+
+    RPCJobNotDoneError is raised if the job has not been completed
+    (within the wait time); RPCJobNotFoundError -- for unknown (or
+    expired) job ids.
+
+    """
+
+    return jobs.job_pool.result(job_id, wait)
+job_result.readonly = True
+
+
+def cancel(request_id):
+    u"""Cancel a request sent earlier by the same client.
+
+    Arguments:
+
+    * request_id -- id of the request to be cancelled (only requests
+      sent with the same reply-to queue as this call can be cancelled).
+
+    A request that has not been started yet is dropped (its response is
+    an RPCRequestCancelledError); a running RPC-method is notified -- it
+    may stop early if it checks for cancellation (see: check_cancelled()
+    in mtrpc.server.threads).
+
+    It is intended to be sent as a notification, with the routing key
+    of the request being cancelled (so that it reaches the same server).
+    If several server instances consume the same request queue, it may
+    be delivered to an instance other than the one executing the request
+    -- then it has no effect there.
+
+    Result: true if the request was being executed, false otherwise
+    (then the cancellation is remembered for a while -- in case the
+    request comes later).
+
+    """
+
+    access_dict = getattr(threads.call_context, 'access_dict', None) or {}
+    return threads.cancellations.cancel(access_dict.get('reply_to'), request_id)
+
+
+def spill_read(handle, chunk):
+    u"""Get a chunk of a spilled (large) result.
+
+    Arguments:
+
+    * handle (string) -- from the "spilled" member of the response (that
+      is sent instead of the result if it is too large);
+    * chunk (int) -- chunk number (from 0 to the number of chunks - 1).
+
+    Result: a string -- the chunk of the JSON text of the spilled result
+    (the whole text is to be joined from all chunks, in order, and then
+    deserialized).
+
+    RPCSpillNotFoundError is raised for unknown (or evicted) handles.
+
+    """
+
+    return spill.spill_store.read(handle, chunk)
+spill_read.readonly = True
+spill_read.spill = False
+
+
+def spill_release(handle):
+    u"""Free a spilled result (when its chunks are no longer needed).
+
+    Arguments:
+
+    * handle (string) -- from the "spilled" member of the response.
+
+    Result: true if the result has been freed, false if there was no such
+    one (unknown or already evicted handle).
+
+    """
+
+    return spill.spill_store.release(handle)
+
+
+def spill_stats():
+    u"""Get statistics of spilled (large) results.
+
+    Result: a dict with keys: "results" (number of spilled results being
+    kept), "disk_used" and "disk_budget" (total size of them and its
+    limit, in bytes).
+
+    """
+
+    return spill.spill_store.stats()
+spill_stats.readonly = True
+
+
 #
 # Private functions (containing the actual implementation)
 #
@@ -116,7 +345,8 @@ def _iter_signatures(module_name, deep):
 def _iter_help_texts(name, deep):
     """Iterate over module/method help-texts"""
 
-    rpc_obj = rpc_tree.try_to_obtain(name, access_dict={})
+    # (help texts of lazily loaded methods come from the manifest)
+    rpc_obj = rpc_tree.try_to_obtain(name, access_dict={}, load=False)
 
     yield rpc_obj.__doc__
 
@@ -107,25 +107,48 @@ Responder exchange type:
 Responder (publisher) queue name:
 * got from `reply_to' attribute of request message.
 
+(Cancellations -- see: the system.cancel RPC-method -- are recorded in
+the `cancellations' registry: requests not being executed yet are dropped,
+running RPC-methods can check it, see: check_cancelled().)
+
+(Results larger than RPCManager's `spill_threshold' are not sent in
+response messages but spilled into temporary files, to be fetched chunk
+by chunk, see: the mtrpc.server.spill module.)
+
+(Iterator -- e.g. generator -- results are sent in chunks, as a series
+of responses, see: RPCTaskThread.send_stream(); their task threads put
+PartialResult instances into the result fifo, followed by a Result.)
+
+(Notifications -- requests with null id -- are executed without sending
+any responses; their task threads put NoResult instances into the result
+fifo, only to let the responder forget the tasks.)
+
+(Responses to requests with "direct reply-to" pseudo-queue names -- see:
+mtrpc.common.const.DIRECT_REPLY_TO_QUEUE -- are sent via the default
+exchange.)
+
+(The manager and the responder do not use any AMQP library directly but
+transports -- chosen with the 'transport' item of `amqp_params', see:
+the mtrpc.common.transport module; the responder, when stopping, wakes
+up the manager with the manager transport's wakeup().)
+
 """
 
 import abc
+import collections
 import functools
 import hashlib
 import logging
-import os
-import select
 import threading
 import time
-from collections import namedtuple
-
-from amqplib import client_0_8 as amqp
-from amqplib.client_0_8 import transport as amqp_transport
+from collections import namedtuple, OrderedDict
 
+from . import capture
 from . import methodtree
-import errno
+from . import spill
 from ..common import utils
 from ..common import encoding
+from ..common import transport
 from ..common.const import *
 from ..common.errors import *
 
@@ -140,8 +163,167 @@ Stopping = namedtuple('Stopping', 'reason loglevel')
 BindingProps = namedtuple('BindingProps', 'exchange routing_key')
 Task = namedtuple('Task', 'id request_message access_dict reply_to')
 Result = namedtuple('Result', 'task_id reply_to response_message')
+# (a chunk of a streamed result -- not the last one; `sent' is an Event
+# set by the responder when the message has been published)
+PartialResult = namedtuple('PartialResult', 'task_id reply_to response_message sent')
 NoResult = namedtuple('NoResult', 'task_id')
 RPCRequest = namedtuple('RPCRequest', 'id method params kwparams')
+RPCBatch = namedtuple('RPCBatch', 'items')  # (items: not checked yet)
+
+
+# per-thread info about the RPC-request being executed -- attributes:
+# * access_dict (see: RPCManager.create_access_dict()),
+# * cancel_token (a CancellationToken instance)
+# (set by RPCTaskThread.call_rpc_method(); used e.g. by system.map())
+call_context = threading.local()
+
+
+class CancellationToken(object):
+
+    """Cancellation flag of an RPC-request (see: check_cancelled())"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        "Wait (e.g. instead of time.sleep()) until cancelled; return the flag"
+        return self._event.wait(timeout)
+
+
+class CancellationRegistry(object):
+
+    """Thread-safe registry of cancellation tokens of RPC-requests.
+
+    Requests are identified by (reply-to queue, request id) pairs -- so
+    a client can cancel only its own requests (see: system.cancel
+    RPC-method). Cancellations of requests not registered (yet) are
+    remembered -- up to `max_remembered' of them -- so that such requests
+    are dropped when they come.
+
+    """
+
+    max_remembered = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}  # maps (reply-to, request id) to tokens
+        self._cancelled = OrderedDict()  # not registered cancelled requests
+
+    def register(self, reply_to, request_id):
+        "Get a new token for the request (cancelled if cancellation came first)"
+        key = reply_to, request_id
+        token = CancellationToken()
+        with self._lock:
+            if self._cancelled.pop(key, None) is not None:
+                token.cancel()
+            self._tokens[key] = token
+        return token
+
+    def unregister(self, reply_to, request_id):
+        with self._lock:
+            self._tokens.pop((reply_to, request_id), None)
+
+    def cancel(self, reply_to, request_id):
+        "Cancel the request; return True if it is registered (being executed)"
+        key = reply_to, request_id
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is None:
+                self._cancelled[key] = True
+                while len(self._cancelled) > self.max_remembered:
+                    self._cancelled.popitem(last=False)
+                return False
+        token.cancel()
+        return True
+
+
+cancellations = CancellationRegistry()
+
+
+def check_cancelled():
+
+    """Raise RPCRequestCancelledError if the current request is cancelled.
+
+    To be called by long-running RPC-methods from time to time (they can
+    also use call_context.cancel_token directly, e.g. its wait() method).
+
+    """
+
+    token = getattr(call_context, 'cancel_token', None)
+    if token is not None and token.is_cancelled():
+        raise RPCRequestCancelledError('Request cancelled by the client')
+
+
+class NotificationStats(object):
+
+    """Thread-safe statistics of executed notifications (null-id requests).
+
+    Notifications get no responses, so their failures are recorded only
+    in the server log and here (see: system.notification_stats RPC-method).
+
+    """
+
+    max_failures_remembered = 20
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._failed = collections.Counter()  # maps method names to counts
+        self._recent_failures = collections.deque(
+                maxlen=self.max_failures_remembered)
+
+    def record(self, method_name, error=None):
+        "Record an executed notification (`error' -- a format_exception() dict)"
+        with self._lock:
+            self._executed += 1
+            if error is not None:
+                self._failed[method_name] += 1
+                self._recent_failures.append(dict(method=method_name,
+                                                  error=error,
+                                                  time=time.time()))
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                executed=self._executed,
+                failed=sum(self._failed.itervalues()),
+                failed_by_method=dict(self._failed),
+                recent_failures=list(self._recent_failures),
+            )
+
+
+notification_stats = NotificationStats()
+
+
+def format_exception(log):
+
+    """Get the current exception as a dict (to be put into a response).
+
+    The dict contains 'name', 'message' and 'data' items.
+
+    """
+
+    exc_type, exc = sys.exc_info()[:2]
+
+    try:
+        exc_dict = exc.__getstate__()
+    except AttributeError:
+        exc_dict = exc.__dict__
+
+    try:
+        encoding.dumps(exc_dict)
+    except TypeError:
+        log.warning('Unserializable exception __dict__ ({0}): {1!r}'.format(
+            exc_type.__name__, exc_dict))
+        exc_dict = None
+
+    return dict(name=exc_type.__name__, message=str(exc), data=exc_dict)
 
 
 #
@@ -280,7 +462,7 @@ class ServiceThread(threading.Thread):
 
 
 class AMQPClientServiceThread(ServiceThread):
-    """Abstract class: service thread being AMQP client"""
+    """Abstract class: service thread being AMQP client (via a transport)"""
 
     connect_attempts = 0  # attempts to (re)connect (0 means infinity)
     try_action_attempts = 0  # attempts to (re)try action (0 means infinity)
@@ -293,8 +475,7 @@ class AMQPClientServiceThread(ServiceThread):
         """A problem with AMQP connection"""
 
     def __init__(self, *args, **kw):
-        self.amqp_conn = None
-        self.amqp_channel = None
+        self.transport = None
         self._amqp_params = None
         self._is_connected = False
         super(AMQPClientServiceThread, self).__init__(*args, **kw)
@@ -303,13 +484,15 @@ class AMQPClientServiceThread(ServiceThread):
         """Initialization specific to AMQP client.
 
         Argument:
-        * amqp_params -- dict of keyword arguments for amqp.Connection(),
-          see docs of amqplib.client_0_8.Connection.__init__() for details.
+        * amqp_params -- dict of keyword arguments for the transport class
+          (by default: for amqplib.client_0_8.Connection()), optionally with
+          the 'transport' item -- see: mtrpc.common.transport.from_params().
 
         """
 
         amqp_params.update(amqp_params.pop('kwargs', {}))
         self._amqp_params = amqp_params
+        self.transport = transport.from_params(amqp_params)
         self._is_connected = False
 
     def starting_action(self):
@@ -323,23 +506,22 @@ class AMQPClientServiceThread(ServiceThread):
     def amqp_init(self):
         """Init AMQP communication"""
         self.log.info('Initializing AMQP channel and connection...')
-        self.amqp_conn = self._new_amqp_conn(self._amqp_params)
-        self.amqp_channel = self.amqp_conn.channel()
-        self.amqp_channel.basic_qos(prefetch_size=0, prefetch_count=1, a_global=False)
+        self._connect()
+        self.transport.qos(prefetch_count=1)
         self._is_connected = True
 
-    def _new_amqp_conn(self, amqp_params):
-        """Create and return AMQP connection, retry a number of times if failed"""
+    def _connect(self):
+        """Connect the transport, retry a number of times if failed"""
 
-        host_descr = amqp_params.get('host', '<default adress setting>')
+        host_descr = self._amqp_params.get('host', '<default adress setting>')
 
         attempt_nr = 0
         while not self.stopping:
-            self.log.info('Connecting to AMQP broker at %s...', host_descr)
+            self.log.info('Connecting to AMQP broker at %s (%s)...',
+                          host_descr, self.transport.__class__.__name__)
             try:
-                conn = amqp.Connection(**amqp_params)
-                utils.setkeepalives(conn.transport.sock)
-                return conn
+                self.transport.connect()
+                return
             except Exception as exc:
                 self.log.warning('Connection failed')
                 self.log.debug('Exception info:', exc_info=True)
@@ -359,10 +541,7 @@ class AMQPClientServiceThread(ServiceThread):
         if self._is_connected:
             self.log.info('Closing AMQP channel and connection...')
             try:
-                try:
-                    self.amqp_channel.close()
-                finally:
-                    self.amqp_conn.close()
+                self.transport.close()
             except Exception as exc:
                 self.log.warning('Error when trying to close '
                                  'AMQP channel or connection: %s', exc)
@@ -437,94 +616,27 @@ class RPCManager(AMQPClientServiceThread):
     #wakeup_routing_key = 'wakeup'
     sel_timeout = 60
 
-    instance_counter = itertools.count(1)
-
-    #
-    # Auxiliary classes related to TCP-transport of AMQP method reader
-
-    class _AbstractTransportWrapper(object):
-
-        read_frame = amqp_transport._AbstractTransport.read_frame.__func__
-
-        def __init__(self, manager, transport):
-            self.RTW__orig_transport = transport
-
-        def RTW__get_unwrapped(self):
-            return self.RTW__orig_transport
-
-    class SSLTransportWrapper(_AbstractTransportWrapper):
-
-        _read = amqp_transport.SSLTransport._read.__func__
-
-        def __init__(self, manager, transport):
-            self.sslobj = RPCManager.SockWrapper(manager, transport.sock, 'read')
-            super(self.__class__, self).__init__(manager, transport)
-
-    class TCPTransportWrapper(_AbstractTransportWrapper):
-
-        _read = amqp_transport.TCPTransport._read.__func__
-
-        def __init__(self, manager, transport):
-            self.sock = RPCManager.SockWrapper(manager, transport.sock, 'recv')
-            super(self.__class__, self).__init__(manager, transport)
-            self._read_buffer = transport._read_buffer
+    # max. number of requests of a batch executed concurrently
+    # (by the task thread and its helper threads)
+    batch_parallelism = 1
 
-        def RTW__get_unwrapped(self):
-            transport = super(self.__class__, self).RTW__get_unwrapped()
-            transport._read_buffer = self._read_buffer
-            return transport
+    # max. number of items in one message of a streamed result
+    stream_chunk_size = 100
 
-    class SockWrapper(object):
+    # size (in bytes) of the serialized result above which it is spilled
+    # into a temporary file, see: the mtrpc.server.spill module (None =>
+    # results are never spilled)
+    spill_threshold = None
 
-        def __init__(self, manager, sock, reading_method_name):
-            self.SW__manager = manager
-            self.SW__sock = sock
-            self.SW__sock_reading_method = getattr(sock, reading_method_name)
-            setattr(self, reading_method_name, self.SW__wrapped_reading_method)
+    # path of the capture file to which incoming requests are appended
+    # (None => no capture), the fraction of requests to be recorded and
+    # the max. size (in bytes) of the file (None => no limit), see: the
+    # mtrpc.server.capture module
+    capture_path = None
+    capture_sample_rate = 1.0
+    capture_max_bytes = None
 
-        def SW__wrapped_reading_method(self, *args, **kwargs):
-            resp_stopping_fd_r = self.SW__manager.resp_stopping_fd_r
-            orig_timeout = self.SW__sock.gettimeout()
-            self.SW__sock.settimeout(0)  # non-blocking
-            try:
-                while True:
-                    sel = select.select([self.SW__sock, resp_stopping_fd_r], [], [], self.SW__manager.sel_timeout)[0]
-                    if resp_stopping_fd_r in sel:
-                        try:
-                            os.read(resp_stopping_fd_r, 1)
-                        except EnvironmentError as exc:
-                            if exc.errno in (errno.EAGAIN,
-                                             errno.EWOULDBLOCK):
-                                # nothing really happened -> continue...
-                                # (see: BUGS section of select(2) manpage
-                                # about spurious readiness notifications)
-                                "TODO: log"
-                            else:
-                                # responder-stopping pipe broken?
-                                raise self.SW__manager.RespStopping(self.SW__manager, traceback.format_exc())
-                        else:
-                            # responder-stopping message (closed pipe)
-                            raise self.SW__manager.RespStopping(self.SW__manager, None)
-                    if self.SW__sock in sel:
-                        try:
-                            return self.SW__sock_reading_method(*args, **kwargs)
-                        except EnvironmentError as exc:
-                            if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
-                                # nothing really happened -> continue...
-                                # (see: BUGS section of select(2) manpage
-                                # about spurious readiness notifications)
-                                "TODO: log"
-                            else:
-                                raise
-            finally:
-                self.SW__sock.settimeout(orig_timeout)
-
-    class RespStopping(AMQPClientServiceThread.StoppingException):
-        """Exception raised when stopping request from the responder received"""
-
-        def __init__(self, manager, *args, **kw):
-            manager.unwrap_the_reader_transport()
-            super(self.__class__, self).__init__(*args, **kw)
+    instance_counter = itertools.count(1)
 
     #
     # Methods
@@ -546,8 +658,8 @@ class RPCManager(AMQPClientServiceThread):
         Arguments (to be used for instance creation together with
         ServiceThread-specific arguments, see: ServiceThread.__init__()):
 
-        * amqp_params -- dict of keyword arguments for amqp.Connection(),
-          see docs of amqplib.client_0_8.Connection.__init__() for details;
+        * amqp_params -- dict of keyword arguments for the transport
+          (see: AMQPClientServiceThread.init());
 
         * bindings -- sequence (e.g. list) of BindingProps instances;
 
@@ -622,11 +734,20 @@ class RPCManager(AMQPClientServiceThread):
         self.result_fifo = result_fifo  # (<- shared also with task threads)
         self.mutex = mutex
         self.responder.manager = self
-        self.resp_stopping_fd_r, self.responder.stopping_fd_w = os.pipe()
         self.responder.start()
 
         self.final_callback = final_callback
         self._task_id_gen = itertools.count(1)
+        self._capture = None
+
+    def starting_action(self):
+        """Open the capture file (if any), init AMQP communication"""
+        if self.capture_path is not None:
+            self._capture = capture.CaptureWriter(self.capture_path,
+                                                  self.capture_sample_rate,
+                                                  self.capture_max_bytes)
+            self.log.info('Recording requests to capture file %s...', self.capture_path)
+        AMQPClientServiceThread.starting_action(self)
 
     def amqp_init(self):
         """Init AMQP communication, bind queues/exchanges, declare consuming"""
@@ -637,58 +758,31 @@ class RPCManager(AMQPClientServiceThread):
         try:
             for i, queue in enumerate(self._queues):
                 props = self._queues2bindings[queue]  # binding properties
-                self.amqp_channel.queue_declare(queue=queue,
-                                                durable=True,
-                                                auto_delete=True)
+                self.transport.declare_queue(queue=queue,
+                                             durable=True,
+                                             auto_delete=True)
                 exchange_type = self._exchange_types.get(props.exchange, self.default_exchange_type)
-                self.amqp_channel.exchange_declare(exchange=props.exchange,
-                                                   type=exchange_type,
-                                                   durable=True,
-                                                   auto_delete=False)
-                self.amqp_channel.queue_bind(queue=queue,
-                                             exchange=props.exchange,
-                                             routing_key=props.routing_key)
-                self.amqp_channel.basic_consume(queue=queue,
-                                                no_ack=False,
-                                                callback=self.get_and_go,
-                                                consumer_tag=queue)  # (<-yes)
+                self.transport.declare_exchange(exchange=props.exchange,
+                                                type=exchange_type,
+                                                durable=True,
+                                                auto_delete=False)
+                self.transport.bind_queue(queue=queue,
+                                          exchange=props.exchange,
+                                          routing_key=props.routing_key)
+                self.transport.consume(queue=queue,
+                                       callback=self.get_and_go,
+                                       no_ack=False,
+                                       consumer_tag=queue)  # (<-yes)
         except Exception:
             raise self.AMQPError(traceback.format_exc())
 
-        self.wrap_the_reader_transport()
-
-    def wrap_the_reader_transport(self):
-        # wrap the transport object used to receive AMQP messages from the broker
-        method_reader = self.amqp_conn.method_reader
-        transport = method_reader.source
-        if isinstance(transport, amqp_transport.SSLTransport):
-            method_reader.source = self.SSLTransportWrapper(self, transport)
-        elif isinstance(transport, amqp_transport.TCPTransport):
-            method_reader.source = self.TCPTransportWrapper(self, transport)
-        else:
-            raise TypeError('Only {0} and {1} transport'
-                            ' classes are supported'
-                            .format(amqp_transport.SSLTransport,
-                                    amqp_transport.TCPTransport))
-        self.log.debug('{0} transport object wrapped with {1}'
-                       .format(transport, method_reader.source))
-
-    def unwrap_the_reader_transport(self):
-        # unwrap the transport object used to receive AMQP messages from the broker
-        method_reader = self.amqp_conn.method_reader
-        method_reader.source = method_reader.source.RTW__get_unwrapped()
-        self.log.debug('{0} transport object unwrapped'.format(method_reader.source))
-
     def main_loop(self):
         """Main activity loop: consume messages, spawn tasks"""
 
-        try:
-            while not (self.stopping or self.responder.stopping):
-                self.wait_for_msg()
-        except self.RespStopping:
-            "TODO: log"
-            '''TODO: check for exception info [e.g. broken responder-stopping pipe?]
-            => if exists, change stopping reason info'''
+        # (when stopping, the responder wakes up the transport -- see:
+        # RPCResponder.final_action())
+        while not (self.stopping or self.responder.stopping):
+            self.wait_for_msg()
 
         if not self.stopping:
             # stopping originally caused by the responder
@@ -701,7 +795,7 @@ class RPCManager(AMQPClientServiceThread):
     @AMQPClientServiceThread.retry
     def wait_for_msg(self):
         """Consume AMQP message when it arrives (calling get_and_go() callback)"""
-        return self.amqp_channel.wait()
+        return self.transport.wait(self.sel_timeout)
 
     def get_and_go(self, msg):
         """AMQP consume callback: prepare a task and start a task thread"""
@@ -709,10 +803,12 @@ class RPCManager(AMQPClientServiceThread):
         queue = msg.delivery_info['consumer_tag']  # (queue == consumer tag)
         #if queue == "_wakeup_queue":  # !TODO! ...
         #if queue == self._wakeup_queue:
-        #    self.amqp_channel.basic_ack(msg.delivery_tag)
+        #    self.transport.ack(msg.delivery_info['delivery_tag'])
         #    return
         binding_props = self._queues2bindings[queue]
-        reply_to = msg.properties['reply_to']
+        if self._capture is not None:
+            self._record(binding_props, msg)
+        reply_to = msg.properties.get('reply_to')  # (None => no responses)
         access_dict = self.create_access_dict(queue,
                                               binding_props,
                                               msg.delivery_info,
@@ -729,22 +825,48 @@ class RPCManager(AMQPClientServiceThread):
                 if self.responder.stopping:
                     return
                 self.task_dict[task_id] = task
-                #self.amqp_channel.basic_ack(msg.delivery_tag)
                 task_recorded = True
                 self.log.debug('Message received, task %s created', task)
                 task_thread = RPCTaskThread(task,
                                             self.rpc_tree,
                                             self.result_fifo,
-                                            self.log)
+                                            self.log,
+                                            self.batch_parallelism,
+                                            self.stream_chunk_size,
+                                            self.spill_threshold)
                 task_thread.start()
                 self.log.debug('%s created and started', task_thread)
         finally:
             if task_recorded:
-                self.amqp_channel.basic_ack(msg.delivery_tag)
+                self.transport.ack(msg.delivery_info['delivery_tag'])
 
         return task
 
 
+    def _record(self, binding_props, msg):
+        """Append the request message to the capture file"""
+        try:
+            if (not self._capture.record(time.time(), binding_props.exchange,
+                                         binding_props.routing_key,
+                                         msg.delivery_info['routing_key'], msg.body)
+                  and self._capture.full):
+                self.log.warning('Capture file %s is full (%s bytes), '
+                                 'recording stopped', self.capture_path,
+                                 self.capture_max_bytes)
+                self._close_capture()
+        except Exception:
+            self.log.error('Cannot record the request, recording stopped:',
+                           exc_info=True)
+            self._close_capture()
+
+    def _close_capture(self):
+        if self._capture is not None:
+            capture_writer, self._capture = self._capture, None
+            capture_writer.close()
+            self.log.info('Capture file %s closed (requests recorded: %s, '
+                          'skipped: %s)', self.capture_path,
+                          capture_writer.recorded, capture_writer.skipped)
+
     @staticmethod
     def create_access_dict(queue, binding_props, delivery_info, reply_to):
         """Prepare the dict to be used to format actual key and keyhole strings"""
@@ -771,20 +893,17 @@ class RPCManager(AMQPClientServiceThread):
         """Close AMQP conn, request the responder to stop, run final callback"""
 
         try:
-            try:
-                self.amqp_close()
-
-                # (we don't need to use mutex, because possible
-                # redundant stop request is harmless)
-                if not self.responder.stopping:
-                    # request the responder to stop
-                    self._stop_the_responder(self.stopping)
+            self.amqp_close()
+            self._close_capture()
 
-                # wait until the responder terminates
-                self.responder.join_stopping(None)
+            # (we don't need to use mutex, because possible
+            # redundant stop request is harmless)
+            if not self.responder.stopping:
+                # request the responder to stop
+                self._stop_the_responder(self.stopping)
 
-            finally:
-                os.close(self.resp_stopping_fd_r)
+            # wait until the responder terminates
+            self.responder.join_stopping(None)
 
         finally:
             if self.final_callback is not None:
@@ -844,8 +963,8 @@ class RPCResponder(AMQPClientServiceThread):
         Arguments (to be used for instance creation together with
         ServiceThread-specific arguments, see: ServiceThread.__init__()):
 
-        * amqp_params -- dict of keyword arguments for amqp.Connection(),
-          see docs of amqplib.client_0_8.Connection.__init__() for details;
+        * amqp_params -- dict of keyword arguments for the transport
+          (see: AMQPClientServiceThread.init());
 
         * task_dict -- empty dict, must be the same that the manager will be
           created with -- see: RPCManager.init();
@@ -872,10 +991,10 @@ class RPCResponder(AMQPClientServiceThread):
         AMQPClientServiceThread.amqp_init(self)
         self.log.info('Declaring responder exchange...')
         try:
-            self.amqp_channel.exchange_declare(exchange=self.exchange,
-                                               type='direct',
-                                               durable=True,
-                                               auto_delete=False)
+            self.transport.declare_exchange(exchange=self.exchange,
+                                            type='direct',
+                                            durable=True,
+                                            auto_delete=False)
         except Exception:
             raise self.AMQPError(traceback.format_exc())
 
@@ -888,20 +1007,40 @@ class RPCResponder(AMQPClientServiceThread):
                 with self.mutex:
                     self.stopping = result
                 continue
-            msg = amqp.Message(result.response_message, delivery_mode=2)
-            self.reply(result.reply_to, msg)
-            del self.task_dict[result.task_id]
+            if isinstance(result, NoResult):
+                pass
+            elif result.reply_to is None:
+                self.log.error('Response %r dropped: no reply-to queue',
+                               result.response_message)
+            else:
+                msg = transport.Message(result.response_message, delivery_mode=2)
+                self.reply(result.reply_to, msg)
+            if isinstance(result, PartialResult):
+                # (more chunks of the result will come)
+                result.sent.set()
+            else:
+                del self.task_dict[result.task_id]
 
-    @AMQPClientServiceThread.retry
     def reply(self, reply_to, msg):
         """Send a response to RPC client (via AMQP broker)"""
-        self.amqp_channel.basic_publish(msg, exchange=self.exchange, routing_key=reply_to)
+        # (checked here -- retrying would not help)
+        if reply_to is None:
+            raise ValueError('Cannot send a response with no reply-to queue')
+        self._publish_reply(reply_to, msg)
+
+    @AMQPClientServiceThread.retry
+    def _publish_reply(self, reply_to, msg):
+        if reply_to.startswith(DIRECT_REPLY_TO_QUEUE):
+            exchange = ''
+        else:
+            exchange = self.exchange
+        self.transport.publish(msg, exchange=exchange, routing_key=reply_to)
 
     def final_action(self):
         """Wake up the manager, close the connection, check state of tasks"""
 
         try:
-            os.close(self.stopping_fd_w)
+            self.manager.transport.wakeup()
             #if (self._is_connected
             #      and not self.stopping.reason.startswith(MGR_REASON_PREFIX)):
             #    self.manager_wakeup()
@@ -954,7 +1093,12 @@ class RPCTaskThread(threading.Thread):
 
     instance_counter = itertools.count(1)
 
-    def __init__(self, task, rpc_tree, result_fifo, log):
+    # how long (in seconds) to wait until the previous chunk of a streamed
+    # result is published (before the next one is put into the result fifo)
+    chunk_sent_timeout = 60
+
+    def __init__(self, task, rpc_tree, result_fifo, log, batch_parallelism=1,
+                 stream_chunk_size=100, spill_threshold=None):
         task_thread_id = next(self.instance_counter)
         threading.Thread.__init__(self, name='TaskThread-{0}/task-{1}'
                                   .format(task_thread_id, task.id))
@@ -962,6 +1106,9 @@ class RPCTaskThread(threading.Thread):
         self.rpc_tree = rpc_tree
         self.result_fifo = result_fifo
         self.log = log
+        self.batch_parallelism = batch_parallelism
+        self.stream_chunk_size = stream_chunk_size
+        self.spill_threshold = spill_threshold
 
     def __str__(self):
         return '<{0}>'.format(self.name)
@@ -969,15 +1116,30 @@ class RPCTaskThread(threading.Thread):
     def parse_request(self, task):
         self.log.debug('Deserializing request message: %r...',
                        task.request_message)
-        request = self._deserialize_request(task.request_message)
-        rpc_method = self.rpc_tree.try_to_obtain(request.method,
-                                        task.access_dict,
-                                        required_type=methodtree.RPCMethod)
-        return request, rpc_method
+        return self._deserialize_request(task.request_message)
+
+    def obtain_rpc_method(self, request, task):
+        return self.rpc_tree.try_to_obtain(request.method,
+                                           task.access_dict,
+                                           required_type=methodtree.RPCMethod)
 
     def call_rpc_method(self, request, rpc_method, task):
-        self.log.info('Calling %s%s', request.method,
-                      rpc_method.format_args(request.params, request.kwparams))
+        if request.id is None:
+            # (notifications cannot be cancelled)
+            token = CancellationToken()
+        else:
+            token = cancellations.register(task.reply_to, request.id)
+        if token.is_cancelled():
+            cancellations.unregister(task.reply_to, request.id)
+            self.log.info('Request %r (%s) cancelled -- dropped',
+                          request.id, request.method)
+            raise RPCRequestCancelledError('Request cancelled by the client '
+                                           'before execution')
+        if self.log.isEnabledFor(logging.INFO):
+            self.log.info('Calling %s%s', request.method,
+                          rpc_method.format_args(request.params, request.kwparams))
+        call_context.access_dict = task.access_dict
+        call_context.cancel_token = token
         try:
             rpc_method.authorize(**task.access_dict)
             result = rpc_method(*request.params, **request.kwparams)
@@ -1005,42 +1167,192 @@ class RPCTaskThread(threading.Thread):
                            request.method, exc_info=True)
             raise
 
-        self.log.info('%s call completed: %s', request.method, utils.log_repr(result))
+        finally:
+            call_context.access_dict = None
+            call_context.cancel_token = None
+            if request.id is not None:
+                cancellations.unregister(task.reply_to, request.id)
+
+        if self.log.isEnabledFor(logging.INFO):
+            self.log.info('%s call completed: %s', request.method, utils.log_repr(result))
         return result
 
     def format_exception(self):
+        return format_exception(self.log)
+
+    def send_response(self, result, error, request_id, spill=True):
+        if (error is None and spill and self.spill_threshold is not None
+              and self.task.reply_to is not None):
+            # (no spilling if the response will not be sent anyway)
+            self.send_large_response(result, request_id)
+            return
+        response_dict = {
+            'result': result,
+            'error': error,
+            'id': request_id,
+        }
+        self._put_result(self._serialize_response(response_dict))
+
+    def send_exception(self, request_id):
+        self.send_response(None, self.format_exception(), request_id)
 
-        exc_type, exc = sys.exc_info()[:2]
+    def send_large_response(self, result, request_id):
 
-        try:
-            exc_dict = exc.__getstate__()
-        except AttributeError:
-            exc_dict = exc.__dict__
+        """Send the result -- spilling it if it is large, see: the spill module.
+
+        If the serialized result is larger than `spill_threshold', the
+        response contains -- instead of the result -- a "spilled" item:
+        the info needed to fetch it with system.spill_read.
+
+        """
 
         try:
-            encoding.dumps(exc_dict)
+            result_json, spilled = spill.spill_store.dump(result, self.spill_threshold)
         except TypeError:
-            self.log.warning('Unserializable exception __dict__ ({0}): {1!r}'.format(
-                exc_type.__name__, exc_dict))
-            exc_dict = None
+            # (the error response to be prepared by _serialize_response())
+            self._put_result(self._serialize_response(dict(result=result,
+                                                           error=None,
+                                                           id=request_id)))
+        except Exception:
+            self.log.error('Error when spilling the result:', exc_info=True)
+            self.send_exception(request_id)
+        else:
+            if spilled is None:
+                self._put_result('{{"result": {0}, "error": null, "id": {1}}}'
+                                 .format(result_json, encoding.dumps(request_id)))
+            else:
+                self.log.info('Result (%d bytes) spilled as %s',
+                              spilled['size'], spilled['handle'])
+                self._put_result(self._serialize_response(dict(result=None,
+                                                               error=None,
+                                                               id=request_id,
+                                                               spilled=spilled)))
 
-        return dict(name=exc_type.__name__, message=str(exc), data=exc_dict)
+    def send_stream(self, iterator, request_id):
 
-    def send_response(self, result, error, request_id):
-        response_dict = {
-            'result': result,
-            'error': error,
-            'id': request_id,
-        }
-        response_message = self._serialize_response(response_dict)
+        """Send items of an iterator result in chunks (many response messages).
+
+        Each message is a response dict with additional "chunk" (sequence
+        number, starting with 0) and "more" (false in the last message)
+        items; its "result" is a list of up to `stream_chunk_size' items.
+        An error (raised by the iterator or cancellation) is sent in the
+        last message. A chunk is put into the result fifo only when the
+        previous one has been published (so memory use is bounded).
+
+        If the request has no reply-to queue the iterator is consumed
+        anyway, but nothing is sent.
+
+        """
 
         task = self.task
-        result = Result(task.id, task.reply_to, response_message)
-        self.result_fifo.put(result)
-        self.log.debug('Result %r put into result fifo', result)
+        token = cancellations.register(task.reply_to, request_id)
+        call_context.access_dict = task.access_dict
+        call_context.cancel_token = token
+        chunk = 0
+        sent = None
+        items = []
+        error = None
+        try:
+            for item in iterator:
+                items.append(item)
+                if len(items) >= self.stream_chunk_size:
+                    if task.reply_to is not None:
+                        sent = self._put_chunk(items, request_id, chunk, sent)
+                    chunk += 1
+                    items = []
+                    check_cancelled()
+        except Exception:
+            self.log.error('Error in RPC call (streamed result):', exc_info=True)
+            error = self.format_exception()
+            items = []
+        finally:
+            call_context.access_dict = None
+            call_context.cancel_token = None
+            cancellations.unregister(task.reply_to, request_id)
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+        if task.reply_to is None:
+            self.log.warning('Streamed result (%d chunk(s)) not sent: the request '
+                             'message has no reply-to queue', chunk + 1)
+            self._put_no_result()
+            return
+        self.log.info('Streamed result sent in %d chunk(s)', chunk + 1)
+        self._put_result(self._serialize_response(dict(result=items,
+                                                       error=error,
+                                                       id=request_id,
+                                                       chunk=chunk,
+                                                       more=False)))
+
+    def _put_chunk(self, items, request_id, chunk, prev_sent):
+        try:
+            response_message = encoding.dumps(dict(result=items, error=None,
+                                                   id=request_id, chunk=chunk,
+                                                   more=True))
+        except TypeError:
+            raise RPCServerSerializationError('Result not serializable')
+        if prev_sent is not None and not prev_sent.wait(self.chunk_sent_timeout):
+            raise RPCInternalServerError('Previous chunk of the result not sent '
+                                         'within {0}s'.format(self.chunk_sent_timeout))
+        sent = threading.Event()
+        self.result_fifo.put(PartialResult(self.task.id, self.task.reply_to,
+                                           response_message, sent))
+        return sent
+
+    def send_batch_response(self, response_dicts):
+        response_message = '[{0}]'.format(', '.join(
+                self._serialize_response(response_dict)
+                for response_dict in response_dicts))
+        self._put_result(response_message)
+
+    def execute_notification(self, request):
+        """Execute a notification (null-id request) -- no response for it"""
+        try:
+            rpc_method = self.obtain_rpc_method(request, self.task)
+            utils.materialize(self.call_rpc_method(request, rpc_method, self.task))
+        except Exception:
+            self.log.error('Error in RPC notification (no response '
+                           'will be sent):', exc_info=True)
+            notification_stats.record(request.method, self.format_exception())
+        else:
+            notification_stats.record(request.method)
 
-    def send_exception(self, request_id):
-        self.send_response(None, self.format_exception(), request_id)
+    def execute_batch_item(self, item):
+        """Execute a request being a batch item; return the response dict
+
+        (or None if the item is a notification).
+
+        """
+
+        request_id = item.get('id') if type(item) is dict else None
+        try:
+            request = self._make_request(item)
+            if request.id is None:
+                self.execute_notification(request)
+                return None
+            request_id = request.id
+            rpc_method = self.obtain_rpc_method(request, self.task)
+            # (no streaming within batches)
+            result = utils.materialize(self.call_rpc_method(request, rpc_method, self.task))
+        except Exception:
+            self.log.error('Error in RPC call (batch item):', exc_info=True)
+            return dict(result=None, error=self.format_exception(), id=request_id)
+        return dict(result=result, error=None, id=request_id)
+
+    def run_batch(self, batch):
+        """Execute requests of the batch, send the array of responses"""
+        self.log.debug('Executing batch of %d requests (parallelism: %d)',
+                       len(batch.items), self.batch_parallelism)
+        response_dicts = [response_dict for response_dict
+                          in utils.parallel_map(self.execute_batch_item,
+                                                batch.items,
+                                                self.batch_parallelism)
+                          if response_dict is not None]
+        if response_dicts:
+            self.send_batch_response(response_dicts)
+        else:
+            # (the batch consisted of notifications only)
+            self._put_no_result()
 
     def run(self):
         """Thread activity"""
@@ -1049,21 +1361,65 @@ class RPCTaskThread(threading.Thread):
         task = self.task
         request_id = task.reply_to
         try:
-            request, rpc_method = self.parse_request(task)
+            request = self.parse_request(task)
+            if isinstance(request, RPCBatch):
+                self.run_batch(request)
+                return
+            if request.id is None:
+                self.execute_notification(request)
+                self._put_no_result()
+                return
+            # (from now on error responses can refer to the request id)
             request_id = request.id
+            rpc_method = self.obtain_rpc_method(request, task)
             result = self.call_rpc_method(request, rpc_method, task)
         except Exception:
             self.log.error('Error in RPC call:', exc_info=True)
             self.send_exception(request_id)
         else:
-            self.send_response(result, None, request.id)
+            if isinstance(result, collections.Iterator):
+                self.send_stream(result, request.id)
+            else:
+                self.send_response(result, None, request.id, rpc_method.spill)
+
+    def _put_result(self, response_message):
+        task = self.task
+        if task.reply_to is None:
+            self.log.warning('Response %r not sent: the request message '
+                             'has no reply-to queue', response_message)
+            self._put_no_result()
+            return
+        result = Result(task.id, task.reply_to, response_message)
+        self.result_fifo.put(result)
+        self.log.debug('Result %r put into result fifo', result)
+
+    def _put_no_result(self):
+        # (the responder must forget the task anyway)
+        self.result_fifo.put(NoResult(self.task.id))
 
     def _deserialize_request(self, request_message):
+
+        """Deserialize the request message
+
+        Return an RPCRequest instance (its id is None if it is
+        a notification) or -- if the message is a JSON array (batch)
+        -- an RPCBatch instance (its items are to be checked with
+        _make_request()).
+
+        """
+
         try:
             message_data = encoding.loads(request_message)
         except ValueError:
             raise RPCServerDeserializationError(request_message)
 
+        if type(message_data) is list:
+            if not message_data:
+                raise RPCInvalidRequestError(message_data)
+            return RPCBatch(message_data)
+        return self._make_request(message_data)
+
+    def _make_request(self, message_data):
         try:
             message_data.setdefault('kwparams', {})
             request = RPCRequest(**message_data)
@@ -1079,10 +1435,6 @@ class RPCTaskThread(threading.Thread):
             request = request._replace(method=str(request.method))
         except (TypeError, AttributeError, UnicodeError):
             raise RPCInvalidRequestError(message_data)
-
-        if request.id is None:
-            raise RPCNotificationsNotImplementedError(message_data)
-
         return request
 
     def _serialize_response(self, response_dict):
@@ -1093,4 +1445,7 @@ class RPCTaskThread(threading.Thread):
                          message='Result not serializable')
             err_response_dict = dict(result=None, error=error,
                                      id=response_dict['id'])
+            if 'chunk' in response_dict:
+                # (the last chunk of a streamed result)
+                err_response_dict.update(chunk=response_dict['chunk'], more=False)
             return encoding.dumps(err_response_dict)
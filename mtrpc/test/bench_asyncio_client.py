@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Benchmark: asyncio RPC-proxy vs. threaded (blocking) RPC-proxies.
+
+The same number of calls is made with the same concurrency:
+
+* threaded -- by N threads, each using its own MTRPCProxy,
+* asyncio -- by N coroutines, sharing one AsyncMTRPCProxy.
+
+It needs a running AMQP broker and MTRPC server, e.g.:
+
+    python -m mtrpc.test.bench_asyncio_client -n 5000 -c 50 system.list '""'
+
+"""
+
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+import trollius as asyncio
+from trollius import From, Return
+
+from mtrpc.asyncio_client import AsyncMTRPCProxy
+from mtrpc.client import MTRPCProxy
+from mtrpc.mtrpc_request import decode_arg
+
+
+def bench_threaded(proxy_kwargs, method, args, calls, concurrency):
+    proxies = [MTRPCProxy(**proxy_kwargs) for _ in xrange(concurrency)]
+
+    def worker(rpc, count):
+        call = getattr(rpc, method)
+        for _ in xrange(count):
+            call(*args)
+
+    threads = [threading.Thread(target=worker, args=(rpc, calls // concurrency))
+               for rpc in proxies]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    for rpc in proxies:
+        rpc._close()
+    return elapsed
+
+
+def bench_asyncio(proxy_kwargs, method, args, calls, concurrency):
+    loop = asyncio.get_event_loop()
+
+    @asyncio.coroutine
+    def worker(rpc, count):
+        call = getattr(rpc, method)
+        for _ in xrange(count):
+            yield From(call(*args))
+
+    @asyncio.coroutine
+    def run():
+        rpc = yield From(AsyncMTRPCProxy.connect(loop=loop, **proxy_kwargs))
+        with rpc:
+            start = time.time()
+            yield From(asyncio.gather(*[worker(rpc, calls // concurrency)
+                                        for _ in xrange(concurrency)],
+                                      loop=loop))
+            elapsed = time.time() - start
+        raise Return(elapsed)
+
+    return loop.run_until_complete(run())
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] method args...")
+    parser.add_option('-x', '--exchange', dest='req_exchange', default='rpc.friendly.exchange', help='AMQP exchange name', metavar='EXCHANGE')
+    parser.add_option('-r', '--routing-key', dest='req_rk_pattern', default='rk.usr.{full_name}', help='AMQP routing key pattern', metavar='RK')
+    parser.add_option('-H', '--host', dest='host', default='localhost:5672', help='AMQP broker')
+    parser.add_option('-u', '--user', dest='userid', default='guest', help='AMQP user login')
+    parser.add_option('-p', '--password', dest='password', default='guest', help='AMQP user password')
+    parser.add_option('-n', '--calls', dest='calls', type='int', default=2000, help='Number of calls')
+    parser.add_option('-c', '--concurrency', dest='concurrency', type='int', default=20, help='Number of concurrent callers')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    if len(a) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    method = a[0]
+    args = [decode_arg(arg) for arg in a[1:]]
+    proxy_kwargs = dict(req_exchange=o.req_exchange,
+                        req_rk_pattern=o.req_rk_pattern,
+                        host=o.host,
+                        userid=o.userid,
+                        password=o.password,
+                        loglevel='warning')
+    calls = o.calls - o.calls % o.concurrency
+
+    print '{0} calls of {1}, concurrency {2}'.format(calls, method, o.concurrency)
+    for name, bench in [('threaded', bench_threaded), ('asyncio', bench_asyncio)]:
+        elapsed = bench(proxy_kwargs, method, args, calls, o.concurrency)
+        print '{0:>10}: {1:8.3f}s {2:10.1f} calls/s'.format(name, elapsed, calls / elapsed)
+
+
+if __name__ == '__main__':
+    main()
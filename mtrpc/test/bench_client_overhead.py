@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Microbenchmark: per-call Python overhead of MTRPCProxy.
+
+Client-side steps of an RPC-method call are timed separately (in
+microseconds per call): getting the method co-proxy (attribute chain),
+preparing the routing key and the request message -- each both in the
+cached (as used by calls) and uncached variant -- and, if -n is given,
+the whole call (round trip included).
+
+It needs a running AMQP broker (and, for whole calls, an MTRPC server),
+e.g.:
+
+    python -m mtrpc.test.bench_client_overhead -n 2000 system.list '""'
+
+"""
+
+import sys
+import timeit
+from optparse import OptionParser
+
+from mtrpc.client import MTRPCProxy
+from mtrpc.mtrpc_request import decode_arg
+
+
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def bench_steps(rpc, method, args, number):
+    exchange = rpc._req_exchange
+    first, _, rest = method.partition('.')
+
+    def chain_cached():
+        co_proxy = getattr(rpc, first)
+        for name in rest.split('.') if rest else ():
+            co_proxy = getattr(co_proxy, name)
+
+    def chain_uncached():
+        co_proxy = rpc._method_proxy_class(rpc, first)
+        for name in rest.split('.') if rest else ():
+            co_proxy = co_proxy.__class__(rpc, '{0}.{1}'.format(co_proxy._full_name, name))
+
+    return [
+        ('attribute chain (cached)', per_call_us(chain_cached, number)),
+        ('attribute chain (uncached)', per_call_us(chain_uncached, number)),
+        ('routing key (cached)', per_call_us(
+            lambda: rpc._prepare_routing_key(method, exchange), number)),
+        ('routing key (uncached)', per_call_us(
+            lambda: rpc._format_routing_key(method, exchange), number)),
+        ('request message', per_call_us(
+            lambda: rpc._prepare_msg(method, args, {}, rpc._resp_queue, 'id'), number)),
+    ]
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] method args...")
+    parser.add_option('-x', '--exchange', dest='req_exchange', default='rpc.friendly.exchange', help='AMQP exchange name', metavar='EXCHANGE')
+    parser.add_option('-r', '--routing-key', dest='req_rk_pattern', default='rk.usr.{full_name}', help='AMQP routing key pattern', metavar='RK')
+    parser.add_option('-H', '--host', dest='host', default='localhost:5672', help='AMQP broker')
+    parser.add_option('-u', '--user', dest='userid', default='guest', help='AMQP user login')
+    parser.add_option('-p', '--password', dest='password', default='guest', help='AMQP user password')
+    parser.add_option('-s', '--steps', dest='steps', type='int', default=100000, help='Number of repetitions of each client-side step')
+    parser.add_option('-n', '--calls', dest='calls', type='int', default=0, help='Number of whole calls (default: 0 => none)')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    if len(a) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    method = a[0]
+    args = [decode_arg(arg) for arg in a[1:]]
+
+    with MTRPCProxy(req_exchange=o.req_exchange,
+                    req_rk_pattern=o.req_rk_pattern,
+                    host=o.host,
+                    userid=o.userid,
+                    password=o.password,
+                    loglevel='warning') as rpc:
+        results = bench_steps(rpc, method, args, o.steps)
+        if o.calls:
+            call = lambda: getattr(rpc, method)(*args)
+            results.append(('whole call', per_call_us(call, o.calls)))
+
+    for name, us in results:
+        print '{0:>28}: {1:10.2f} us/call'.format(name, us)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Benchmark: a new RPC-proxy per call vs. proxies from MTRPCProxyPool.
+
+The same number of calls is made by N threads:
+
+* per-call -- each call is made with a newly created MTRPCProxy,
+* pooled -- each call is made with a proxy checked out from the pool,
+
+and the connection setup cost amortized per call (the difference of
+the mean call times) is reported.
+
+It needs a running AMQP broker and MTRPC server, e.g.:
+
+    python -m mtrpc.test.bench_client_pool -n 500 -c 10 system.list '""'
+
+"""
+
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+from mtrpc.client import MTRPCProxy, MTRPCProxyPool
+from mtrpc.mtrpc_request import decode_arg
+
+
+def run_threads(worker, calls, concurrency):
+    threads = [threading.Thread(target=worker, args=(calls // concurrency,))
+               for _ in xrange(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start
+
+
+def bench_per_call(proxy_kwargs, method, args, calls, concurrency):
+
+    def worker(count):
+        for _ in xrange(count):
+            with MTRPCProxy(**proxy_kwargs) as rpc:
+                getattr(rpc, method)(*args)
+
+    return run_threads(worker, calls, concurrency)
+
+
+def bench_pooled(proxy_kwargs, method, args, calls, concurrency):
+    pool = MTRPCProxyPool(min_size=concurrency, max_size=concurrency,
+                          **proxy_kwargs)
+
+    def worker(count):
+        for _ in xrange(count):
+            with pool.proxy() as rpc:
+                getattr(rpc, method)(*args)
+
+    try:
+        return run_threads(worker, calls, concurrency)
+    finally:
+        pool.close()
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] method args...")
+    parser.add_option('-x', '--exchange', dest='req_exchange', default='rpc.friendly.exchange', help='AMQP exchange name', metavar='EXCHANGE')
+    parser.add_option('-r', '--routing-key', dest='req_rk_pattern', default='rk.usr.{full_name}', help='AMQP routing key pattern', metavar='RK')
+    parser.add_option('-H', '--host', dest='host', default='localhost:5672', help='AMQP broker')
+    parser.add_option('-u', '--user', dest='userid', default='guest', help='AMQP user login')
+    parser.add_option('-p', '--password', dest='password', default='guest', help='AMQP user password')
+    parser.add_option('-n', '--calls', dest='calls', type='int', default=500, help='Number of calls')
+    parser.add_option('-c', '--concurrency', dest='concurrency', type='int', default=10, help='Number of calling threads')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    if len(a) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    method = a[0]
+    args = [decode_arg(arg) for arg in a[1:]]
+    proxy_kwargs = dict(req_exchange=o.req_exchange,
+                        req_rk_pattern=o.req_rk_pattern,
+                        host=o.host,
+                        userid=o.userid,
+                        password=o.password,
+                        loglevel='warning')
+    calls = o.calls - o.calls % o.concurrency
+
+    print '{0} calls of {1}, concurrency {2}'.format(calls, method, o.concurrency)
+    per_call_time = {}
+    for name, bench in [('per-call', bench_per_call), ('pooled', bench_pooled)]:
+        elapsed = bench(proxy_kwargs, method, args, calls, o.concurrency)
+        per_call_time[name] = elapsed / calls
+        print '{0:>10}: {1:8.3f}s {2:10.1f} calls/s'.format(name, elapsed, calls / elapsed)
+    print 'setup cost amortized per call: {0:.3f}ms'.format(
+            (per_call_time['per-call'] - per_call_time['pooled']) * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Benchmark: end-to-end RPC-method calls (client -> manager -> task thread
+-> responder -> client) at various concurrencies.
+
+An MTRPC server (RPCManager + RPCResponder, serving the `system' and
+`bench' RPC-modules -- see: mtrpc.test.bench_methods) is started in the
+benchmark process; by default also the in-memory AMQP broker stand-in
+(see: mtrpc.test.broker) is, so that neither a running broker nor
+a network is needed and results are repeatable. For each concurrency
+level, the calls are made by so many threads (each using its own
+MTRPCProxy); requests/sec and p50/p99 call latencies are reported, e.g.:
+
+    python -m mtrpc.test.bench_end_to_end -n 2000 -c 1,4,16,64
+    python -m mtrpc.test.bench_end_to_end -n 500 bench.payload 100000
+    python -m mtrpc.test.bench_end_to_end -H localhost:5672   # (RabbitMQ)
+
+"""
+
+import logging
+import Queue
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+from mtrpc.client import MTRPCProxy
+from mtrpc.common import errors
+from mtrpc.common import transport
+from mtrpc.mtrpc_request import decode_arg
+from mtrpc.server import threads
+from mtrpc.server.methodtree import RPCTree
+from mtrpc.test.broker import Broker
+
+
+EXCHANGE = 'mtrpc.bench'
+RK_PATTERN = 'bench.{full_name}'
+
+RPC_TREE_CONFIG = {
+    'rpc_tree_init': {
+        'paths': [],
+        'imports': ['mtrpc.server.sysmethods as system',
+                    'mtrpc.test.bench_methods as bench'],
+        'postinit_kwargs': {
+            'logging_settings': {
+                'mod_logger_pattern': 'mtrpc.test.bench.{full_name}',
+                'level': 'warning',
+                'handlers': [],
+                'propagate': False,
+                'custom_mod_loggers': {},
+            },
+            'mod_globals': {},
+        },
+    },
+}
+
+
+def start_server(amqp_params, manager_attributes=None, log=None):
+    """Start the manager and responder threads; return the manager"""
+    if log is None:
+        log = logging.getLogger('mtrpc.test.bench')
+    rpc_tree = RPCTree.load(RPC_TREE_CONFIG, 'server')
+    task_dict = {}
+    result_fifo = Queue.Queue()
+    mutex = threading.Lock()
+    responder = threads.RPCResponder(dict(amqp_params), task_dict, result_fifo,
+                                     mutex, log=log)
+    manager = threads.RPCManager(dict(amqp_params),
+                                 [threads.BindingProps(EXCHANGE, 'bench.#')],
+                                 {EXCHANGE: 'topic'},
+                                 'mtrpc.bench',
+                                 rpc_tree,
+                                 responder,
+                                 task_dict,
+                                 result_fifo,
+                                 mutex,
+                                 log=log,
+                                 attributes=manager_attributes or {})
+    manager.start()
+    return manager
+
+
+def wait_until_served(proxy_kwargs, timeout=10):
+    """Call bench.echo until it succeeds (the server may be still starting)"""
+    deadline = time.time() + timeout
+    transport_errors = transport.get_transport_class(proxy_kwargs.get('transport')).errors
+    with MTRPCProxy(timeout=1, **proxy_kwargs) as rpc:
+        while True:
+            try:
+                return rpc.bench.echo(None)
+            except (errors.RPCError,) + transport_errors:
+                if time.time() >= deadline:
+                    raise
+                time.sleep(0.1)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[int(round((len(sorted_values) - 1) * fraction))]
+
+
+def bench_level(proxy_kwargs, method, args, calls, concurrency, warmup):
+
+    """Make `calls' calls by `concurrency' threads
+
+    Return (<elapsed time>, <sorted list of call latencies>).
+
+    """
+
+    proxies = [MTRPCProxy(**proxy_kwargs) for _ in xrange(concurrency)]
+    latencies = []
+    start_event = threading.Event()
+
+    def worker(rpc, count):
+        call = getattr(rpc, method)
+        for _ in xrange(warmup):
+            call(*args)
+        thread_latencies = []
+        start_event.wait()
+        for _ in xrange(count):
+            call_start = time.time()
+            call(*args)
+            thread_latencies.append(time.time() - call_start)
+        latencies.extend(thread_latencies)
+
+    workers = [threading.Thread(target=worker, args=(rpc, calls // concurrency))
+               for rpc in proxies]
+    try:
+        for thread in workers:
+            thread.start()
+        start = time.time()
+        start_event.set()
+        for thread in workers:
+            thread.join()
+        elapsed = time.time() - start
+    finally:
+        for rpc in proxies:
+            rpc._close()
+    return elapsed, sorted(latencies)
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] [method args...]")
+    parser.add_option('-H', '--host', dest='host', default=None, help='AMQP broker (default: start the in-memory broker stand-in)')
+    parser.add_option('-u', '--user', dest='userid', default='guest', help='AMQP user login')
+    parser.add_option('-p', '--password', dest='password', default='guest', help='AMQP user password')
+    parser.add_option('-n', '--calls', dest='calls', type='int', default=2000, help='Number of calls (for each concurrency level)')
+    parser.add_option('-c', '--concurrency', dest='concurrency', default='1,4,16,64', help='Comma-separated concurrency levels (numbers of calling threads)')
+    parser.add_option('-w', '--warmup', dest='warmup', type='int', default=10, help='Number of not measured calls made by each thread first')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true', default=False, help='Show the server log (warnings and errors)')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    if a:
+        method = a[0]
+        args = [decode_arg(arg) for arg in a[1:]]
+    else:
+        method = 'bench.echo'
+        args = ['x']
+    levels = [int(level) for level in o.concurrency.split(',')]
+
+    logging.basicConfig(level=logging.WARNING if o.verbose else logging.CRITICAL)
+
+    broker = None
+    if o.host is None:
+        broker = Broker().start()
+        host = broker.host
+    else:
+        host = o.host
+    amqp_params = dict(host=host, userid=o.userid, password=o.password)
+    proxy_kwargs = dict(req_exchange=EXCHANGE,
+                        req_rk_pattern=RK_PATTERN,
+                        loglevel='critical',
+                        **amqp_params)
+
+    manager = start_server(amqp_params)
+    try:
+        wait_until_served(proxy_kwargs)
+        print '{0}{1} -- broker: {2}'.format(method, tuple(args),
+                                             'stand-in' if broker else host)
+        print '{0:>11} {1:>7} {2:>10} {3:>9} {4:>9} {5:>9}'.format(
+                'concurrency', 'calls', 'calls/s', 'p50 ms', 'p99 ms', 'max ms')
+        for concurrency in levels:
+            calls = max(o.calls - o.calls % concurrency, concurrency)
+            elapsed, latencies = bench_level(proxy_kwargs, method, args, calls,
+                                             concurrency, o.warmup)
+            print '{0:>11} {1:>7} {2:>10.1f} {3:>9.2f} {4:>9.2f} {5:>9.2f}'.format(
+                    concurrency, calls, calls / elapsed,
+                    percentile(latencies, 0.5) * 1000,
+                    percentile(latencies, 0.99) * 1000,
+                    latencies[-1] * 1000)
+    finally:
+        manager.stop(timeout=10)
+        if broker is not None:
+            broker.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+# mtrpc/test/bench_methods.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""RPC-module with trivial RPC-methods -- to be served in benchmarks"""
+
+import time
+
+
+__rpc_doc__ = u'Trivial methods for benchmarks'
+__rpc_methods__ = ('echo', 'sleep', 'payload')
+
+
+def echo(value):
+    u"""Return the argument"""
+    return value
+
+
+def sleep(seconds):
+    u"""Sleep for the given number of seconds"""
+    time.sleep(seconds)
+
+
+def payload(size):
+    u"""Return a string of the given length"""
+    return u'x' * size
@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Microbenchmark suite: dispatch, RPC-tree and codec hot paths.
+
+No broker is needed -- each benchmark times (in microseconds per
+operation, the best of several runs) one server-side hot path:
+
+* codec.dumps.* / codec.loads.* -- mtrpc.common.encoding on
+  representative payloads (a request, rows with timestamps, a large
+  list, a long non-ASCII text);
+* tree.build -- RPCTree construction from generated py-modules
+  (a large tree, see: -m), tree.all_items -- all_items(deep=True)
+  of that tree;
+* method.call.* -- RPCMethod.__call__ (argument checking included),
+  method.format_args -- RPCMethod.format_args();
+* manager.create_access_dict -- RPCManager.create_access_dict();
+* task.* -- RPCTaskThread executing a request message end-to-end
+  (deserialization, obtaining the RPC-method, the call, the response
+  message) without a broker, as the loopback client does it.
+
+Results can be written as JSON (-j) -- e.g. to be stored as a baseline
+-- and compared against a stored baseline (-b); with -b the exit status
+is 1 if any benchmark is slower than its baseline by more than the
+tolerance (-T), e.g.:
+
+    python -m mtrpc.test.bench_micro -j baseline.json
+    python -m mtrpc.test.bench_micro -b baseline.json -T 0.2
+    python -m mtrpc.test.bench_micro -k codec -k tree -m 10000
+
+"""
+
+import datetime
+import fnmatch
+import json
+import logging
+import platform
+import sys
+import time
+import types
+from optparse import OptionParser
+
+from mtrpc.common import encoding
+from mtrpc.server import threads
+from mtrpc.server.methodtree import RPCMethod, RPCMethodArgError, RPCTree
+from mtrpc.test.bench_end_to_end import RPC_TREE_CONFIG
+
+
+FORMAT_VERSION = 1
+
+FUNCS_PER_MODULE = 50
+MODULES_PER_PACKAGE = 10
+
+# (sources of generated RPC-methods -- various argument specifications)
+FUNC_TEMPLATES = [
+    ('def {name}(a, b):\n'
+     '    "Add two numbers"\n'
+     '    return a + b\n'),
+    ('def {name}(user_id, fields=None, limit=100):\n'
+     '    """Get a user record\n'
+     '\n'
+     '    Only the given `fields\' are returned.\n'
+     '    """\n'
+     '    return user_id\n'),
+    ('def {name}(login, password, *args, **options):\n'
+     '    "Log in"\n'
+     '    return login\n'),
+    ('def {name}():\n'
+     '    return None\n'),
+]
+
+
+#
+# Timing
+
+def time_op(func, min_time, repeat):
+    """Time func; return the list of run times (in microseconds per op)
+
+    The number of calls per run is doubled until a run lasts at least
+    `min_time' seconds.
+
+    """
+
+    number = 1
+    while True:
+        start = time.time()
+        for _ in xrange(number):
+            func()
+        elapsed = time.time() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    runs = [elapsed / number * 1e6]
+    for _ in xrange(repeat - 1):
+        start = time.time()
+        for _ in xrange(number):
+            func()
+        runs.append((time.time() - start) / number * 1e6)
+    return number, runs
+
+
+#
+# Benchmarked operations
+
+def generate_pymods(method_count):
+    """Generate py-modules for an RPC-tree; return the root py-module
+
+    Methods are put into modules of FUNCS_PER_MODULE methods which are
+    grouped into packages of MODULES_PER_PACKAGE modules.
+
+    """
+
+    root = types.ModuleType('_MTRPC_ROOT_MODULE_')
+    root.__rpc_methods__ = []
+    package = None
+    module_count = -(-method_count // FUNCS_PER_MODULE)
+    for mod_i in xrange(module_count):
+        if mod_i % MODULES_PER_PACKAGE == 0:
+            package_name = 'pkg{0}'.format(mod_i // MODULES_PER_PACKAGE)
+            package = types.ModuleType(package_name)
+            package.__rpc_methods__ = []
+            setattr(root, package_name, package)
+            root.__rpc_methods__.append(package_name)
+        module_name = 'mod{0}'.format(mod_i)
+        module = types.ModuleType(module_name)
+        module.__rpc_methods__ = '*'
+        func_count = min(FUNCS_PER_MODULE, method_count - mod_i * FUNCS_PER_MODULE)
+        source = ''.join(FUNC_TEMPLATES[func_i % len(FUNC_TEMPLATES)]
+                         .format(name='method{0}'.format(func_i))
+                         for func_i in xrange(func_count))
+        exec source in module.__dict__
+        setattr(package, module_name, module)
+        package.__rpc_methods__.append(module_name)
+    return root
+
+
+def codec_payloads():
+    now = datetime.datetime(2011, 1, 2, 15, 30, 15, 30101)
+    return [
+        ('request', {
+            'id': 'mtrpc.reply.5c0bb0f2:17',
+            'method': 'accounts.users.get',
+            'params': [12345, ['login', 'email']],
+            'kwparams': {'limit': 10},
+        }),
+        ('rows', {
+            'result': [{'id': i,
+                        'login': u'user{0}'.format(i),
+                        'email': u'user{0}@example.com'.format(i),
+                        'active': i % 3 != 0,
+                        'score': i * 1.5,
+                        'created': now,
+                        'tags': [u'a', u'b']} for i in xrange(100)],
+            'error': None,
+            'id': 'mtrpc.reply.5c0bb0f2:17',
+        }),
+        ('large_list', {
+            'result': range(10000),
+            'error': None,
+            'id': 'mtrpc.reply.5c0bb0f2:17',
+        }),
+        ('text', {
+            'result': u'Zażółć gęślą jaźń. ' * 500,
+            'error': None,
+            'id': 'mtrpc.reply.5c0bb0f2:17',
+        }),
+    ]
+
+
+def codec_benchmarks(o):
+    for name, payload in codec_payloads():
+        message = encoding.dumps(payload)
+        yield ('codec.dumps.' + name,
+               lambda payload=payload: encoding.dumps(payload))
+        yield ('codec.loads.' + name,
+               lambda message=message: encoding.loads(message))
+
+
+def tree_benchmarks(o):
+    root = generate_pymods(o.methods)
+    tree = RPCTree(root)
+    yield 'tree.build', lambda: RPCTree(root)
+    yield 'tree.all_items', lambda: list(tree.all_items(deep=True))
+
+
+def method_benchmarks(o):
+    namespace = {}
+    for i, template in enumerate(FUNC_TEMPLATES):
+        exec template.format(name='method{0}'.format(i)) in namespace
+    add = RPCMethod(namespace['method0'], 'bench.add')
+    get_user = RPCMethod(namespace['method1'], 'bench.get_user')
+    log_in = RPCMethod(namespace['method2'], 'bench.log_in')
+
+    def call_arg_error():
+        try:
+            add(1, 2, 3)
+        except RPCMethodArgError:
+            pass
+
+    yield 'method.call.positional', lambda: add(1, 2)
+    yield 'method.call.keywords', lambda: get_user(12345, fields=['login'], limit=10)
+    yield 'method.call.arg_error', call_arg_error
+    yield ('method.format_args',
+           lambda: get_user.format_args([12345], {'fields': ['login', 'email']}))
+    yield ('method.format_args.password',
+           lambda: log_in.format_args(['user', 's3cret', 1], {'remember': True}))
+
+
+def manager_benchmarks(o):
+    binding_props = threads.BindingProps('rpc.friendly.exchange', 'rk.usr.#')
+    delivery_info = dict(consumer_tag='mtrpc.bench',
+                         delivery_tag=17,
+                         redelivered=False,
+                         exchange='rpc.friendly.exchange',
+                         routing_key='rk.usr.accounts.users.get')
+    yield ('manager.create_access_dict',
+           lambda: threads.RPCManager.create_access_dict(
+                   'mtrpc.bench', binding_props, delivery_info, 'mtrpc.reply.5c0bb0f2'))
+
+
+class _ResultFifo(object):
+
+    """Auxiliary class: collects results of tasks (as the responder's fifo)"""
+
+    def __init__(self):
+        self.results = []
+
+    def put(self, result):
+        if isinstance(result, threads.PartialResult):
+            result.sent.set()
+        self.results.append(result)
+
+
+def task_benchmarks(o):
+    rpc_tree = RPCTree.load(RPC_TREE_CONFIG, 'server')
+    log = logging.getLogger('mtrpc.test.bench_micro')
+    log.setLevel(logging.WARNING)
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+    access_dict = threads.RPCManager.create_access_dict(
+            'mtrpc.bench',
+            threads.BindingProps('rpc.friendly.exchange', 'bench.#'),
+            dict(consumer_tag='mtrpc.bench', delivery_tag=1, redelivered=False,
+                 exchange='rpc.friendly.exchange', routing_key='bench.bench.echo'),
+            'mtrpc.reply.5c0bb0f2')
+    result_fifo = _ResultFifo()
+    task_ids = iter(xrange(sys.maxint))
+
+    def run_task(request_message):
+        task = threads.Task(next(task_ids),
+                            request_message=request_message,
+                            access_dict=access_dict,
+                            reply_to=access_dict['reply_to'])
+        threads.RPCTaskThread(task, rpc_tree, result_fifo, log).run()
+        del result_fifo.results[:]
+
+    def request(method, params, request_id='mtrpc.reply.5c0bb0f2:1'):
+        return dict(id=request_id, method=method, params=params, kwparams={})
+
+    echo = encoding.dumps(request('bench.echo', ['hello']))
+    payload = encoding.dumps(request('bench.payload', [10000]))
+    bad_args = encoding.dumps(request('bench.echo', [1, 2]))
+    batch = encoding.dumps([request('bench.echo', [i], 'mtrpc.reply.5c0bb0f2:{0}'.format(i))
+                            for i in xrange(10)])
+
+    yield 'task.echo', lambda: run_task(echo)
+    yield 'task.payload', lambda: run_task(payload)
+    yield 'task.arg_error', lambda: run_task(bad_args)
+    yield 'task.batch10', lambda: run_task(batch)
+
+
+BENCHMARK_GROUPS = [
+    codec_benchmarks,
+    tree_benchmarks,
+    method_benchmarks,
+    manager_benchmarks,
+    task_benchmarks,
+]
+
+
+def selected(name, patterns):
+    return not patterns or any(fnmatch.fnmatch(name, pattern)
+                               or fnmatch.fnmatch(name, pattern + '.*')
+                               for pattern in patterns)
+
+
+def run_benchmarks(o, out=sys.stdout):
+    """Run (selected) benchmarks; return a dict of results (ready for JSON)"""
+
+    results = {}
+    for group in BENCHMARK_GROUPS:
+        for name, func in group(o):
+            if not selected(name, o.patterns):
+                continue
+            number, runs = time_op(func, o.min_time, o.repeat)
+            results[name] = dict(us_per_op=min(runs),
+                                 number=number,
+                                 runs_us=runs)
+            print >>out, '{0:32} {1:12.2f} us/op'.format(name, min(runs))
+            out.flush()
+    return dict(format_version=FORMAT_VERSION,
+                python=platform.python_version(),
+                implementation=platform.python_implementation(),
+                platform=platform.platform(),
+                methods=o.methods,
+                benchmarks=results)
+
+
+#
+# Baseline comparison
+
+def compare(results, baseline, tolerance):
+    """Compare results with a baseline
+
+    Return a list of (name, us_per_op, baseline_us_per_op, ratio,
+    regressed) tuples (baseline_us_per_op and ratio are None for
+    benchmarks not present in the baseline).
+
+    """
+
+    comparison = []
+    base_benchmarks = baseline.get('benchmarks', {})
+    for name, result in sorted(results['benchmarks'].iteritems()):
+        current = result['us_per_op']
+        base = base_benchmarks.get(name)
+        if base is None:
+            comparison.append((name, current, None, None, False))
+        else:
+            ratio = current / base['us_per_op']
+            comparison.append((name, current, base['us_per_op'], ratio,
+                               ratio > 1 + tolerance))
+    return comparison
+
+
+def format_comparison(comparison):
+    lines = ['{0:32} {1:>12} {2:>12} {3:>8}'.format('benchmark', 'us/op',
+                                                    'baseline', 'change')]
+    for name, current, base, ratio, regressed in comparison:
+        if base is None:
+            lines.append('{0:32} {1:12.2f} {2:>12} {3:>8}'.format(name, current, '-', 'new'))
+        else:
+            lines.append('{0:32} {1:12.2f} {2:12.2f} {3:+7.1f}%{4}'.format(
+                    name, current, base, (ratio - 1) * 100,
+                    '  REGRESSION' if regressed else ''))
+    return lines
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option('-k', '--select', dest='patterns', action='append', default=[], help='Run only benchmarks matching this name pattern (or prefix), e.g. "codec" or "*.loads.*"; can be given multiple times', metavar='PATTERN')
+    parser.add_option('-m', '--methods', dest='methods', type='int', default=2000, help='Number of methods of the generated RPC-tree')
+    parser.add_option('-t', '--min-time', dest='min_time', type='float', default=0.2, help='Minimal duration of a single run (in seconds)')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', default=3, help='Number of runs of each benchmark (the best one counts)')
+    parser.add_option('-j', '--json', dest='json_path', help='Write results as JSON to this file ("-" => stdout)', metavar='FILE')
+    parser.add_option('-b', '--baseline', dest='baseline_path', help='Compare results with a baseline (JSON results stored with -j); exit status is 1 on regressions', metavar='FILE')
+    parser.add_option('-T', '--tolerance', dest='tolerance', type='float', default=0.1, help='Slowdown (relative to the baseline) regarded as a regression (default: 0.1 => 10%)')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    if a:
+        parser.print_help()
+        sys.exit(1)
+
+    baseline = None
+    if o.baseline_path:
+        with open(o.baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    # (with JSON written to stdout, progress goes to stderr)
+    results = run_benchmarks(o, sys.stderr if o.json_path == '-' else sys.stdout)
+
+    if o.json_path == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print
+    elif o.json_path:
+        with open(o.json_path, 'w') as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        comparison = compare(results, baseline, o.tolerance)
+        print
+        if baseline.get('methods') != o.methods:
+            print ('Warning: the baseline RPC-tree had {0} methods (now: {1})'
+                   .format(baseline.get('methods'), o.methods))
+        for line in format_comparison(comparison):
+            print line
+        regressions = [name for name, _, _, _, regressed in comparison if regressed]
+        if regressions:
+            print
+            print '{0} regression(s) (tolerance: {1:.0%}): {2}'.format(
+                    len(regressions), o.tolerance, ', '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Benchmark: RPC-tree load time -- with and without the manifest.
+
+A package of generated RPC-modules (see: -m; methods are put into
+modules of FUNCS_PER_MODULE methods grouped into top-level packages of
+MODULES_PER_PACKAGE modules, see: mtrpc.test.bench_micro) is written to
+a temporary directory; then RPCTree.load() is timed (each run in a new
+process) in the following variants:
+
+* 'no manifest' -- the tree is built with introspection of py-modules;
+* 'manifest' -- built from the up-to-date manifest (see:
+  mtrpc.server.manifest), post-inits are still run;
+* 'lazy' -- lazy loading: only the manifest is read.
+
+The best run of each variant is reported, with its startup profile
+phases (see: mtrpc.server.startup), e.g.:
+
+    python -m mtrpc.test.bench_startup -m 10000 -r 5
+
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from optparse import OptionParser
+
+from mtrpc.test.bench_micro import FUNCS_PER_MODULE, MODULES_PER_PACKAGE, FUNC_TEMPLATES
+
+
+PACKAGE = 'mtrpc_startup_bench'
+
+VARIANTS = [
+    ('no manifest', dict()),
+    ('manifest', dict(manifest=True)),
+    ('lazy', dict(manifest=True, lazy=True)),
+]
+
+PHASES = ['manifest load', 'imports (rpc_tree_init)', 'tree build', 'postinits']
+
+
+def write_package(directory, method_count):
+    """Write the generated package; return "imports" config items"""
+
+    package_dir = os.path.join(directory, PACKAGE)
+    os.mkdir(package_dir)
+    open(os.path.join(package_dir, '__init__.py'), 'w').close()
+    imports = []
+    module_count = -(-method_count // FUNCS_PER_MODULE)
+    for mod_i in xrange(module_count):
+        package_name = 'pkg{0}'.format(mod_i // MODULES_PER_PACKAGE)
+        subpackage_dir = os.path.join(package_dir, package_name)
+        if mod_i % MODULES_PER_PACKAGE == 0:
+            os.mkdir(subpackage_dir)
+            module_names = ['mod{0}'.format(i) for i in xrange(
+                    mod_i, min(mod_i + MODULES_PER_PACKAGE, module_count))]
+            with open(os.path.join(subpackage_dir, '__init__.py'), 'w') as init_file:
+                init_file.write('from . import {0}\n\n__rpc_methods__ = {1!r}\n'
+                                .format(', '.join(module_names), module_names))
+            imports.append('{0}.{1} as {1}'.format(PACKAGE, package_name))
+        func_count = min(FUNCS_PER_MODULE, method_count - mod_i * FUNCS_PER_MODULE)
+        with open(os.path.join(subpackage_dir, 'mod{0}.py'.format(mod_i)), 'w') as mod_file:
+            mod_file.write("__rpc_methods__ = '*'\n\n")
+            for func_i in xrange(func_count):
+                template = FUNC_TEMPLATES[func_i % len(FUNC_TEMPLATES)]
+                mod_file.write(template.format(name='method{0}'.format(func_i)) + '\n')
+    return imports
+
+
+def make_config(imports, manifest_path, manifest=False, lazy=False):
+    return {
+        'rpc_tree_init': {
+            'paths': [],
+            'imports': imports,
+            'postinit_kwargs': {
+                'logging_settings': {
+                    'mod_logger_pattern': 'mtrpc.test.bench_startup.{full_name}',
+                    'level': 'warning',
+                    'handlers': [],
+                    'propagate': False,
+                    'custom_mod_loggers': {},
+                },
+                'mod_globals': {},
+            },
+            'lazy': lazy,
+            'manifest': manifest_path if manifest else '',
+            'update_manifest': manifest,
+        },
+    }
+
+
+def child():
+    """Load the tree (in a new process); print the load time and phases as JSON"""
+
+    import time
+    from mtrpc.server import startup
+    from mtrpc.server.methodtree import RPCTree
+
+    directory, config_path = sys.argv[1:3]
+    sys.path.insert(0, directory)
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+    profile = startup.StartupProfile()
+    start = time.time()
+    rpc_tree = RPCTree.load(config, 'server', profile=profile)
+    elapsed = time.time() - start
+    json.dump(dict(elapsed=elapsed, phases=profile.phases, items=len(rpc_tree)),
+              sys.stdout)
+
+
+def run_child(directory, config_path):
+    output = subprocess.check_output(
+            [sys.executable, '-c', 'from mtrpc.test.bench_startup import child; child()',
+             directory, config_path])
+    return json.loads(output)
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option('-m', '--methods', dest='methods', type='int', default=10000, help='Number of generated RPC-methods')
+    parser.add_option('-r', '--runs', dest='runs', type='int', default=3, help='Number of runs of each variant (the best one counts)')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    if a:
+        parser.print_help()
+        sys.exit(1)
+
+    directory = tempfile.mkdtemp(prefix='mtrpc-bench-startup-')
+    try:
+        imports = write_package(directory, o.methods)
+        manifest_path = os.path.join(directory, 'manifest.json')
+        print '{0} methods, {1} modules, {2} top-level packages'.format(
+                o.methods, -(-o.methods // FUNCS_PER_MODULE), len(imports))
+        print
+        print '{0:12} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10} {6:>10}'.format(
+                'variant', 'load [ms]', 'manifest', 'imports', 'build', 'postinits', 'items')
+        for name, variant in VARIANTS:
+            config_path = os.path.join(directory, 'config.json')
+            with open(config_path, 'w') as config_file:
+                json.dump(make_config(imports, manifest_path, **variant), config_file)
+            # (the first run: compiling modules, writing the manifest)
+            run_child(directory, config_path)
+            results = [run_child(directory, config_path) for _ in xrange(o.runs)]
+            best = min(results, key=lambda result: result['elapsed'])
+            print '{0:12} {1:10.1f} {2} {3:10}'.format(
+                    name, best['elapsed'] * 1000,
+                    ' '.join('{0:10.1f}'.format(best['phases'].get(phase, 0.0) * 1000)
+                             for phase in PHASES),
+                    best['items'])
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
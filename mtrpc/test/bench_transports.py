@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Benchmark: the same end-to-end workload over various transports.
+
+For each given transport (see: mtrpc.common.transport), an MTRPC server
+(RPCManager + RPCResponder, serving the `system' and `bench' RPC-modules)
+is started in the benchmark process and RPC-methods are called by
+MTRPCProxy instances using the same transport -- at various concurrency
+levels (see: mtrpc.test.bench_end_to_end); requests/sec and p50/p99 call
+latencies are reported for each transport, e.g.:
+
+    python -m mtrpc.test.bench_transports -n 2000 -c 1,16
+    python -m mtrpc.test.bench_transports -t loopback bench.payload 100000
+    python -m mtrpc.test.bench_transports -H localhost:5672   # (RabbitMQ)
+
+The 'amqplib' transport connects to the in-memory AMQP broker stand-in
+(see: mtrpc.test.broker) started in the benchmark process -- unless
+a real broker is given (-H); the 'loopback' transport needs no broker;
+'socket' -- the direct transport (see: mtrpc.common.socket_transport)
+over TCP (a free port of 127.0.0.1), 'socket-unix' -- the same over
+a Unix domain socket (in a temporary directory); other transports (names
+or dotted paths of Transport subclasses) are used with no other
+connection parameters.
+
+"""
+
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+from optparse import OptionParser
+
+from mtrpc.mtrpc_request import decode_arg
+from mtrpc.test.bench_end_to_end import (EXCHANGE, RK_PATTERN, start_server,
+                                         wait_until_served, percentile,
+                                         bench_level)
+from mtrpc.test.broker import Broker
+
+
+def connection_params(transport_name, options):
+
+    """Prepare connection parameters for the transport
+
+    Return a tuple: (<server params dict>, <client params dict>,
+    <cleanup function or None>).
+
+    """
+
+    cleanup = None
+    if transport_name == 'amqplib':
+        if options.host is None:
+            broker = Broker().start()
+            host = broker.host
+            cleanup = broker.stop
+        else:
+            host = options.host
+        params = dict(host=host, userid=options.userid, password=options.password)
+    elif transport_name == 'loopback':
+        params = dict(virtual_host='mtrpc.bench')
+    elif transport_name in ('socket', 'socket-unix'):
+        if transport_name == 'socket':
+            address = '127.0.0.1:{0}'.format(_free_port())
+        else:
+            tmp_dir = tempfile.mkdtemp(prefix='mtrpc-bench-')
+            address = os.path.join(tmp_dir, 'mtrpc.sock')
+            cleanup = lambda: shutil.rmtree(tmp_dir, ignore_errors=True)
+        return (dict(transport='socket-server', listen=address),
+                dict(transport='socket', address=address),
+                cleanup)
+    else:
+        params = {}
+    params['transport'] = transport_name
+    return params, dict(params), cleanup
+
+
+def _free_port():
+    sock = socket.socket()
+    try:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def main():
+    parser = OptionParser(usage="usage: %prog [options] [method args...]")
+    parser.add_option('-t', '--transports', dest='transports', default='amqplib,loopback,socket', help='Comma-separated transports to be compared')
+    parser.add_option('-H', '--host', dest='host', default=None, help='AMQP broker for the amqplib transport (default: start the in-memory broker stand-in)')
+    parser.add_option('-u', '--user', dest='userid', default='guest', help='AMQP user login')
+    parser.add_option('-p', '--password', dest='password', default='guest', help='AMQP user password')
+    parser.add_option('-n', '--calls', dest='calls', type='int', default=2000, help='Number of calls (for each transport and concurrency level)')
+    parser.add_option('-c', '--concurrency', dest='concurrency', default='1,4,16', help='Comma-separated concurrency levels (numbers of calling threads)')
+    parser.add_option('-w', '--warmup', dest='warmup', type='int', default=10, help='Number of not measured calls made by each thread first')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true', default=False, help='Show the server log (warnings and errors)')
+
+    (o, a) = parser.parse_args(sys.argv[1:])
+
+    if a:
+        method = a[0]
+        args = [decode_arg(arg) for arg in a[1:]]
+    else:
+        method = 'bench.echo'
+        args = ['x']
+    transport_names = o.transports.split(',')
+    levels = [int(level) for level in o.concurrency.split(',')]
+
+    logging.basicConfig(level=logging.WARNING if o.verbose else logging.CRITICAL)
+
+    print '{0}{1}'.format(method, tuple(args))
+    print '{0:>11} {1:>11} {2:>7} {3:>10} {4:>9} {5:>9} {6:>9}'.format(
+            'transport', 'concurrency', 'calls', 'calls/s', 'p50 ms', 'p99 ms', 'max ms')
+    for transport_name in transport_names:
+        server_params, client_params, cleanup = connection_params(transport_name, o)
+        proxy_kwargs = dict(req_exchange=EXCHANGE,
+                            req_rk_pattern=RK_PATTERN,
+                            loglevel='critical',
+                            **client_params)
+        try:
+            manager = start_server(server_params)
+            try:
+                wait_until_served(proxy_kwargs)
+                for concurrency in levels:
+                    calls = max(o.calls - o.calls % concurrency, concurrency)
+                    elapsed, latencies = bench_level(proxy_kwargs, method, args, calls,
+                                                     concurrency, o.warmup)
+                    print '{0:>11} {1:>11} {2:>7} {3:>10.1f} {4:>9.2f} {5:>9.2f} {6:>9.2f}'.format(
+                            transport_name, concurrency, calls, calls / elapsed,
+                            percentile(latencies, 0.5) * 1000,
+                            percentile(latencies, 0.99) * 1000,
+                            latencies[-1] * 1000)
+            finally:
+                manager.stop(timeout=10)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+
+if __name__ == '__main__':
+    main()
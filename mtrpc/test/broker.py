@@ -0,0 +1,820 @@
+# mtrpc/test/broker.py
+#
+# Copyright (c) 2010, MegiTeam
+
+"""In-memory AMQP broker stand-in (for tests and benchmarks).
+
+It speaks the subset of AMQP 0-8 used by amqplib.client_0_8 (and by MTRPC
+server and client):
+
+* connection: start/start-ok, tune/tune-ok, open/open-ok, close/close-ok;
+* channel: open/open-ok, flow/flow-ok, close/close-ok;
+* exchange: declare/declare-ok ('direct', 'topic' and 'fanout' types);
+* queue: declare/declare-ok (also server-named, exclusive and auto-delete
+  queues), bind/bind-ok, delete/delete-ok;
+* basic: qos/qos-ok (prefetch count), consume/consume-ok, cancel/cancel-ok,
+  publish (with "mandatory" and "immediate" flags => return), deliver,
+  get/get-ok/get-empty, ack, reject;
+* RabbitMQ-like "direct reply-to" (consuming from the DIRECT_REPLY_TO
+  pseudo-queue, with no_ack).
+
+Messages are never persisted and there is no authentication (any user
+name and password are accepted).
+
+Usage -- in-process (the broker listens on a localhost TCP port, serving
+connections in its own threads):
+
+    from mtrpc.test.broker import Broker
+
+    broker = Broker()
+    broker.start()
+    ...  # use broker.host ('127.0.0.1:<port>') as amqp "host" parameter
+    broker.stop()
+
+-- or as a separate process:
+
+    python -m mtrpc.test.broker [-p PORT]
+
+"""
+
+import collections
+import itertools
+import socket
+import struct
+import threading
+
+from amqplib.client_0_8.basic_message import Message
+from amqplib.client_0_8.serialization import AMQPReader, AMQPWriter
+
+
+AMQP_PROTOCOL_HEADER = 'AMQP\x01\x01\x09\x01'
+FRAME_END = '\xce'
+FRAME_MAX = 131072
+
+# frame types
+FRAME_METHOD = 1
+FRAME_HEADER = 2
+FRAME_BODY = 3
+
+# reply codes
+REPLY_SUCCESS = 200
+NO_ROUTE = 312
+NO_CONSUMERS = 313
+ACCESS_REFUSED = 403
+NOT_FOUND = 404
+RESOURCE_LOCKED = 405
+PRECONDITION_FAILED = 406
+NOT_IMPLEMENTED = 540
+
+DIRECT_REPLY_TO = 'amq.rabbitmq.reply-to'
+
+
+class ChannelError(Exception):
+    """Soft error: the broker closes the channel"""
+
+    def __init__(self, reply_code, reply_text, method_sig=(0, 0)):
+        Exception.__init__(self, reply_code, reply_text)
+        self.reply_code = reply_code
+        self.reply_text = reply_text
+        self.method_sig = method_sig
+
+
+class StoredMessage(object):
+
+    """A published message (raw content header properties + body)"""
+
+    __slots__ = ('exchange', 'routing_key', 'raw_properties', 'body',
+                 'redelivered')
+
+    def __init__(self, exchange, routing_key, raw_properties, body):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.raw_properties = raw_properties
+        self.body = body
+        self.redelivered = False
+
+    @property
+    def properties(self):
+        msg = Message()
+        msg._load_properties(self.raw_properties)
+        return msg.properties
+
+
+class BrokerQueue(object):
+
+    def __init__(self, name, exclusive_owner=None, auto_delete=False):
+        self.name = name
+        self.exclusive_owner = exclusive_owner  # a BrokerConnection or None
+        self.auto_delete = auto_delete
+        self.messages = collections.deque()
+        self.consumers = collections.deque()  # of Consumer instances
+        self.had_consumers = False
+
+
+class Consumer(object):
+
+    __slots__ = ('channel', 'tag', 'queue', 'no_ack')
+
+    def __init__(self, channel, tag, queue, no_ack):
+        self.channel = channel
+        self.tag = tag
+        self.queue = queue
+        self.no_ack = no_ack
+
+    def can_take(self):
+        return self.no_ack or self.channel.can_take()
+
+
+class Broker(object):
+
+    """The broker state (exchanges, queues, bindings) + the TCP listener"""
+
+    def __init__(self, listen_host='127.0.0.1', port=0):
+        self.listen_host = listen_host
+        self.port = port
+        self.lock = threading.RLock()
+        self.exchanges = {
+            '': 'direct',
+            'amq.direct': 'direct',
+            'amq.topic': 'topic',
+            'amq.fanout': 'fanout',
+        }
+        self.bindings = collections.defaultdict(list)  # exchange -> [(queue, rk)]
+        self.queues = {}
+        self.connections = set()
+        self._queue_name_gen = itertools.count(1)
+        self._listener = None
+        self._listener_thread = None
+        self.stats = collections.Counter()
+
+    @property
+    def host(self):
+        """'host:port' string (suitable as amqplib Connection's host arg)"""
+        return '{0}:{1}'.format(self.listen_host, self.port)
+
+    #
+    # Starting/stopping
+
+    def start(self):
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.listen_host, self.port))
+        self._listener.listen(128)
+        self.port = self._listener.getsockname()[1]
+        self._listener_thread = threading.Thread(target=self._accept_loop,
+                                                 name='Broker-listener')
+        self._listener_thread.daemon = True
+        self._listener_thread.start()
+        return self
+
+    def stop(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            listener.close()
+        if self._listener_thread is not None:
+            self._listener_thread.join(1)
+            self._listener_thread = None
+        with self.lock:
+            connections = list(self.connections)
+        for conn in connections:
+            conn.shutdown()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _accept_loop(self):
+        while self._listener is not None:
+            try:
+                sock, _ = self._listener.accept()
+            except (socket.error, AttributeError):
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = BrokerConnection(self, sock)
+            with self.lock:
+                self.connections.add(conn)
+            conn.start()
+
+    #
+    # Broker operations (called from connection threads)
+
+    def declare_exchange(self, exchange, type, passive):
+        with self.lock:
+            existing = self.exchanges.get(exchange)
+            if existing is None:
+                if passive:
+                    raise ChannelError(NOT_FOUND, 'NOT_FOUND - no exchange {0!r}'.format(exchange), (40, 10))
+                if type not in ('direct', 'topic', 'fanout'):
+                    raise ChannelError(NOT_IMPLEMENTED, 'exchange type {0!r} not implemented'.format(type), (40, 10))
+                self.exchanges[exchange] = type
+            elif not passive and existing != type:
+                raise ChannelError(PRECONDITION_FAILED, 'PRECONDITION_FAILED - cannot redeclare '
+                                   'exchange {0!r} of type {1!r} as {2!r}'.format(exchange, existing, type), (40, 10))
+
+    def declare_queue(self, conn, queue, passive, exclusive, auto_delete):
+        with self.lock:
+            if not queue:
+                queue = 'amq.gen-{0}'.format(next(self._queue_name_gen))
+            existing = self.queues.get(queue)
+            if existing is None:
+                if passive:
+                    raise ChannelError(NOT_FOUND, 'NOT_FOUND - no queue {0!r}'.format(queue), (50, 10))
+                existing = self.queues[queue] = BrokerQueue(queue, conn if exclusive else None, auto_delete)
+                # (default exchange: every queue is bound with its name)
+            elif existing.exclusive_owner not in (None, conn):
+                raise ChannelError(RESOURCE_LOCKED, 'RESOURCE_LOCKED - queue {0!r} is exclusive'.format(queue), (50, 10))
+            return queue, len(existing.messages), len(existing.consumers)
+
+    def delete_queue(self, queue):
+        with self.lock:
+            brq = self.queues.pop(queue, None)
+            if brq is None:
+                return 0
+            for exchange, bindings in self.bindings.items():
+                bindings[:] = [b for b in bindings if b[0] != queue]
+            for consumer in list(brq.consumers):
+                consumer.channel.consumers.pop(consumer.tag, None)
+            return len(brq.messages)
+
+    def bind_queue(self, queue, exchange, routing_key):
+        with self.lock:
+            if queue not in self.queues:
+                raise ChannelError(NOT_FOUND, 'NOT_FOUND - no queue {0!r}'.format(queue), (50, 20))
+            if exchange not in self.exchanges:
+                raise ChannelError(NOT_FOUND, 'NOT_FOUND - no exchange {0!r}'.format(exchange), (50, 20))
+            binding = (queue, routing_key)
+            if binding not in self.bindings[exchange]:
+                self.bindings[exchange].append(binding)
+
+    @classmethod
+    def _topic_match(cls, pattern_words, key_words):
+        """Match routing key words against binding key words ('*', '#')"""
+        if not pattern_words:
+            return not key_words
+        word, rest = pattern_words[0], pattern_words[1:]
+        if word == '#':
+            return any(cls._topic_match(rest, key_words[i:])
+                       for i in xrange(len(key_words) + 1))
+        if not key_words:
+            return False
+        return ((word == '*' or word == key_words[0])
+                and cls._topic_match(rest, key_words[1:]))
+
+    def route(self, exchange, routing_key):
+        """Return names of queues the message should be put into"""
+        exchange_type = self.exchanges.get(exchange)
+        if exchange_type is None:
+            raise ChannelError(NOT_FOUND, 'NOT_FOUND - no exchange {0!r}'.format(exchange), (60, 40))
+        if exchange == '':
+            return [routing_key] if routing_key in self.queues else []
+        queues = []
+        for queue, binding_key in self.bindings.get(exchange, ()):
+            if exchange_type == 'fanout':
+                matches = True
+            elif exchange_type == 'topic':
+                matches = self._topic_match(binding_key.split('.'),
+                                            routing_key.split('.'))
+            else:
+                matches = (binding_key == routing_key)
+            if matches and queue not in queues:
+                queues.append(queue)
+        return queues
+
+    def publish(self, channel, exchange, routing_key, mandatory, immediate,
+                raw_properties, body):
+        self.stats['published'] += 1
+        with self.lock:
+            queues = self.route(exchange, routing_key)
+            if not queues:
+                if mandatory:
+                    channel.send_return(NO_ROUTE, 'unroutable', exchange, routing_key,
+                                        raw_properties, body)
+                else:
+                    self.stats['dropped'] += 1
+                return
+            if immediate and not any(self.queues[q].consumers for q in queues):
+                channel.send_return(NO_CONSUMERS, 'no consumers', exchange, routing_key,
+                                    raw_properties, body)
+                return
+            for queue in queues:
+                brq = self.queues[queue]
+                brq.messages.append(StoredMessage(exchange, routing_key,
+                                                  raw_properties, body))
+                self.dispatch(brq)
+
+    def dispatch(self, brq):
+        """Deliver queued messages to consumers that can take them"""
+        with self.lock:
+            consumers = brq.consumers
+            while brq.messages and consumers:
+                for _ in xrange(len(consumers)):
+                    consumer = consumers[0]
+                    consumers.rotate(-1)
+                    if consumer.can_take():
+                        break
+                else:
+                    return  # (all consumers have their prefetch limits reached)
+                msg = brq.messages.popleft()
+                consumer.channel.deliver(consumer, msg)
+                self.stats['delivered'] += 1
+
+    def requeue(self, queue, messages):
+        with self.lock:
+            brq = self.queues.get(queue)
+            if brq is None:
+                return
+            for msg in reversed(messages):
+                msg.redelivered = True
+                brq.messages.appendleft(msg)
+            self.dispatch(brq)
+
+    def remove_consumer(self, consumer):
+        with self.lock:
+            brq = self.queues.get(consumer.queue)
+            if brq is None:
+                return
+            try:
+                brq.consumers.remove(consumer)
+            except ValueError:
+                return
+            if brq.auto_delete and not brq.consumers:
+                self.delete_queue(brq.name)
+
+    def connection_closed(self, conn):
+        with self.lock:
+            self.connections.discard(conn)
+            for name, brq in self.queues.items():
+                if brq.exclusive_owner is conn:
+                    self.delete_queue(name)
+
+
+class BrokerChannel(object):
+
+    def __init__(self, conn, channel_id):
+        self.conn = conn
+        self.channel_id = channel_id
+        self.consumers = {}  # consumer tag -> Consumer
+        self.unacked = collections.OrderedDict()  # delivery tag -> (queue, msg)
+        self.prefetch_count = 0
+        self.active = True
+        self._delivery_tag_gen = itertools.count(1)
+        self._consumer_tag_gen = itertools.count(1)
+        self.partial = None  # (method args, header) of incoming content
+        self.direct_reply_queue = None  # (a real queue behind DIRECT_REPLY_TO)
+
+    def can_take(self):
+        return self.active and (not self.prefetch_count
+                                or len(self.unacked) < self.prefetch_count)
+
+    def deliver(self, consumer, msg):
+        delivery_tag = next(self._delivery_tag_gen)
+        if not consumer.no_ack:
+            self.unacked[delivery_tag] = (consumer.queue, msg)
+        args = AMQPWriter()
+        args.write_shortstr(consumer.tag)
+        args.write_longlong(delivery_tag)
+        args.write_bit(msg.redelivered)
+        args.write_shortstr(msg.exchange)
+        args.write_shortstr(msg.routing_key)
+        self.conn.send_content(self.channel_id, (60, 60), args.getvalue(),
+                               msg.raw_properties, msg.body)
+
+    def send_return(self, reply_code, reply_text, exchange, routing_key,
+                    raw_properties, body):
+        args = AMQPWriter()
+        args.write_short(reply_code)
+        args.write_shortstr(reply_text)
+        args.write_shortstr(exchange)
+        args.write_shortstr(routing_key)
+        self.conn.send_content(self.channel_id, (60, 50), args.getvalue(),
+                               raw_properties, body)
+
+    def ack(self, delivery_tag, multiple):
+        broker = self.conn.broker
+        with broker.lock:
+            if multiple:
+                tags = [tag for tag in self.unacked if tag <= delivery_tag or not delivery_tag]
+            else:
+                tags = [delivery_tag]
+            queues = set()
+            for tag in tags:
+                item = self.unacked.pop(tag, None)
+                if item is not None:
+                    queues.add(item[0])
+            for queue in queues:
+                brq = broker.queues.get(queue)
+                if brq is not None:
+                    broker.dispatch(brq)
+
+    def release(self):
+        """Cancel consumers, requeue unacknowledged messages"""
+        broker = self.conn.broker
+        with broker.lock:
+            for consumer in self.consumers.values():
+                broker.remove_consumer(consumer)
+            self.consumers.clear()
+            by_queue = collections.OrderedDict()
+            for queue, msg in self.unacked.itervalues():
+                by_queue.setdefault(queue, []).append(msg)
+            self.unacked.clear()
+            for queue, messages in by_queue.iteritems():
+                broker.requeue(queue, messages)
+
+
+class BrokerConnection(threading.Thread):
+
+    """Serves one client connection"""
+
+    instance_counter = itertools.count(1)
+
+    def __init__(self, broker, sock):
+        threading.Thread.__init__(self, name='Broker-connection-{0}'.format(
+            next(self.instance_counter)))
+        self.daemon = True
+        self.broker = broker
+        self.sock = sock
+        self.write_lock = threading.Lock()
+        self.channels = {}
+        self.frame_max = FRAME_MAX
+        self._read_buffer = ''
+        self._closed = False
+
+    #
+    # Low-level I/O
+
+    def _read(self, n):
+        while len(self._read_buffer) < n:
+            data = self.sock.recv(65536)
+            if not data:
+                raise EOFError
+            self._read_buffer += data
+        result, self._read_buffer = self._read_buffer[:n], self._read_buffer[n:]
+        return result
+
+    def read_frame(self):
+        frame_type, channel_id, size = struct.unpack('>BHI', self._read(7))
+        payload = self._read(size)
+        if self._read(1) != FRAME_END:
+            raise EOFError('framing error')
+        return frame_type, channel_id, payload
+
+    @staticmethod
+    def _frame(frame_type, channel_id, payload):
+        return struct.pack('>BHI', frame_type, channel_id, len(payload)) + payload + FRAME_END
+
+    def _write(self, data):
+        with self.write_lock:
+            if self._closed:
+                return
+            try:
+                self.sock.sendall(data)
+            except socket.error:
+                self._closed = True
+
+    def send_method(self, channel_id, method_sig, args=''):
+        payload = struct.pack('>HH', *method_sig) + args
+        self._write(self._frame(FRAME_METHOD, channel_id, payload))
+
+    def send_content(self, channel_id, method_sig, args, raw_properties, body):
+        frames = [self._frame(FRAME_METHOD, channel_id, struct.pack('>HH', *method_sig) + args),
+                  self._frame(FRAME_HEADER, channel_id,
+                              struct.pack('>HHQ', method_sig[0], 0, len(body)) + raw_properties)]
+        chunk_size = self.frame_max - 8
+        for i in xrange(0, len(body), chunk_size):
+            frames.append(self._frame(FRAME_BODY, channel_id, body[i:i + chunk_size]))
+        self._write(''.join(frames))
+
+    def shutdown(self):
+        with self.write_lock:
+            self._closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    #
+    # Thread activity
+
+    def run(self):
+        try:
+            if self._read(8) != AMQP_PROTOCOL_HEADER:
+                return
+            self._handshake()
+            while not self._closed:
+                frame_type, channel_id, payload = self.read_frame()
+                self.handle_frame(frame_type, channel_id, payload)
+        except (EOFError, socket.error, struct.error):
+            pass
+        finally:
+            self._cleanup()
+
+    def _handshake(self):
+        args = AMQPWriter()
+        args.write_octet(8)
+        args.write_octet(0)
+        args.write_table({'product': 'mtrpc.test.broker'})
+        args.write_longstr('AMQPLAIN PLAIN')
+        args.write_longstr('en_US')
+        self.send_method(0, (10, 10), args.getvalue())
+        self._expect_method(0, (10, 11))  # start-ok
+        args = AMQPWriter()
+        args.write_short(0)
+        args.write_long(FRAME_MAX)
+        args.write_short(0)
+        self.send_method(0, (10, 30), args.getvalue())
+        reader = self._expect_method(0, (10, 31))  # tune-ok
+        reader.read_short()
+        self.frame_max = reader.read_long() or FRAME_MAX
+        self._expect_method(0, (10, 40))  # open
+        args = AMQPWriter()
+        args.write_shortstr('')
+        self.send_method(0, (10, 41), args.getvalue())
+
+    def _expect_method(self, channel_id, method_sig):
+        frame_type, _channel_id, payload = self.read_frame()
+        sig = struct.unpack('>HH', payload[:4])
+        if frame_type != FRAME_METHOD or _channel_id != channel_id or sig != method_sig:
+            raise EOFError('unexpected frame during handshake')
+        return AMQPReader(payload[4:])
+
+    def _cleanup(self):
+        self._closed = True
+        for channel in self.channels.values():
+            channel.release()
+        self.channels.clear()
+        self.broker.connection_closed(self)
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+    #
+    # Frame and method handling
+
+    def handle_frame(self, frame_type, channel_id, payload):
+        if frame_type == FRAME_METHOD:
+            method_sig = struct.unpack('>HH', payload[:4])
+            args = AMQPReader(payload[4:])
+            if channel_id == 0:
+                self.handle_connection_method(method_sig, args)
+            else:
+                channel = self.channels.get(channel_id)
+                if channel is None:
+                    if method_sig == (20, 10):
+                        self.channels[channel_id] = BrokerChannel(self, channel_id)
+                        self.send_method(channel_id, (20, 11))
+                    return
+                try:
+                    self.handle_channel_method(channel, method_sig, args)
+                except ChannelError as exc:
+                    self.close_channel(channel, exc)
+        elif frame_type == FRAME_HEADER:
+            channel = self.channels.get(channel_id)
+            if channel is not None and channel.partial is not None:
+                class_id, weight, body_size = struct.unpack('>HHQ', payload[:12])
+                channel.partial = channel.partial + ([payload[12:], body_size, []],)
+                if body_size == 0:
+                    self._content_complete(channel)
+        elif frame_type == FRAME_BODY:
+            channel = self.channels.get(channel_id)
+            if channel is not None and channel.partial is not None:
+                content = channel.partial[1]
+                content[2].append(payload)
+                content[1] -= len(payload)
+                if content[1] <= 0:
+                    self._content_complete(channel)
+
+    def _content_complete(self, channel):
+        (exchange, routing_key, mandatory, immediate), content = channel.partial
+        channel.partial = None
+        raw_properties, _, chunks = content
+        if channel.direct_reply_queue is not None:
+            raw_properties = self._rewrite_reply_to(channel, raw_properties)
+        try:
+            self.broker.publish(channel, exchange, routing_key, mandatory,
+                                immediate, raw_properties, ''.join(chunks))
+        except ChannelError as exc:
+            self.close_channel(channel, exc)
+
+    @staticmethod
+    def _rewrite_reply_to(channel, raw_properties):
+        msg = Message()
+        msg._load_properties(raw_properties)
+        if msg.properties.get('reply_to') != DIRECT_REPLY_TO:
+            return raw_properties
+        msg.properties['reply_to'] = channel.direct_reply_queue
+        return msg._serialize_properties()
+
+    def close_channel(self, channel, exc):
+        channel.release()
+        self.channels.pop(channel.channel_id, None)
+        args = AMQPWriter()
+        args.write_short(exc.reply_code)
+        args.write_shortstr(exc.reply_text[:255])
+        args.write_short(exc.method_sig[0])
+        args.write_short(exc.method_sig[1])
+        self.send_method(channel.channel_id, (20, 40), args.getvalue())
+
+    def handle_connection_method(self, method_sig, args):
+        if method_sig == (10, 60):  # close
+            self.send_method(0, (10, 61))
+            self._closed = True
+        elif method_sig == (10, 61):  # close-ok
+            self._closed = True
+
+    def handle_channel_method(self, channel, method_sig, args):
+        broker = self.broker
+        channel_id = channel.channel_id
+
+        if method_sig == (20, 40):  # channel.close
+            channel.release()
+            self.channels.pop(channel_id, None)
+            self.send_method(channel_id, (20, 41))
+
+        elif method_sig == (20, 41):  # channel.close-ok
+            self.channels.pop(channel_id, None)
+
+        elif method_sig == (20, 20):  # channel.flow
+            channel.active = args.read_bit()
+            reply = AMQPWriter()
+            reply.write_bit(channel.active)
+            self.send_method(channel_id, (20, 21), reply.getvalue())
+            if channel.active:
+                with broker.lock:
+                    for consumer in channel.consumers.values():
+                        broker.dispatch(broker.queues[consumer.queue])
+
+        elif method_sig == (40, 10):  # exchange.declare
+            args.read_short()
+            exchange = args.read_shortstr()
+            exchange_type = args.read_shortstr()
+            passive = args.read_bit()
+            args.read_bit()  # durable
+            args.read_bit()  # auto_delete
+            args.read_bit()  # internal
+            nowait = args.read_bit()
+            broker.declare_exchange(exchange, exchange_type, passive)
+            if not nowait:
+                self.send_method(channel_id, (40, 11))
+
+        elif method_sig == (50, 10):  # queue.declare
+            args.read_short()
+            queue = args.read_shortstr()
+            passive = args.read_bit()
+            args.read_bit()  # durable
+            exclusive = args.read_bit()
+            auto_delete = args.read_bit()
+            nowait = args.read_bit()
+            queue, msg_count, consumer_count = broker.declare_queue(
+                self, queue, passive, exclusive, auto_delete)
+            if not nowait:
+                reply = AMQPWriter()
+                reply.write_shortstr(queue)
+                reply.write_long(msg_count)
+                reply.write_long(consumer_count)
+                self.send_method(channel_id, (50, 11), reply.getvalue())
+
+        elif method_sig == (50, 20):  # queue.bind
+            args.read_short()
+            queue = args.read_shortstr()
+            exchange = args.read_shortstr()
+            routing_key = args.read_shortstr()
+            nowait = args.read_bit()
+            broker.bind_queue(queue, exchange, routing_key)
+            if not nowait:
+                self.send_method(channel_id, (50, 21))
+
+        elif method_sig == (50, 40):  # queue.delete
+            args.read_short()
+            queue = args.read_shortstr()
+            args.read_bit()  # if_unused
+            args.read_bit()  # if_empty
+            nowait = args.read_bit()
+            count = broker.delete_queue(queue)
+            if not nowait:
+                reply = AMQPWriter()
+                reply.write_long(count)
+                self.send_method(channel_id, (50, 41), reply.getvalue())
+
+        elif method_sig == (60, 10):  # basic.qos
+            args.read_long()  # prefetch_size
+            channel.prefetch_count = args.read_short()
+            self.send_method(channel_id, (60, 11))
+
+        elif method_sig == (60, 20):  # basic.consume
+            args.read_short()
+            queue = args.read_shortstr()
+            tag = args.read_shortstr()
+            args.read_bit()  # no_local
+            no_ack = args.read_bit()
+            args.read_bit()  # exclusive
+            nowait = args.read_bit()
+            with broker.lock:
+                if queue == DIRECT_REPLY_TO:
+                    if not no_ack:
+                        raise ChannelError(PRECONDITION_FAILED, 'PRECONDITION_FAILED - direct reply-to '
+                                           'needs no_ack', (60, 20))
+                    queue = '{0}.{1}'.format(DIRECT_REPLY_TO, next(broker._queue_name_gen))
+                    broker.queues[queue] = BrokerQueue(queue, self, auto_delete=True)
+                    channel.direct_reply_queue = queue
+                brq = broker.queues.get(queue)
+                if brq is None:
+                    raise ChannelError(NOT_FOUND, 'NOT_FOUND - no queue {0!r}'.format(queue), (60, 20))
+                if not tag:
+                    tag = 'amq.ctag-{0}'.format(next(channel._consumer_tag_gen))
+                consumer = Consumer(channel, tag, queue, no_ack)
+                channel.consumers[tag] = consumer
+                if not nowait:
+                    reply = AMQPWriter()
+                    reply.write_shortstr(tag)
+                    self.send_method(channel_id, (60, 21), reply.getvalue())
+                brq.consumers.append(consumer)
+                brq.had_consumers = True
+                broker.dispatch(brq)
+
+        elif method_sig == (60, 30):  # basic.cancel
+            tag = args.read_shortstr()
+            nowait = args.read_bit()
+            consumer = channel.consumers.pop(tag, None)
+            if consumer is not None:
+                broker.remove_consumer(consumer)
+            if not nowait:
+                reply = AMQPWriter()
+                reply.write_shortstr(tag)
+                self.send_method(channel_id, (60, 31), reply.getvalue())
+
+        elif method_sig == (60, 40):  # basic.publish
+            args.read_short()
+            exchange = args.read_shortstr()
+            routing_key = args.read_shortstr()
+            mandatory = args.read_bit()
+            immediate = args.read_bit()
+            channel.partial = ((exchange, routing_key, mandatory, immediate),)
+
+        elif method_sig == (60, 70):  # basic.get
+            args.read_short()
+            queue = args.read_shortstr()
+            no_ack = args.read_bit()
+            with broker.lock:
+                brq = broker.queues.get(queue)
+                if brq is None:
+                    raise ChannelError(NOT_FOUND, 'NOT_FOUND - no queue {0!r}'.format(queue), (60, 70))
+                if not brq.messages:
+                    reply = AMQPWriter()
+                    reply.write_shortstr('')
+                    self.send_method(channel_id, (60, 72), reply.getvalue())
+                    return
+                msg = brq.messages.popleft()
+                delivery_tag = next(channel._delivery_tag_gen)
+                if not no_ack:
+                    channel.unacked[delivery_tag] = (queue, msg)
+                reply = AMQPWriter()
+                reply.write_longlong(delivery_tag)
+                reply.write_bit(msg.redelivered)
+                reply.write_shortstr(msg.exchange)
+                reply.write_shortstr(msg.routing_key)
+                reply.write_long(len(brq.messages))
+                self.send_content(channel_id, (60, 71), reply.getvalue(),
+                                  msg.raw_properties, msg.body)
+
+        elif method_sig == (60, 80):  # basic.ack
+            delivery_tag = args.read_longlong()
+            multiple = args.read_bit()
+            channel.ack(delivery_tag, multiple)
+
+        elif method_sig == (60, 90):  # basic.reject
+            delivery_tag = args.read_longlong()
+            requeue = args.read_bit()
+            with broker.lock:
+                item = channel.unacked.pop(delivery_tag, None)
+                if item is not None and requeue:
+                    broker.requeue(item[0], [item[1]])
+
+        else:
+            raise ChannelError(NOT_IMPLEMENTED, 'NOT_IMPLEMENTED - method {0!r}'.format(method_sig), method_sig)
+
+
+def main():
+    import time
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-b', '--bind', dest='listen_host', default='127.0.0.1', help='address to listen on')
+    parser.add_option('-p', '--port', dest='port', type='int', default=5672, help='TCP port to listen on')
+    (o, a) = parser.parse_args()
+    broker = Broker(o.listen_host, o.port).start()
+    print 'Broker stand-in listening at', broker.host
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Tests: streamed (iterator) results of requests with no reply-to queue.
+
+No broker is needed -- RPCTaskThread is run directly (as in
+mtrpc.test.bench_micro), e.g.:
+
+    python -m unittest mtrpc.test.test_streaming
+
+"""
+
+import logging
+import Queue
+import threading
+import types
+import unittest
+
+from mtrpc.common import encoding
+from mtrpc.server import threads
+from mtrpc.server.methodtree import RPCTree
+
+
+log = logging.getLogger('mtrpc.test.test_streaming')
+log.addHandler(logging.NullHandler())
+log.propagate = False
+
+
+class _ResultFifo(object):
+
+    """Auxiliary class: collects results of tasks (as the responder's fifo)"""
+
+    def __init__(self):
+        self.results = []
+
+    def put(self, result):
+        if isinstance(result, threads.PartialResult):
+            result.sent.set()
+        self.results.append(result)
+
+
+def make_rpc_tree(consumed):
+    root = types.ModuleType('_MTRPC_ROOT_MODULE_')
+    root.__rpc_methods__ = ['stream']
+    module = types.ModuleType('stream')
+    module.__rpc_methods__ = ['numbers']
+
+    def numbers(count):
+        "Yield numbers (recording them)"
+        for i in xrange(count):
+            consumed.append(i)
+            yield i
+
+    module.numbers = numbers
+    root.stream = module
+    return RPCTree(root)
+
+
+class StreamWithoutReplyToTest(unittest.TestCase):
+
+    def setUp(self):
+        self.consumed = []
+        self.rpc_tree = make_rpc_tree(self.consumed)
+        self.access_dict = threads.RPCManager.create_access_dict(
+                'mtrpc.test',
+                threads.BindingProps('rpc.friendly.exchange', 'test.#'),
+                dict(consumer_tag='mtrpc.test', delivery_tag=1, redelivered=False,
+                     exchange='rpc.friendly.exchange', routing_key='test.stream.numbers'),
+                None)
+
+    def run_task(self, reply_to, count):
+        result_fifo = _ResultFifo()
+        request_message = encoding.dumps(dict(id='req:1', method='stream.numbers',
+                                              params=[count], kwparams={}))
+        task = threads.Task(1, request_message=request_message,
+                            access_dict=self.access_dict, reply_to=reply_to)
+        thread = threads.RPCTaskThread(task, self.rpc_tree, result_fifo, log,
+                                       stream_chunk_size=2)
+        thread.run()
+        return result_fifo.results
+
+    def test_no_chunks_put(self):
+        results = self.run_task(None, 5)
+        self.assertEqual(results, [threads.NoResult(1)])
+        self.assertEqual(self.consumed, range(5))
+
+    def test_chunks_put_with_reply_to(self):
+        results = self.run_task('mtrpc.reply.test', 5)
+        self.assertEqual([type(result) for result in results],
+                         [threads.PartialResult, threads.PartialResult, threads.Result])
+        self.assertEqual([encoding.loads(result.response_message)['result']
+                          for result in results],
+                         [[0, 1], [2, 3], [4]])
+
+    def test_responder_rejects_no_reply_to(self):
+        responder = threads.RPCResponder({}, {}, Queue.Queue(), threading.Lock(),
+                                         log=log)
+        self.assertRaises(ValueError, responder.reply, None, 'message')
+
+
+if __name__ == '__main__':
+    unittest.main()
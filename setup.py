@@ -8,6 +8,9 @@ setup(
     version=get_git_version(),
     packages=find_packages(exclude=['mtrpc.test']),
     install_requires=['amqplib', 'decorator', 'flask', 'gunicorn', 'jsonschema'],
+    extras_require={
+        'asyncio': ['trollius'],
+    },
     author='MegiTeam',
     author_email='admin@megiteam.pl',
     description='Easy JSONRPC over AMQP',
@@ -16,7 +19,9 @@ setup(
     entry_points={
         'console_scripts': [
             'mtrpc-server = mtrpc.server.__main__:main',
-            'mtrpc-request = mtrpc.mtrpc_request:main'
+            'mtrpc-request = mtrpc.mtrpc_request:main',
+            'mtrpc-bench = mtrpc.mtrpc_bench:main',
+            'mtrpc-replay = mtrpc.mtrpc_replay:main',
         ],
     }
 )